@@ -1,12 +1,28 @@
 import json
 import os
+import threading
+import time
 from datetime import date
 
+import numpy as np
 import pandas as pd
 import psycopg2
 import streamlit as st
 from dotenv import load_dotenv
 
+import historico
+from filtros import FilterIndex
+from ingest import descricao_columns
+from memoria import (
+    COMPACT_SELECT,
+    SNAPSHOT_PATH,
+    TEXT_SELECT,
+    bytes_per_row,
+    compact_frame,
+    read_snapshot,
+    with_text,
+)
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -34,18 +50,42 @@ FIELDS_NUMERIC = {
     "Desconto": "Desconto_num",  # mantemos parsing (útil na tabela), mas sem filtro
 }
 
+# "sql": filtros viram WHERE no Postgres e só a página visível é carregada;
+# "memoria": current_imoveis inteiro num DataFrame (filtros em pandas)
+VIEWER_MODE = os.getenv("VIEWER_MODE", "sql")
+PAGE_SIZE = 200
+
+# Colunas extraídas da Descrição pelo ingest.py -> nome exibido
+DESCRICAO_LABELS = {
+    "tipo": "Tipo",
+    "area_total": "Área total",
+    "area_privativa": "Área privativa",
+    "area_terreno": "Área do terreno",
+    "quartos": "Quartos",
+    "vagas": "Vagas",
+}
+
 
 # =============================
 # HELPERS
 # =============================
 def to_number_ptbr(series: pd.Series) -> pd.Series:
     s = series.fillna("").astype(str)
-    s = s.str.replace(".", "", regex=False)
+    # só '1.234,56' tem ponto de milhar; o Desconto vem como '45.32'
+    ptbr = s.str.contains(",", regex=False)
+    s = s.mask(ptbr, s.str.replace(".", "", regex=False))
     s = s.str.replace(",", ".", regex=False)
     s = s.str.replace(r"[^\d\.\-]", "", regex=True)
     return pd.to_numeric(s, errors="coerce")
 
 
+def descricao_display_cols(series: pd.Series) -> pd.DataFrame:
+    out = descricao_columns(series).rename(columns=DESCRICAO_LABELS)
+    for col in list(DESCRICAO_LABELS.values())[1:]:
+        out[col] = pd.to_numeric(out[col])
+    return out
+
+
 def safe_json_load(x):
     if x is None:
         return {}
@@ -83,9 +123,17 @@ def apply_filters(
     bairro_sel: list[str],
     preco_min,
     preco_max,
+    tipo_sel: list[str],
+    quartos_min: int,
 ) -> pd.DataFrame:
     f = df_in.copy()
 
+    if tipo_sel and "Tipo" in f.columns:
+        f = f[f["Tipo"].isin(tipo_sel)]
+
+    if quartos_min and "Quartos" in f.columns:
+        f = f[f["Quartos"] >= quartos_min]
+
     if mod_sel and "Modalidade de venda" in f.columns:
         f = f[f["Modalidade de venda"].isin(mod_sel)]
 
@@ -107,55 +155,305 @@ def apply_filters(
 # =============================
 # LOAD FROM POSTGRES
 # =============================
-@st.cache_data(show_spinner=False)
+# Colunas tipadas (preco, cidade, ...) materializadas pelo ingest.py; do
+# payload só saem os campos de exibição, extraídos no próprio Postgres
+CURRENT_SELECT = """
+    uf AS "UF",
+    numero_imovel AS "Nº do imóvel",
+    cidade AS "Cidade",
+    bairro AS "Bairro",
+    payload_json->>'Endereço' AS "Endereço",
+    payload_json->>'Preço' AS "Preço",
+    payload_json->>'Valor de avaliação' AS "Valor de avaliação",
+    payload_json->>'Desconto' AS "Desconto",
+    payload_json->>'Descrição' AS "Descrição",
+    modalidade AS "Modalidade de venda",
+    payload_json->>'Link de acesso' AS "Link de acesso",
+    preco::float8 AS "Preço_num",
+    valor_avaliacao::float8 AS "Avaliação_num",
+    desconto::float8 AS "Desconto_num",
+    tipo AS "Tipo",
+    area_total::float8 AS "Área total",
+    area_privativa::float8 AS "Área privativa",
+    area_terreno::float8 AS "Área do terreno",
+    quartos AS "Quartos",
+    vagas AS "Vagas",
+    fp,
+    last_seen,
+    source_file
+"""
+
+
+@st.cache_data(show_spinner=False, ttl=10)
+def load_ingest_version() -> int | None:
+    # Publicada pelo ingest_day no commit; None em bancos sem ingest_versions
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('ingest_versions') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT max(version) FROM ingest_versions")
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
 def load_current_from_postgres() -> pd.DataFrame:
+    # Modo memória: só colunas compactas (ver memoria.py)
+    conn = get_db_connection()
+    try:
+        query = f"SELECT {COMPACT_SELECT} FROM current_imoveis"
+        return compact_frame(pd.read_sql(query, conn))
+    finally:
+        conn.close()
+
+
+def load_current_since(version: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Linhas gravadas e chaves removidas por ingests posteriores a `version`."""
+    conn = get_db_connection()
+    try:
+        rows = pd.read_sql(
+            f"SELECT {COMPACT_SELECT} FROM current_imoveis WHERE ingest_version > %s",
+            conn,
+            params=(version,),
+        )
+        removed = pd.read_sql(
+            """
+            SELECT uf AS "UF", numero_imovel AS "Nº do imóvel"
+            FROM current_removed
+            WHERE version > %s
+        """,
+            conn,
+            params=(version,),
+        )
+    finally:
+        conn.close()
+    return rows, removed
+
+
+def merge_current(
+    df: pd.DataFrame, rows: pd.DataFrame, removed: pd.DataFrame
+) -> pd.DataFrame:
+    # Tira as chaves regravadas/removidas e anexa o estado novo delas
+    keys = ["UF", "Nº do imóvel"]
+    stale = pd.MultiIndex.from_frame(pd.concat([rows[keys], removed[keys]]))
+    keep = ~pd.MultiIndex.from_frame(df[keys]).isin(stale)
+    if keep.all() and rows.empty:
+        return df
+    return compact_frame(pd.concat([df[keep], rows], ignore_index=True))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def load_current_text(keys: tuple, version: int | None) -> pd.DataFrame:
+    # Textos de exibição só das linhas da página (keys: pares (uf, número))
+    conn = get_db_connection()
+    try:
+        query = f"""
+            SELECT {TEXT_SELECT}
+            FROM current_imoveis
+            JOIN unnest(%s::text[], %s::text[]) AS k(uf, numero_imovel)
+            USING (uf, numero_imovel)
+        """
+        return pd.read_sql(
+            query, conn, params=([k[0] for k in keys], [k[1] for k in keys])
+        )
+    finally:
+        conn.close()
+
+
+@st.cache_resource(show_spinner=False)
+def current_store() -> dict:
+    # current_imoveis em memória (+ índice dos filtros), compartilhado pelas
+    # sessões do processo; "startup" = origem e tempo da primeira carga
+    return {
+        "version": None,
+        "df": None,
+        "index": None,
+        "startup": None,
+        "lock": threading.Lock(),
+    }
+
+
+def load_current_base(version: int | None) -> tuple[pd.DataFrame, int | None, str]:
+    # Snapshot Arrow do ingest (memory map), se não for de uma versão à frente
+    # do banco (banco recriado); o que veio depois dele entra pelo merge.
+    # Sem ele (ou sem versão para comparar), a tabela inteira do Postgres.
+    if SNAPSHOT_PATH and version is not None:
+        try:
+            snap = read_snapshot(SNAPSHOT_PATH)
+        except Exception:
+            snap = None  # arquivo truncado/corrompido
+        if snap is not None and snap[1] is not None and snap[1] <= version:
+            return snap[0], snap[1], "arquivo Arrow"
+    return load_current_from_postgres(), version, "PostgreSQL"
+
+
+def load_current(version: int | None) -> tuple[pd.DataFrame, FilterIndex]:
+    """current_imoveis na versão `version` e seu FilterIndex (modo memória).
+
+    A primeira carga abre o snapshot Arrow gravado pelo ingest (ou lê a tabela
+    inteira, sem ele); depois, a cada versão nova, só as linhas que o ingest
+    gravou/removeu desde a versão em cache. O índice é refeito só quando o
+    DataFrame muda.
+    """
+    store = current_store()
+    with store["lock"]:
+        t0 = time.perf_counter()
+        source = None
+        if store["df"] is None or (
+            version is not None
+            and (store["version"] is None or version < store["version"])
+        ):
+            store["df"], store["version"], source = load_current_base(version)
+            store["index"] = None
+        if version is not None and version > store["version"]:
+            rows, removed = load_current_since(store["version"])
+            store["df"] = merge_current(store["df"], rows, removed)
+            store["index"] = None
+        if store["index"] is None:
+            store["index"] = FilterIndex(store["df"])
+        store["version"] = version
+        if store["startup"] is None:
+            # cold start do processo: carga + merge + índice
+            store["startup"] = (source, time.perf_counter() - t0)
+        return store["df"], store["index"]
+
+
+def current_where(
+    mod_sel: list[str],
+    uf_sel: list[str],
+    cidade_sel: list[str],
+    bairro_sel: list[str],
+    preco_min,
+    preco_max,
+    tipo_sel: list[str],
+    quartos_min: int,
+) -> tuple[str, tuple]:
+    """Mesmos filtros de apply_filters, como WHERE parametrizado."""
+    conds, params = [], []
+    for col, sel in [
+        ("tipo", tipo_sel),
+        ("modalidade", mod_sel),
+        ("uf", uf_sel),
+        ("cidade", cidade_sel),
+        ("bairro", bairro_sel),
+    ]:
+        if sel:
+            conds.append(f"{col} = ANY(%s)")
+            params.append(list(sel))
+    if quartos_min:
+        conds.append("quartos >= %s")
+        params.append(int(quartos_min))
+    if preco_min is not None:
+        # parâmetros como numeric para o índice em preco valer
+        conds.append("preco BETWEEN %s::numeric AND %s::numeric")
+        params += [preco_min, preco_max]
+    return " AND ".join(conds) or "TRUE", tuple(params)
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_current_facets(version: int | None) -> pd.DataFrame:
+    # Uma linha por combinação de UF/cidade/bairro/modalidade/tipo: alimenta as
+    # opções da sidebar sem trazer os imóveis
     conn = get_db_connection()
     try:
         query = """
             SELECT
-                uf,
-                numero_imovel,
-                payload_json,
-                fp,
-                last_seen,
-                source_file
+                uf AS "UF",
+                cidade AS "Cidade",
+                bairro AS "Bairro",
+                modalidade AS "Modalidade de venda",
+                tipo AS "Tipo",
+                count(*) AS n,
+                count(preco) AS n_preco,
+                min(preco)::float8 AS "Preço_min",
+                max(preco)::float8 AS "Preço_max",
+                max(quartos) AS "Quartos"
             FROM current_imoveis
+            GROUP BY 1, 2, 3, 4, 5
         """
-        base = pd.read_sql(query, conn)
+        return pd.read_sql(query, conn)
     finally:
         conn.close()
 
-    if base.empty:
-        return pd.DataFrame()
-
-    payload_dicts = base["payload_json"].apply(safe_json_load).tolist()
-    payload_df = pd.json_normalize(payload_dicts)
 
-    if "UF" not in payload_df.columns:
-        payload_df["UF"] = base["uf"]
+def count_from_facets(
+    facets: pd.DataFrame,
+    mod_sel: list[str],
+    uf_sel: list[str],
+    cidade_sel: list[str],
+    bairro_sel: list[str],
+    preco_min,
+    preco_max,
+    tipo_sel: list[str],
+    quartos_min: int,
+) -> pd.DataFrame | None:
+    # Contagem por UF sem ir ao banco quando os filtros cabem nas facetas:
+    # quartos e faixa de preço parcial só o Postgres responde
+    if quartos_min:
+        return None
+    n = "n"
+    if preco_min is not None:
+        if (
+            preco_min > facets["Preço_min"].min()
+            or preco_max < facets["Preço_max"].max()
+        ):
+            return None
+        n = "n_preco"  # faixa inteira: só exclui imóveis sem preço
+    f = apply_filters(
+        facets, mod_sel, uf_sel, cidade_sel, bairro_sel, None, None, tipo_sel, 0
+    )
+    return f.groupby("UF", as_index=False)[n].sum().rename(columns={n: "n"})
 
-    if "Nº do imóvel" not in payload_df.columns:
-        payload_df["Nº do imóvel"] = base["numero_imovel"]
 
-    payload_df["fp"] = base["fp"]
-    payload_df["last_seen"] = base["last_seen"]
-    payload_df["source_file"] = base["source_file"]
+@st.cache_resource(show_spinner=False, max_entries=4)
+def load_facets_index(version: int | None) -> tuple[pd.DataFrame, FilterIndex]:
+    facets = load_current_facets(version)
+    return facets, FilterIndex(facets, weight_col="n")
 
-    payload_df = normalize_key_cols(payload_df)
 
-    for col, out_col in FIELDS_NUMERIC.items():
-        if col in payload_df.columns:
-            payload_df[out_col] = to_number_ptbr(payload_df[col])
+@st.cache_data(show_spinner=False, max_entries=256)
+def count_current_by_uf(where: str, params: tuple, version: int | None) -> pd.DataFrame:
+    conn = get_db_connection()
+    try:
+        query = f"""
+            SELECT uf AS "UF", count(*) AS n
+            FROM current_imoveis
+            WHERE {where}
+            GROUP BY uf
+            ORDER BY uf
+        """
+        return pd.read_sql(query, conn, params=params)
+    finally:
+        conn.close()
 
-    payload_df = payload_df.drop_duplicates(
-        subset=["UF", "Nº do imóvel"], keep="first"
-    ).copy()
 
-    return payload_df
+@st.cache_data(show_spinner=False, max_entries=256)
+def load_current_page(
+    where: str, params: tuple, after: tuple | None, limit: int, version: int | None
+) -> pd.DataFrame:
+    # Paginação por chave (keyset): a página começa depois da última
+    # (uf, numero_imovel) da anterior e usa a PK, sem OFFSET
+    if after is not None:
+        where = f"{where} AND (uf, numero_imovel) > (%s, %s)"
+        params = params + tuple(after)
+    conn = get_db_connection()
+    try:
+        query = f"""
+            SELECT {CURRENT_SELECT}
+            FROM current_imoveis
+            WHERE {where}
+            ORDER BY uf, numero_imovel
+            LIMIT %s
+        """
+        return pd.read_sql(query, conn, params=params + (limit,))
+    finally:
+        conn.close()
 
 
-@st.cache_data(show_spinner=False)
-def load_changes_by_day(dt: str) -> pd.DataFrame:
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_changes_by_day(dt: str, version: int | None) -> pd.DataFrame:
     conn = get_db_connection()
     try:
         query = """
@@ -200,6 +498,9 @@ def extract_payload_cols(chg_df: pd.DataFrame, which: str) -> pd.DataFrame:
         if col_name in payload_df.columns:
             payload_df[out_col] = to_number_ptbr(payload_df[col_name])
 
+    if "Descrição" in payload_df.columns:
+        payload_df = payload_df.join(descricao_display_cols(payload_df["Descrição"]))
+
     payload_df = payload_df.drop_duplicates(
         subset=["UF", "Nº do imóvel"], keep="first"
     ).copy()
@@ -207,22 +508,101 @@ def extract_payload_cols(chg_df: pd.DataFrame, which: str) -> pd.DataFrame:
     return payload_df
 
 
+# =============================
+# PAGINAÇÃO (modo sql)
+# =============================
+def page_state(filtro) -> dict:
+    # st.session_state["pagina"]: inícios das páginas já visitadas (None =
+    # primeira); volta para a primeira quando os filtros mudam
+    pag = st.session_state.get("pagina")
+    if pag is None or pag["filtro"] != filtro:
+        pag = {"filtro": filtro, "inicios": [None], "proximo": None}
+        st.session_state["pagina"] = pag
+    return pag
+
+
+def current_page(where: str, params: tuple, version: int | None) -> pd.DataFrame:
+    # modo sql: o início de cada página é a última chave (uf, número) da anterior
+    pag = page_state((where, repr(params)))
+    rows = load_current_page(where, params, pag["inicios"][-1], PAGE_SIZE + 1, version)
+    pag["proximo"] = None
+    if len(rows) > PAGE_SIZE:
+        last = rows.iloc[PAGE_SIZE - 1]
+        pag["proximo"] = (last["UF"], last["Nº do imóvel"])
+    return rows.head(PAGE_SIZE)
+
+
+def memory_page(
+    df: pd.DataFrame, rows: np.ndarray | None, filtro, version: int | None
+) -> pd.DataFrame:
+    # modo memória: o início é a posição em `rows` (as linhas filtradas)
+    pag = page_state(repr(filtro))
+    start = pag["inicios"][-1] or 0
+    total = len(df) if rows is None else len(rows)
+    end = min(start + PAGE_SIZE, total)
+    page = df.iloc[start:end] if rows is None else df.take(rows[start:end])
+    pag["proximo"] = end if end < total else None
+
+    keys = tuple(zip(page["UF"].astype(str), page["Nº do imóvel"].astype(str)))
+    return with_text(page, load_current_text(keys, version))
+
+
+def next_page():
+    pag = st.session_state["pagina"]
+    pag["inicios"].append(pag["proximo"])
+
+
+def prev_page():
+    st.session_state["pagina"]["inicios"].pop()
+
+
 # =============================
 # UI: LOAD
 # =============================
+modos = {"sql": "SQL paginado", "memoria": "Tudo em memória"}
+modo_sql = (
+    st.sidebar.radio(
+        "Consulta",
+        list(modos.values()),
+        index=list(modos).index(VIEWER_MODE) if VIEWER_MODE in modos else 0,
+    )
+    == modos["sql"]
+)
+
+# df_opts/idx: de onde saem as opções da sidebar (facetas no modo sql). Os
+# caches são por versão do ingest: um ingest novo aparece sem reiniciar o app
 try:
-    df_current = load_current_from_postgres()
+    ingest_version = load_ingest_version()
+    if modo_sql:
+        df_opts, idx = load_facets_index(ingest_version)
+    else:
+        df_current, idx = load_current(ingest_version)
+        df_opts = df_current
 except Exception as e:
     st.error(f"Erro ao conectar ao PostgreSQL: {e}")
     st.stop()
 
-if df_current.empty:
+if df_opts.empty:
     st.warning(
         "Tabela current_imoveis está vazia no PostgreSQL. Rode o ingest primeiro."
     )
     st.stop()
 
-st.success(f"Carregado do PostgreSQL: {len(df_current):,} imóveis".replace(",", "."))
+if modo_sql:
+    n_current = int(df_opts["n"].sum())
+    st.success(
+        f"Consulta paginada no PostgreSQL: {n_current:,} imóveis".replace(",", ".")
+    )
+else:
+    bpr = bytes_per_row(df_current)
+    source, seconds = current_store()["startup"]
+    st.success(
+        f"Carregado do {source}: {len(df_current):,} imóveis "
+        f"({bpr:,.0f} bytes/imóvel em memória)".replace(",", ".")
+    )
+    st.sidebar.caption(f"Inicialização do modo memória: {seconds:.2f} s")
+if ingest_version is not None:
+    st.sidebar.caption(f"Versão do ingest: {ingest_version}")
 
 hoje_str = date.today().isoformat()
 
@@ -244,15 +624,15 @@ status_sel = st.sidebar.multiselect(
     default=["Todos (current)"],
 )
 
+
+def with_count(counts: dict[str, int]):
+    return lambda x: f"{x} ({counts.get(x, 0):,})".replace(",", ".")
+
+
+# Opções, contagens e limites vêm do FilterIndex (montado uma vez por versão)
 # Modalidade (MULTI)
-if "Modalidade de venda" in df_current.columns:
-    modalidades = sorted(
-        [
-            x
-            for x in df_current["Modalidade de venda"].dropna().unique().tolist()
-            if str(x).strip()
-        ]
-    )
+if "Modalidade de venda" in idx.values:
+    modalidades = idx.options("Modalidade de venda")
     mod_sel = st.sidebar.multiselect(
         "Modalidade de venda", modalidades, default=modalidades
     )
@@ -260,45 +640,54 @@ else:
     mod_sel = []
 
 # UF (MULTI)
-if "UF" in df_current.columns:
-    ufs = sorted(
-        [x for x in df_current["UF"].dropna().unique().tolist() if str(x).strip()]
-    )
+if "UF" in idx.values:
+    ufs = idx.options("UF")
     uf_sel = st.sidebar.multiselect("UF", ufs, default=ufs)
 else:
     uf_sel = []
 
 # Cidade (MULTI) — base para bairro
-if "Cidade" in df_current.columns:
-    cidades_all = sorted(
-        [x for x in df_current["Cidade"].dropna().unique().tolist() if str(x).strip()]
+if "Cidade" in idx.values:
+    cidades_all = idx.options("Cidade")
+    cidade_sel = st.sidebar.multiselect(
+        "Cidade",
+        cidades_all,
+        default=[],
+        format_func=with_count(idx.option_counts("Cidade")),
     )
-    cidade_sel = st.sidebar.multiselect("Cidade", cidades_all, default=[])
 else:
     cidade_sel = []
 
 # Bairro (MULTI) — dependente da(s) cidade(s)
-if "Bairro" in df_current.columns:
-    if cidade_sel:
-        bairros_pool = df_current[df_current["Cidade"].isin(cidade_sel)]["Bairro"]
-    else:
-        bairros_pool = df_current["Bairro"]
-    bairros_all = sorted(
-        [x for x in bairros_pool.dropna().unique().tolist() if str(x).strip()]
+if "Bairro" in idx.values:
+    bairros_count = idx.bairros(cidade_sel)
+    bairro_sel = st.sidebar.multiselect(
+        "Bairro",
+        sorted(bairros_count),
+        default=[],
+        format_func=with_count(bairros_count),
     )
-    bairro_sel = st.sidebar.multiselect("Bairro", bairros_all, default=[])
 else:
     bairro_sel = []
 
 # Preço (slider)
 preco_min = preco_max = None
-if "Preço_num" in df_current.columns and df_current["Preço_num"].notna().any():
-    pmin, pmax = (
-        float(df_current["Preço_num"].min()),
-        float(df_current["Preço_num"].max()),
-    )
+if idx.price_bounds is not None:
+    pmin, pmax = idx.price_bounds
     preco_min, preco_max = st.sidebar.slider("Preço (R$)", 0.0, pmax, (pmin, pmax))
 
+# Tipo (MULTI) e quartos mínimos — extraídos da Descrição no ingest
+if "Tipo" in idx.values:
+    tipo_sel = st.sidebar.multiselect("Tipo", idx.options("Tipo"), default=[])
+else:
+    tipo_sel = []
+
+quartos_min = 0
+if idx.quartos_max is not None:
+    quartos_min = st.sidebar.number_input(
+        "Quartos (mínimo)", min_value=0, max_value=idx.quartos_max
+    )
+
 # =============================
 # DATASETS POR STATUS (E APLICA FILTROS)
 # =============================
@@ -313,27 +702,62 @@ cols_base = [
     "Valor de avaliação",
     "Desconto",
     "Modalidade de venda",
+    "Tipo",
+    "Área privativa",
+    "Área do terreno",
+    "Quartos",
+    "Vagas",
     "Link de acesso",
 ]
 cols_current_extra = ["last_seen", "source_file"]
 cols_changes_extra = ["dt", "tipo_evento", "changed_fields"]
 
-column_config = {}
-if "Link de acesso" in df_current.columns:
-    column_config["Link de acesso"] = st.column_config.LinkColumn("Link")
+# current_imoveis só regrava a linha quando o conteúdo muda: last_seen é o dia
+# da última alteração (não o último dia em que o imóvel apareceu na lista) e
+# source_file, o arquivo dessa alteração
+column_config = {
+    "Link de acesso": st.column_config.LinkColumn("Link"),
+    "last_seen": st.column_config.Column(
+        "Alterado em", help="Dia em que o conteúdo atual do imóvel foi gravado"
+    ),
+    "source_file": st.column_config.Column(
+        "Arquivo da alteração", help="Lista da Caixa de onde veio o conteúdo atual"
+    ),
+}
 
-views = []  # lista de (titulo, df)
+views = []  # lista de (titulo, df, tipo, total de linhas)
 
 # Se o usuário não selecionar nada, cai num default seguro
 if not status_sel:
     status_sel = ["Todos (current)"]
 
 # 1) TODOS (current)
+filtros = (
+    mod_sel,
+    uf_sel,
+    cidade_sel,
+    bairro_sel,
+    preco_min,
+    preco_max,
+    tipo_sel,
+    quartos_min,
+)
 if "Todos (current)" in status_sel:
-    cur_f = apply_filters(
-        df_current, mod_sel, uf_sel, cidade_sel, bairro_sel, preco_min, preco_max
-    )
-    views.append(("📋 Todos (current_imoveis) — filtros aplicados", cur_f, "current"))
+    title = "📋 Todos (current_imoveis) — filtros aplicados"
+    if modo_sql:
+        where, params = current_where(*filtros)
+        cur_counts = count_from_facets(df_opts, *filtros)
+        if cur_counts is None:
+            cur_counts = count_current_by_uf(where, params, ingest_version)
+        cur_f = current_page(where, params, ingest_version)
+        views.append((title, cur_f, "current", int(cur_counts["n"].sum())))
+    else:
+        rows = idx.rows(*filtros)
+        cur_counts = (
+            idx.value_counts("UF", rows).rename_axis("UF").reset_index(name="n")
+        )
+        cur_f = memory_page(df_current, rows, filtros, ingest_version)
+        views.append((title, cur_f, "current", int(cur_counts["n"].sum())))
 
 # Para os outros status, precisa carregar changes
 need_changes = any(
@@ -346,7 +770,7 @@ need_changes = any(
 )
 chg = pd.DataFrame()
 if need_changes:
-    chg = load_changes_by_day(hoje_str)
+    chg = load_changes_by_day(hoje_str, ingest_version)
 
 # 2) ENTER
 if "Adicionados hoje (ENTER)" in status_sel:
@@ -359,14 +783,15 @@ if "Adicionados hoje (ENTER)" in status_sel:
             if not ent.empty
             else pd.DataFrame()
         )
-        ent_f = (
-            apply_filters(
-                ent_df, mod_sel, uf_sel, cidade_sel, bairro_sel, preco_min, preco_max
-            )
-            if not ent_df.empty
-            else pd.DataFrame()
+        ent_f = apply_filters(ent_df, *filtros) if not ent_df.empty else pd.DataFrame()
+    views.append(
+        (
+            "🟢 Adicionados hoje (ENTER) — filtros aplicados",
+            ent_f,
+            "changes",
+            len(ent_f),
         )
-    views.append(("🟢 Adicionados hoje (ENTER) — filtros aplicados", ent_f, "changes"))
+    )
 
 # 3) EXIT
 if "Removidos hoje (EXIT)" in status_sel:
@@ -377,14 +802,10 @@ if "Removidos hoje (EXIT)" in status_sel:
         ex_df = (
             extract_payload_cols(ex, which="before") if not ex.empty else pd.DataFrame()
         )
-        ex_f = (
-            apply_filters(
-                ex_df, mod_sel, uf_sel, cidade_sel, bairro_sel, preco_min, preco_max
-            )
-            if not ex_df.empty
-            else pd.DataFrame()
-        )
-    views.append(("🔴 Removidos hoje (EXIT) — filtros aplicados", ex_f, "changes"))
+        ex_f = apply_filters(ex_df, *filtros) if not ex_df.empty else pd.DataFrame()
+    views.append(
+        ("🔴 Removidos hoje (EXIT) — filtros aplicados", ex_f, "changes", len(ex_f))
+    )
 
 # 4) UPDATE
 if "Alterados hoje (UPDATE)" in status_sel:
@@ -395,23 +816,19 @@ if "Alterados hoje (UPDATE)" in status_sel:
         up_df = (
             extract_payload_cols(up, which="after") if not up.empty else pd.DataFrame()
         )
-        up_f = (
-            apply_filters(
-                up_df, mod_sel, uf_sel, cidade_sel, bairro_sel, preco_min, preco_max
-            )
-            if not up_df.empty
-            else pd.DataFrame()
-        )
-    views.append(("🛠️ Alterados hoje (UPDATE) — filtros aplicados", up_f, "changes"))
+        up_f = apply_filters(up_df, *filtros) if not up_df.empty else pd.DataFrame()
+    views.append(
+        ("🛠️ Alterados hoje (UPDATE) — filtros aplicados", up_f, "changes", len(up_f))
+    )
 
 # =============================
 # RENDER
 # =============================
 # Contador geral (somatório do que está sendo mostrado)
-total_rows = int(sum(len(v[1]) for v in views if v[1] is not None))
+total_rows = int(sum(v[3] for v in views))
 st.metric("Imóveis na lista", f"{total_rows:,}".replace(",", "."))
 
-for title, dfx, kind in views:
+for title, dfx, kind, n_rows in views:
     st.subheader(title)
 
     if dfx is None or dfx.empty:
@@ -428,3 +845,70 @@ for title, dfx, kind in views:
         width="stretch",
         column_config=column_config,
     )
+
+    if kind == "current":
+        pag = st.session_state["pagina"]
+        first = (len(pag["inicios"]) - 1) * PAGE_SIZE
+        c_prev, c_info, c_next = st.columns([1, 4, 1])
+        c_prev.button(
+            "◀ Anterior", on_click=prev_page, disabled=len(pag["inicios"]) == 1
+        )
+        c_info.caption(
+            f"{first + 1:,}–{first + len(dfx):,} de {n_rows:,}".replace(",", ".")
+        )
+        c_next.button("Próxima ▶", on_click=next_page, disabled=pag["proximo"] is None)
+        with st.expander("Imóveis por UF (filtros aplicados)"):
+            st.bar_chart(cur_counts.set_index("UF")["n"])
+
+
+# =============================
+# HISTÓRICO (DuckDB sobre o lake Parquet)
+# =============================
+def historico_stamp() -> float | None:
+    # muda quando o refresh grava o arquivo: invalida o cache das consultas
+    path = historico.HISTORICO_DB
+    return path.stat().st_mtime if path.exists() else None
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def load_historico(query: str, stamp: float | None, *args):
+    # Conexão só de leitura aberta e fechada por consulta: o DuckDB trava o
+    # arquivo, e um handle guardado no processo impediria o refresh
+    # (`python historico.py`) e as outras réplicas do app de abrirem o banco
+    con = historico.connect_readonly()
+    try:
+        return getattr(historico, query)(con, *args)
+    finally:
+        con.close()
+
+
+with st.expander("📈 Histórico (lake Parquet / DuckDB)"):
+    stamp = historico_stamp()
+    try:
+        load_historico("available_dates", stamp)
+    except Exception as e:
+        st.info(f"Histórico indisponível: {e}")
+    else:
+        uf_hist = st.selectbox("UF (histórico)", ["Todas"] + sorted(uf_sel))
+        uf_hist = None if uf_hist == "Todas" else uf_hist
+
+        serie = load_historico("listings_by_day", stamp, uf_hist)
+        quedas = load_historico("price_drops_by_day", stamp, uf_hist)
+        if not serie.empty:
+            st.caption("Imóveis listados por dia")
+            st.line_chart(serie.groupby("dt")[["imoveis", "novos"]].sum())
+            st.caption("Imóveis com queda / alta de preço por dia")
+            st.line_chart(quedas.groupby("dt")[["quedas", "altas"]].sum())
+
+        st.caption("Tempo no mercado (imóveis ainda listados)")
+        st.dataframe(
+            load_historico("time_on_market", stamp, uf_hist).head(500), width="stretch"
+        )
+
+        numero = st.text_input("Nº do imóvel (histórico de preço)").strip()
+        if numero and uf_hist:
+            st.dataframe(
+                load_historico("price_history", stamp, uf_hist, numero), width="stretch"
+            )
+        elif numero:
+            st.info("Escolha uma UF para ver o histórico de um imóvel.")
@@ -64,15 +64,34 @@ async function setup() {
 
     console.log("⏳ Criando tabelas...");
 
+    // Histórico particionado por dt: o ingest.py cria as partições de cada dia
+    // (bancos antigos, com tabelas comuns: `python ingest.py --partitions`)
     await client.query(`
             CREATE TABLE IF NOT EXISTS snapshot_imoveis (
-                id SERIAL PRIMARY KEY,
-                dt DATE,
+                dt DATE NOT NULL,
                 uf VARCHAR(10),
                 numero_imovel VARCHAR(50),
                 payload_json JSONB,
                 fp VARCHAR(100),
                 source_file TEXT
+            ) PARTITION BY RANGE (dt);
+        `);
+
+    // SNAPSHOT_MODE=delta do ingest.py: checkpoints em snapshot_imoveis + deltas
+    await client.query(`
+            CREATE TABLE IF NOT EXISTS snapshot_deltas (
+                dt DATE NOT NULL,
+                uf VARCHAR(10),
+                numero_imovel VARCHAR(50),
+                payload_json JSONB,
+                fp VARCHAR(100),
+                source_file TEXT
+            ) PARTITION BY RANGE (dt);
+        `);
+    await client.query(`
+            CREATE TABLE IF NOT EXISTS snapshot_days (
+                dt DATE PRIMARY KEY,
+                checkpoint BOOLEAN NOT NULL
             );
         `);
 
@@ -84,20 +103,78 @@ async function setup() {
                 fp VARCHAR(100),
                 last_seen DATE,
                 source_file TEXT,
+                preco NUMERIC,
+                valor_avaliacao NUMERIC,
+                desconto NUMERIC,
+                cidade TEXT,
+                bairro TEXT,
+                modalidade TEXT,
+                tipo TEXT,
+                area_total NUMERIC,
+                area_privativa NUMERIC,
+                area_terreno NUMERIC,
+                quartos SMALLINT,
+                vagas SMALLINT,
+                ingest_version BIGINT,
                 PRIMARY KEY (uf, numero_imovel)
             );
         `);
 
+    // Bancos criados antes das colunas tipadas (o ingest.py preenche as linhas)
+    await client.query(`
+            ALTER TABLE current_imoveis
+                ADD COLUMN IF NOT EXISTS preco NUMERIC,
+                ADD COLUMN IF NOT EXISTS valor_avaliacao NUMERIC,
+                ADD COLUMN IF NOT EXISTS desconto NUMERIC,
+                ADD COLUMN IF NOT EXISTS cidade TEXT,
+                ADD COLUMN IF NOT EXISTS bairro TEXT,
+                ADD COLUMN IF NOT EXISTS modalidade TEXT,
+                ADD COLUMN IF NOT EXISTS tipo TEXT,
+                ADD COLUMN IF NOT EXISTS area_total NUMERIC,
+                ADD COLUMN IF NOT EXISTS area_privativa NUMERIC,
+                ADD COLUMN IF NOT EXISTS area_terreno NUMERIC,
+                ADD COLUMN IF NOT EXISTS quartos SMALLINT,
+                ADD COLUMN IF NOT EXISTS vagas SMALLINT,
+                ADD COLUMN IF NOT EXISTS ingest_version BIGINT;
+        `);
+
     await client.query(`
             CREATE TABLE IF NOT EXISTS changes (
-                id SERIAL PRIMARY KEY,
-                dt DATE,
+                dt DATE NOT NULL,
                 uf VARCHAR(10),
                 tipo_evento VARCHAR(50),
                 numero_imovel VARCHAR(50),
                 changed_fields TEXT,
                 before_json JSONB,
                 after_json JSONB
+            ) PARTITION BY RANGE (dt);
+        `);
+
+    await client.query(`
+            CREATE TABLE IF NOT EXISTS ingest_state (
+                dt DATE,
+                uf VARCHAR(10),
+                source_sha256 VARCHAR(64),
+                fp_mode VARCHAR(10),
+                source_file TEXT,
+                ingested_at TIMESTAMP DEFAULT now(),
+                PRIMARY KEY (dt, uf)
+            );
+        `);
+
+    // Versões do ingest e imóveis removidos do current (refresh incremental do app)
+    await client.query(`
+            CREATE TABLE IF NOT EXISTS ingest_versions (
+                version BIGSERIAL PRIMARY KEY,
+                dt DATE,
+                ingested_at TIMESTAMP DEFAULT now()
+            );
+        `);
+    await client.query(`
+            CREATE TABLE IF NOT EXISTS current_removed (
+                version BIGINT,
+                uf VARCHAR(10),
+                numero_imovel VARCHAR(50)
             );
         `);
 
@@ -107,9 +184,39 @@ async function setup() {
     await client.query(
       "CREATE INDEX IF NOT EXISTS idx_changes_dt ON changes(dt);",
     );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_snapshot_deltas_dt ON snapshot_deltas(dt);",
+    );
     await client.query(
       "CREATE INDEX IF NOT EXISTS idx_snapshot_uf_num ON snapshot_imoveis(uf, numero_imovel);",
     );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_uf_cidade_bairro ON current_imoveis(uf, cidade, bairro);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_cidade_bairro ON current_imoveis(cidade, bairro);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_modalidade ON current_imoveis(modalidade);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_preco ON current_imoveis(preco);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_uf_preco ON current_imoveis(uf, preco);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_tipo_quartos ON current_imoveis(tipo, quartos);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_area_privativa ON current_imoveis(area_privativa);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_ingest_version ON current_imoveis(ingest_version);",
+    );
+    await client.query(
+      "CREATE INDEX IF NOT EXISTS idx_current_removed_version ON current_removed(version);",
+    );
 
     console.log("✅ Tabelas e índices criados com sucesso.");
   } catch (err) {
@@ -157,7 +157,7 @@ app.get("/api/filters", async (req, res) => {
     const ufParams: any[] = [];
     let ufIdx = 1;
     if (modalidade) {
-      ufWhere += ` AND payload_json->>'Modalidade de venda' = $${ufIdx++}`;
+      ufWhere += ` AND modalidade = $${ufIdx++}`;
       ufParams.push(modalidade);
     }
     const ufQuery = `SELECT uf as value, count(*) as count FROM current_imoveis ${ufWhere} GROUP BY 1 ORDER BY 1`;
@@ -169,10 +169,10 @@ app.get("/api/filters", async (req, res) => {
       const cityParams = [uf];
       let cityIdx = 2;
       if (modalidade) {
-        cityWhere += ` AND payload_json->>'Modalidade de venda' = $${cityIdx++}`;
+        cityWhere += ` AND modalidade = $${cityIdx++}`;
         cityParams.push(String(modalidade));
       }
-      const cityQuery = `SELECT payload_json->>'Cidade' as value, count(*) as count FROM current_imoveis ${cityWhere} GROUP BY 1 ORDER BY 1`;
+      const cityQuery = `SELECT cidade as value, count(*) as count FROM current_imoveis ${cityWhere} GROUP BY 1 ORDER BY 1`;
       const cityRes = await pool.query(cityQuery, cityParams);
       cities = cityRes.rows.map((r) => ({
         label: r.value,
@@ -188,14 +188,14 @@ app.get("/api/filters", async (req, res) => {
       const bParams = [uf];
       let bIdx = 2;
       const citiesArr = String(city).split(",");
-      bWhere += ` AND payload_json->>'Cidade' IN (${citiesArr.map(() => `$${bIdx++}`).join(",")})`;
+      bWhere += ` AND cidade IN (${citiesArr.map(() => `$${bIdx++}`).join(",")})`;
       bParams.push(...citiesArr);
 
       if (modalidade) {
-        bWhere += ` AND payload_json->>'Modalidade de venda' = $${bIdx++}`;
+        bWhere += ` AND modalidade = $${bIdx++}`;
         bParams.push(String(modalidade));
       }
-      const bQuery = `SELECT payload_json->>'Bairro' as value, count(*) as count FROM current_imoveis ${bWhere} GROUP BY 1 ORDER BY 1`;
+      const bQuery = `SELECT bairro as value, count(*) as count FROM current_imoveis ${bWhere} GROUP BY 1 ORDER BY 1`;
       const bRes = await pool.query(bQuery, bParams);
       neighborhoods = bRes.rows.map((r) => ({
         label: r.value,
@@ -214,15 +214,15 @@ app.get("/api/filters", async (req, res) => {
     }
     if (city) {
       const citiesArr = String(city).split(",");
-      modWhere += ` AND payload_json->>'Cidade' IN (${citiesArr.map(() => `$${modIdx++}`).join(",")})`;
+      modWhere += ` AND cidade IN (${citiesArr.map(() => `$${modIdx++}`).join(",")})`;
       modParams.push(...citiesArr);
     }
     if (neighborhood) {
       const bArr = String(neighborhood).split(",");
-      modWhere += ` AND payload_json->>'Bairro' IN (${bArr.map(() => `$${modIdx++}`).join(",")})`;
+      modWhere += ` AND bairro IN (${bArr.map(() => `$${modIdx++}`).join(",")})`;
       modParams.push(...bArr);
     }
-    const modQuery = `SELECT payload_json->>'Modalidade de venda' as value, count(*) as count FROM current_imoveis ${modWhere} GROUP BY 1 ORDER BY 1`;
+    const modQuery = `SELECT modalidade as value, count(*) as count FROM current_imoveis ${modWhere} GROUP BY 1 ORDER BY 1`;
 
     const [uRes, mRes] = await Promise.all([
       pool.query(ufQuery, ufParams),
@@ -254,8 +254,8 @@ app.get("/api/stats/filtered", async (req, res) => {
   try {
     let q = `
       SELECT 
-        AVG(CAST(replace(replace(payload_json->>'Valor de avaliação', '.', ''), ',', '.') AS NUMERIC)) as average,
-        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY CAST(replace(replace(payload_json->>'Valor de avaliação', '.', ''), ',', '.') AS NUMERIC)) as median
+        AVG(valor_avaliacao) as average,
+        PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY valor_avaliacao) as median
       FROM current_imoveis 
       WHERE 1=1`;
     const p: any[] = [];
@@ -268,30 +268,30 @@ app.get("/api/stats/filtered", async (req, res) => {
     if (city) {
       const cities = String(city).split(",");
       if (cities.length > 1) {
-        q += ` AND payload_json->>'Cidade' IN (${cities.map(() => `$${paramIndex++}`).join(",")})`;
+        q += ` AND cidade IN (${cities.map(() => `$${paramIndex++}`).join(",")})`;
         p.push(...cities);
       } else {
-        q += ` AND payload_json->>'Cidade' = $${paramIndex++}`;
+        q += ` AND cidade = $${paramIndex++}`;
         p.push(city);
       }
     }
     if (neighborhood) {
       const neighborhoods = String(neighborhood).split(",");
       if (neighborhoods.length > 1) {
-        q += ` AND payload_json->>'Bairro' IN (${neighborhoods.map(() => `$${paramIndex++}`).join(",")})`;
+        q += ` AND bairro IN (${neighborhoods.map(() => `$${paramIndex++}`).join(",")})`;
         p.push(...neighborhoods);
       } else {
-        q += ` AND payload_json->>'Bairro' = $${paramIndex++}`;
+        q += ` AND bairro = $${paramIndex++}`;
         p.push(neighborhood);
       }
     }
     if (modalidade) {
       const modalidades = String(modalidade).split(",");
       if (modalidades.length > 1) {
-        q += ` AND payload_json->>'Modalidade de venda' IN (${modalidades.map(() => `$${paramIndex++}`).join(",")})`;
+        q += ` AND modalidade IN (${modalidades.map(() => `$${paramIndex++}`).join(",")})`;
         p.push(...modalidades);
       } else {
-        q += ` AND payload_json->>'Modalidade de venda' = $${paramIndex++}`;
+        q += ` AND modalidade = $${paramIndex++}`;
         p.push(modalidade);
       }
     }
@@ -325,40 +325,38 @@ app.get("/api/properties", async (req, res) => {
     if (city) {
       const cities = String(city).split(",");
       if (cities.length > 1) {
-        q += ` AND payload_json->>'Cidade' IN (${cities.map(() => `$${paramIndex++}`).join(",")})`;
+        q += ` AND cidade IN (${cities.map(() => `$${paramIndex++}`).join(",")})`;
         p.push(...cities);
       } else {
-        q += ` AND payload_json->>'Cidade' = $${paramIndex++}`;
+        q += ` AND cidade = $${paramIndex++}`;
         p.push(city);
       }
     }
     if (neighborhood) {
       const neighborhoods = String(neighborhood).split(",");
       if (neighborhoods.length > 1) {
-        q += ` AND payload_json->>'Bairro' IN (${neighborhoods.map(() => `$${paramIndex++}`).join(",")})`;
+        q += ` AND bairro IN (${neighborhoods.map(() => `$${paramIndex++}`).join(",")})`;
         p.push(...neighborhoods);
       } else {
-        q += ` AND payload_json->>'Bairro' = $${paramIndex++}`;
+        q += ` AND bairro = $${paramIndex++}`;
         p.push(neighborhood);
       }
     }
     if (modalidade) {
       const modalidades = String(modalidade).split(",");
       if (modalidades.length > 1) {
-        q += ` AND payload_json->>'Modalidade de venda' IN (${modalidades.map(() => `$${paramIndex++}`).join(",")})`;
+        q += ` AND modalidade IN (${modalidades.map(() => `$${paramIndex++}`).join(",")})`;
         p.push(...modalidades);
       } else {
-        q += ` AND payload_json->>'Modalidade de venda' = $${paramIndex++}`;
+        q += ` AND modalidade = $${paramIndex++}`;
         p.push(modalidade);
       }
     }
 
     if (sort === "price_asc") {
-      q +=
-        " ORDER BY CAST(replace(replace(payload_json->>'Preço', '.', ''), ',', '.') AS NUMERIC) ASC";
+      q += " ORDER BY preco ASC";
     } else if (sort === "price_desc") {
-      q +=
-        " ORDER BY CAST(replace(replace(payload_json->>'Preço', '.', ''), ',', '.') AS NUMERIC) DESC";
+      q += " ORDER BY preco DESC";
     }
 
     q += ` LIMIT $${paramIndex++}`;
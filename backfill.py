@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+import compacta
+import etapas
+import ingest
+from ingest import BASE_DIR, LAKE_DIR, LAKE_MANIFEST_NAME
+
+# Reconstrói o histórico de várias partições dt=* numa passada:
+#   - cada dia é lido e montado (parse + fingerprint + payload) em processos
+#     separados, alguns dias à frente do que está sendo gravado;
+#   - o diff é encadeado em memória, sempre contra o dia anterior disponível
+#     (não dt-1: um buraco no arquivo não vira "todos entraram");
+#   - tudo é gravado por COPY numa única conexão, um commit (e uma
+#     ingest_version) por dia, como o ingest diário faria.
+
+
+def discover_dts(from_lake: bool = False) -> list[str]:
+    if not from_lake:
+        return compacta.discover_dts()
+    manifests = LAKE_DIR.glob(f"dt=*/{LAKE_MANIFEST_NAME}")
+    return sorted(p.parent.name.removeprefix("dt=") for p in manifests)
+
+
+def prepare_day(job: tuple[str, bool]) -> tuple[dict, dict, pd.DataFrame]:
+    # Roda num processo do pool: (hashes, paths, today_payload) de dt
+    dt, from_lake = job
+    hashes, paths = ingest.day_sources(dt, from_lake)
+    if from_lake:
+        today = ingest.read_lake_day(dt, list(paths))
+    else:
+        today = ingest.parse_day_csvs([Path(p) for p in paths.values()], workers=1)
+    return hashes, paths, ingest.build_today_payload(today, dt)
+
+
+def prepared_days(dts: list[str], from_lake: bool, workers: int):
+    """(dt, (hashes, paths, today_payload)) na ordem de dts.
+
+    No máximo 2 × workers dias ficam prontos na fila, esperando a gravação.
+    """
+    jobs = [(dt, from_lake) for dt in dts]
+    if workers <= 1:
+        for dt, job in zip(dts, jobs):
+            yield dt, prepare_day(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for dt, job in zip(dts, jobs):
+            pending.append((dt, pool.submit(prepare_day, job)))
+            if len(pending) > 2 * workers:
+                day, fut = pending.popleft()
+                yield day, fut.result()
+        while pending:
+            day, fut = pending.popleft()
+            yield day, fut.result()
+
+
+def backfill(
+    dts: list[str],
+    workers: int | None = None,
+    from_lake: bool = False,
+    on_day=None,
+) -> dict:
+    """Ingere `dts` (em ordem) encadeando os diffs em memória.
+
+    O primeiro dia é comparado com o último dia já ingerido antes dele; dias
+    ingeridos depois de um dia regravado (e fora de `dts`) viram checkpoint,
+    como no reingest do ingest_day. Se já houver dia mais novo que algum de
+    `dts` no banco, current_imoveis não é mexido a partir dele: no fim é
+    acertado uma vez com o snapshot do dia mais novo (ingest.rebuild_current).
+    `on_day(summary)` é chamado a cada dia gravado.
+    """
+    dts = sorted(set(dts))
+    if not dts:
+        raise ValueError("Nenhuma partição para o backfill")
+    workers = ingest.INGEST_WORKERS if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(dts))
+    t0 = time.perf_counter()
+
+    conn = ingest.get_db_connection()
+    cur = conn.cursor()
+    days = []
+    try:
+        cur.execute(ingest.INGEST_STATE_DDL)
+        cur.execute(ingest.INGEST_VERSION_DDL)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (ingest.INGEST_LOCK_ID,))
+        ingest.ensure_snapshot_tables(cur)
+        rewritten = frozenset(dts)
+        for dt in dts:
+            ingest.checkpoint_next_day(cur, dt, rewritten)
+        conn.commit()
+
+        # estado do dia anterior disponível (o único lido do banco)
+        cur.execute("SELECT max(dt)::text FROM snapshot_days WHERE dt < %s", (dts[0],))
+        prev_dt = cur.fetchone()[0]
+        state = ingest.load_state(cur, prev_dt)
+        conn.commit()
+
+        version = None
+        stale = False  # current_imoveis ficou para o acerto do fim
+        for dt, (hashes, paths, today) in prepared_days(dts, from_lake, workers):
+            t1 = time.perf_counter()
+            # medições só da gravação (a montagem do dia roda no pool)
+            stages = etapas.Stages(dt)
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (ingest.INGEST_LOCK_ID,))
+            cur.execute(
+                "INSERT INTO ingest_versions (dt) VALUES (%s) RETURNING version",
+                (dt,),
+            )
+            version = cur.fetchone()[0]
+            ingest.ensure_typed_columns(cur, version)
+            ingest.clear_ingested_day(cur, dt)
+            # dia mais novo já ingerido: daqui em diante o diff é do passado
+            stale = stale or ingest.newer_ingested_day(cur, dt) is not None
+
+            checkpoint = ingest.is_checkpoint_day(cur, dt, prev_dt)
+            with stages.stage("diff", rows=len(today)):
+                entered, exited, updated, refreshed = ingest.diff_in_memory(
+                    state, today
+                )
+            snapshot_rows, upserted, removed = ingest.store_day(
+                cur,
+                dt,
+                today,
+                entered,
+                exited,
+                updated,
+                checkpoint,
+                version,
+                hashes,
+                paths,
+                stages,
+                update_current=not stale,
+                refreshed=refreshed,
+            )
+            with stages.stage("commit"):
+                conn.commit()
+
+            summary = {
+                "dt": dt,
+                "previous": prev_dt,
+                "rows_today": int(len(today)),
+                "entered": int(len(entered)),
+                "exited": int(len(exited)),
+                "updated": int(len(updated)),
+                "refreshed": int(len(refreshed)),
+                "snapshot": "checkpoint" if checkpoint else "delta",
+                "snapshot_rows": snapshot_rows,
+                "current_upserted": upserted,
+                "current_removed": removed,
+                "ingest_version": version,
+                "stages": stages.records,
+                "seconds": round(time.perf_counter() - t1, 2),
+            }
+            days.append(summary)
+            if on_day is not None:
+                on_day(summary)
+            state, prev_dt = ingest.state_frame(today), dt
+
+        rebuilt = None
+        if stale:
+            t1 = time.perf_counter()
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (ingest.INGEST_LOCK_ID,))
+            cur.execute("SELECT max(dt)::text FROM snapshot_days")
+            newest = cur.fetchone()[0]
+            cur.execute(
+                "INSERT INTO ingest_versions (dt) VALUES (%s) RETURNING version",
+                (newest,),
+            )
+            version = cur.fetchone()[0]
+            upserted, removed = ingest.rebuild_current(cur, newest, version)
+            conn.commit()
+            rebuilt = {
+                "dt": newest,
+                "current_upserted": upserted,
+                "current_removed": removed,
+                "ingest_version": version,
+                "seconds": round(time.perf_counter() - t1, 2),
+            }
+
+        return {
+            "start": dts[0],
+            "end": dts[-1],
+            "days": days,
+            "workers": workers,
+            "current_rebuilt": rebuilt,
+            "current_snapshot": ingest.write_current_snapshot(conn, version),
+            "seconds": round(time.perf_counter() - t0, 2),
+            "status": "success",
+        }
+
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main():
+    src = f"{BASE_DIR}/dt=*"
+    ap = argparse.ArgumentParser(
+        description=f"Backfill de várias partições ({src}) numa passada"
+    )
+    ap.add_argument("--start", help="primeiro dt (inclusive)")
+    ap.add_argument("--end", help="último dt (inclusive)")
+    ap.add_argument("--dt", action="append", help="partição a ingerir (repetível)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument(
+        "--from-lake",
+        action="store_true",
+        help=f"lê o Parquet compactado em {LAKE_DIR} em vez dos CSVs",
+    )
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    dts = args.dt or discover_dts(args.from_lake)
+    dts = [
+        dt
+        for dt in dts
+        if (args.start is None or dt >= args.start)
+        and (args.end is None or dt <= args.end)
+    ]
+
+    def print_day(summary: dict):
+        print(json.dumps(summary, ensure_ascii=False), flush=True)
+
+    try:
+        summary = backfill(
+            dts, workers=args.workers, from_lake=args.from_lake, on_day=print_day
+        )
+        summary["days"] = len(summary["days"])
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    except Exception as e:
+        print(json.dumps({"error": str(e)}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
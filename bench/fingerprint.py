@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+# Uso: python -m bench.fingerprint --sizes 40000 400000 4000000
+
+
+def make_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    preco = rng.integers(20_000, 2_000_000, n)
+    aval = (preco * rng.uniform(1.0, 2.5, n)).astype(np.int64)
+    cidades = np.array([f"CIDADE {i}" for i in range(500)], dtype=object)
+    bairros = np.array([f"BAIRRO {i}" for i in range(3000)], dtype=object)
+    mods = np.array(
+        [
+            "Venda Online",
+            "Venda Direta Online",
+            "Licitação Aberta",
+            "Leilão SFI - Edital Único",
+        ],
+        dtype=object,
+    )
+    df = pd.DataFrame(
+        {
+            ingest.KEY: pd.Series(np.arange(n) + 10**12).astype(str),
+            "UF": "SP",
+            "Preço": [f"{p:,}".replace(",", ".") + ",00" for p in preco.tolist()],
+            "Valor de avaliação": [
+                f"{v:,}".replace(",", ".") + ",00" for v in aval.tolist()
+            ],
+            "Desconto": (100 - preco * 100 // aval).astype(str),
+            "Modalidade de venda": mods[rng.integers(0, len(mods), n)],
+            "Cidade": cidades[rng.integers(0, len(cidades), n)],
+            "Bairro": bairros[rng.integers(0, len(bairros), n)],
+        }
+    )
+    df.loc[rng.random(n) < 0.01, "Bairro"] = None
+    return df
+
+
+def timed(fn) -> tuple[float, pd.Series]:
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--sizes", type=int, nargs="+", default=[40_000, 400_000, 4_000_000]
+    )
+    args = ap.parse_args()
+
+    results = []
+    for n in args.sizes:
+        df = make_frame(n)
+        t_row, legacy = timed(lambda: df.apply(ingest.fingerprint_row, axis=1))
+        t_md5, md5 = timed(lambda: ingest.fingerprint_frame(df, "md5"))
+        t_fast, _ = timed(lambda: ingest.fingerprint_frame(df, "fast"))
+        if not legacy.equals(md5):
+            raise AssertionError(f"md5 vetorizado diverge do fingerprint_row (n={n})")
+        results.append(
+            {
+                "rows": n,
+                "apply_s": round(t_row, 3),
+                "md5_s": round(t_md5, 3),
+                "fast_s": round(t_fast, 3),
+                "speedup_md5": round(t_row / t_md5, 1),
+                "speedup_fast": round(t_row / t_fast, 1),
+            }
+        )
+        print(json.dumps(results[-1]))
+
+
+if __name__ == "__main__":
+    main()
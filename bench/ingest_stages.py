@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+import ingest
+from bench import synthetic
+
+# Uso: python -m bench.ingest_stages --scales 1 10 --days 3 --out antes.json
+#      python -m bench.ingest_stages --compare antes.json depois.json
+# Tempo de cada etapa do ingest_day sobre listas do bench.synthetic, dia a dia:
+#   decode       bytes -> texto (decode_bytes); o parse decodifica de novo em
+#                streaming dentro do read_csv, então não some os dois
+#   parse        parse_caixa_csv_bytes por arquivo (cabeçalho, read_csv, limpeza)
+#   normalize    o resto do df_from_csv_file/parse_csv_columns + merge_columnar
+#   fingerprint  add_fingerprint
+#   payload      build_today_payload (fingerprint de novo + JSON + tipadas)
+#   diff_memory  diff_in_memory contra o dia anterior (caminho do backfill)
+#   diff         diff_against_previous no Postgres (caminho do ingest diário)
+#   load         store_day + commit (COPY do snapshot/changes, current_imoveis)
+# diff e load rodam num banco só do bench (BENCH_DATABASE, recriado a cada
+# execução no mesmo servidor do .env). O resultado é um JSON com as medições
+# por dia e os totais por escala/etapa, comparável com --compare.
+
+STAGES = [
+    "decode",
+    "parse",
+    "normalize",
+    "fingerprint",
+    "payload",
+    "diff_memory",
+    "diff",
+    "load",
+]
+BENCH_DATABASE = os.getenv("BENCH_DATABASE", "leilao_bench")
+
+CURRENT_DDL = """
+    CREATE TABLE IF NOT EXISTS current_imoveis (
+        uf VARCHAR(10),
+        numero_imovel VARCHAR(50),
+        payload_json JSONB,
+        fp VARCHAR(100),
+        last_seen DATE,
+        source_file TEXT,
+        PRIMARY KEY (uf, numero_imovel)
+    )
+"""
+
+
+def reset_database(name: str):
+    """Recria `name` com as tabelas do ingest e devolve a conexão."""
+    if name == os.getenv("database", "db_leiloes").replace('"', ""):
+        raise ValueError(f"BENCH_DATABASE={name} é o banco do ingest")
+    admin = ingest.get_db_connection("postgres")
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        # template0: o template1 do servidor pode não ser UTF8 (payloads com acento)
+        cur.execute(f"CREATE DATABASE \"{name}\" ENCODING 'UTF8' TEMPLATE template0")
+    admin.close()
+
+    conn = ingest.get_db_connection(name)
+    with conn.cursor() as cur:
+        for table in ingest.HISTORY_TABLES:
+            ingest.create_history_table(cur, table, partitioned=True)
+        cur.execute(CURRENT_DDL)
+        cur.execute(ingest.CURRENT_TYPED_DDL)
+        cur.execute(ingest.INGEST_STATE_DDL)
+        cur.execute(ingest.INGEST_VERSION_DDL)
+        ingest.ensure_snapshot_tables(cur)
+    conn.commit()
+    return conn
+
+
+def normalize_file(df: pd.DataFrame, path: Path) -> tuple[list[str], list]:
+    # o que df_from_csv_file/parse_csv_columns fazem depois do parse
+    if "UF" not in df.columns or df["UF"].isna().all():
+        df["UF"] = ingest.uf_from_path(path)
+    df["source_file"] = path.as_posix()
+    df = ingest.normalize_df(df)
+    return list(df.columns), [df.iloc[:, i].to_numpy() for i in range(df.shape[1])]
+
+
+class Timer:
+    def __init__(self, scale: float, dt: str):
+        self.scale, self.dt = scale, dt
+        self.results: list[dict] = []
+
+    def __call__(self, stage: str, fn, rows=None):
+        t0 = time.perf_counter()
+        out = fn()
+        seconds = time.perf_counter() - t0
+        n = rows(out) if callable(rows) else rows
+        self.results.append(
+            {
+                "scale": self.scale,
+                "dt": self.dt,
+                "stage": stage,
+                "rows": n,
+                "seconds": round(seconds, 4),
+                "rows_per_s": round(n / seconds) if n and seconds else None,
+            }
+        )
+        return out
+
+
+def bench_day(
+    timer: Timer,
+    csvs: list[Path],
+    dt: str,
+    state: pd.DataFrame,
+    conn,
+    prev_dt: str,
+) -> tuple[pd.DataFrame, dict]:
+    raws = [p.read_bytes() for p in csvs]
+    timer("decode", lambda: [ingest.decode_bytes(r) for r in raws])
+    frames = timer(
+        "parse",
+        lambda: [ingest.parse_caixa_csv_bytes(r) for r in raws],
+        lambda out: sum(map(len, out)),
+    )
+    today = timer(
+        "normalize",
+        lambda: ingest.merge_columnar(
+            [normalize_file(df, p) for df, p in zip(frames, csvs)]
+        ),
+        len,
+    )
+    timer("fingerprint", lambda: ingest.add_fingerprint(today), len)
+    payload = timer("payload", lambda: ingest.build_today_payload(today, dt), len)
+    diff = timer(
+        "diff_memory",
+        lambda: ingest.diff_in_memory(state, payload),
+        lambda out: sum(map(len, out)),
+    )
+    counts = dict(zip(["entered", "exited", "updated"], map(len, diff)))
+
+    if conn is not None:
+        with conn.cursor() as cur:
+            # mesma sequência do ingest_day (sem o incremental)
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (ingest.INGEST_LOCK_ID,))
+            cur.execute(
+                "INSERT INTO ingest_versions (dt) VALUES (%s) RETURNING version",
+                (dt,),
+            )
+            version = cur.fetchone()[0]
+            ingest.ensure_typed_columns(cur, version)
+            ingest.clear_ingested_day(cur, dt)
+            checkpoint = ingest.is_checkpoint_day(cur, dt, prev_dt)
+            prev_table = ingest.previous_snapshot(cur, prev_dt)
+            entered, exited, updated, refreshed = timer(
+                "diff",
+                lambda: ingest.diff_against_previous(
+                    cur, prev_dt, payload, [], prev_table
+                ),
+                lambda out: sum(map(len, out)),
+            )
+            counts = dict(zip(counts, map(len, (entered, exited, updated))))
+            hashes = ingest.source_hashes(dt, csvs)
+            paths = {ingest.uf_from_path(p): p.as_posix() for p in csvs}
+
+            def load():
+                rows = ingest.store_day(
+                    cur,
+                    dt,
+                    payload,
+                    entered,
+                    exited,
+                    updated,
+                    checkpoint,
+                    version,
+                    hashes,
+                    paths,
+                    refreshed=refreshed,
+                )[0]
+                conn.commit()
+                return rows + len(entered) + len(exited) + len(updated)
+
+            timer("load", load, lambda rows: rows)
+    return ingest.state_frame(payload), counts
+
+
+def run_scale(args, scale: float, conn) -> tuple[list[dict], list[dict]]:
+    with tempfile.TemporaryDirectory(prefix="bench-caixa-") as tmp:
+        root = Path(args.data or tmp) / f"scale={scale:g}"
+        days = synthetic.generate(
+            root,
+            scale=scale,
+            days=args.days,
+            start=args.start,
+            enter_rate=args.enter_rate,
+            exit_rate=args.exit_rate,
+            update_rate=args.update_rate,
+            seed=args.seed,
+        )
+        state = pd.DataFrame(columns=ingest.STATE_COLS, dtype=object)
+        results, checks = [], []
+        prev_dt = (date.fromisoformat(args.start) - timedelta(days=1)).isoformat()
+        for day in days:
+            dt = day["dt"]
+            csvs = sorted((root / f"dt={dt}").glob("UF=*/Lista_imoveis_*.csv"))
+            timer = Timer(scale, dt)
+            state, counts = bench_day(timer, csvs, dt, state, conn, prev_dt)
+            expected = {k: day[k] for k in counts}
+            checks.append({"scale": scale, "dt": dt, "ok": counts == expected})
+            if counts != expected:
+                checks[-1].update(expected=expected, found=counts)
+            for r in timer.results:
+                print(json.dumps(r), flush=True)
+            results += timer.results
+            prev_dt = dt
+    return results, checks
+
+
+def totals(results: list[dict]) -> dict:
+    # {escala: {etapa: {"seconds": soma nos dias, "per_day": média}}}
+    grouped: dict[str, dict[str, list[float]]] = {}
+    for r in results:
+        stages = grouped.setdefault(f"{r['scale']:g}", {})
+        stages.setdefault(r["stage"], []).append(r["seconds"])
+    return {
+        scale: {
+            stage: {"seconds": round(sum(v), 4), "per_day": round(sum(v) / len(v), 4)}
+            for stage, v in stages.items()
+        }
+        for scale, stages in grouped.items()
+    }
+
+
+def run_info(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+        "cpu_count": os.cpu_count(),
+        "fp_mode": ingest.FP_MODE,
+        "load_mode": ingest.LOAD_MODE,
+        "snapshot_mode": ingest.SNAPSHOT_MODE,
+        "database": None if args.no_db else BENCH_DATABASE,
+        "days": args.days,
+        "enter_rate": args.enter_rate,
+        "exit_rate": args.exit_rate,
+        "update_rate": args.update_rate,
+        "seed": args.seed,
+    }
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    # por dia, para comparar execuções com números de dias diferentes
+    old = json.loads(old_path.read_text(encoding="utf-8"))["totals"]
+    new = json.loads(new_path.read_text(encoding="utf-8"))["totals"]
+    for scale in sorted(set(old) & set(new), key=float):
+        for stage in STAGES:
+            if stage not in old[scale] or stage not in new[scale]:
+                continue
+            a, b = old[scale][stage]["per_day"], new[scale][stage]["per_day"]
+            row = {"scale": float(scale), "stage": stage, "old_s": a, "new_s": b}
+            row["speedup"] = round(a / b, 2) if b else None
+            print(json.dumps(row))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", type=float, nargs="+", default=[1, 10])
+    ap.add_argument("--days", type=int, default=3)
+    ap.add_argument("--start", default="2025-01-01")
+    ap.add_argument("--enter-rate", type=float, default=0.02)
+    ap.add_argument("--exit-rate", type=float, default=0.02)
+    ap.add_argument("--update-rate", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument(
+        "--data", type=Path, help="guarda as listas geradas aqui (senão, temporário)"
+    )
+    ap.add_argument("--no-db", action="store_true", help="pula diff e load")
+    ap.add_argument(
+        "--out",
+        type=Path,
+        default=Path("data") / "bench" / "ingest_stages.json",
+    )
+    ap.add_argument("--compare", type=Path, nargs=2, metavar=("ANTES", "DEPOIS"))
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    info = run_info(args)
+    results, checks = [], []
+    for scale in args.scales:
+        conn = None if args.no_db else reset_database(BENCH_DATABASE)
+        try:
+            r, c = run_scale(args, scale, conn)
+        finally:
+            if conn is not None:
+                conn.close()
+        results += r
+        checks += c
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "run": info,
+        "results": results,
+        "totals": totals(results),
+        "checks": checks,
+    }
+    args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps({"out": str(args.out), "totals": report["totals"]}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Uso: python -m bench.synthetic --scale 10 --days 5 --out data/bench/caixa
+# Listas sintéticas no formato dos CSVs da Caixa (dt=*/UF=*/Lista_imoveis_XX.csv,
+# como o extrai.py grava) para os benchmarks do ingest: windows-1252, linha em
+# branco + preâmbulo "Lista de Imóveis da Caixa" antes do cabeçalho, linha em
+# branco depois dele e células com espaços em volta. scale=1 são ~40 mil
+# imóveis por dia, distribuídos pelas UFs como na lista real; de um dia para o
+# outro uma fração sai, outra entra e outra muda de preço (churn).
+
+BASE_ROWS = 40_000
+LINK_BASE = "https://venda-imoveis.caixa.gov.br/sistema/detalhe-imovel.asp?hdnimovel="
+
+# participação de cada UF na lista (dt=2026-01-26)
+UF_WEIGHTS = {
+    "RJ": 11610,
+    "GO": 5154,
+    "SP": 3535,
+    "PE": 1727,
+    "RS": 1253,
+    "MG": 1219,
+    "BA": 1168,
+    "RN": 1106,
+    "PB": 1098,
+    "CE": 947,
+    "PR": 834,
+    "PI": 774,
+    "SE": 505,
+    "PA": 264,
+    "AM": 256,
+    "SC": 195,
+    "MT": 193,
+    "AL": 189,
+    "MS": 175,
+    "MA": 160,
+    "DF": 93,
+    "ES": 45,
+    "AC": 34,
+    "RO": 33,
+    "TO": 25,
+    "RR": 5,
+    "AP": 3,
+}
+MODALIDADES = {
+    "Venda Direta Online": 0.67,
+    "Leilão SFI - Edital Único": 0.21,
+    "Licitação Aberta": 0.06,
+    "Venda Online": 0.06,
+}
+TIPOS = {
+    "Apartamento": 0.56,
+    "Casa": 0.39,
+    "Terreno": 0.032,
+    "Sala": 0.006,
+    "Prédio": 0.003,
+    "Loja": 0.003,
+    "Galpão": 0.003,
+    "Comercial": 0.003,
+}
+CIDADES = ["SÃO JOSÉ", "SANTA LUZIA", "CAMPO GRANDE", "VITÓRIA", "BELÉM", "ITAPEVA"]
+BAIRROS = [
+    "CENTRO",
+    "JARDIM AMÉRICA",
+    "VILA ESPERANÇA",
+    "PARQUE DAS NAÇÕES",
+    "BOA VISTA",
+]
+RUAS = ["RUA", "AVENIDA", "TRAVESSA", "ALAMEDA", "ESTRADA"]
+CIDADES_POR_UF = 60
+BAIRROS_POR_CIDADE = 40
+
+# Cabeçalhos vistos nas listas: a chave vem com ° ou º e há arquivos com os
+# acentos perdidos; find_header_line_index/rename_caixa_columns aceitam todos
+HEADERS = [
+    "N° do imóvel;UF;Cidade;Bairro;Endereço;Preço;Valor de avaliação;Desconto;"
+    "Descrição;Modalidade de venda;Link de acesso",
+    "Nº do imóvel;UF;Cidade;Bairro;Endereço;Preço;Valor de avaliação;Desconto;"
+    "Descrição;Modalidade de venda;Link de acesso",
+    "N do imvel;UF;Cidade;Bairro;Endereo;Preo;Valor de avaliao;Desconto;"
+    "Descrio;Modalidade de venda;Link de acesso",
+]
+# colunas do estado na ordem do cabeçalho
+CSV_COLS = [
+    "numero",
+    "uf",
+    "cidade",
+    "bairro",
+    "endereco",
+    "preco",
+    "avaliacao",
+    "desconto",
+    "descricao",
+    "modalidade",
+    "link",
+]
+
+
+def choice(rng: np.random.Generator, weights: dict, n: int) -> np.ndarray:
+    keys = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return keys[rng.choice(len(keys), n, p=p / p.sum())]
+
+
+def brl(cents: np.ndarray) -> list[str]:
+    # 39887399 -> "398.873,99"
+    return [f"{c // 100:,}".replace(",", ".") + f",{c % 100:02d}" for c in cents]
+
+
+def with_prices(df: pd.DataFrame, preco: np.ndarray) -> pd.DataFrame:
+    # preço (centavos) + textos de Preço e Desconto coerentes com a avaliação
+    desconto = np.clip(100 - preco * 100 / df["avaliacao_c"].to_numpy(), 0, 100)
+    return df.assign(
+        preco_c=preco,
+        preco=brl(preco),
+        desconto=[f"{d:.2f}" for d in desconto],
+    )
+
+
+def descricoes(rng: np.random.Generator, tipos: np.ndarray) -> pd.Series:
+    n = len(tipos)
+    area = rng.uniform(30, 250, n).round(2)
+    terreno = np.where(np.isin(tipos, ["Casa", "Terreno"]), rng.uniform(100, 600, n), 0)
+    quartos = rng.integers(1, 5, n).astype(str)
+    vagas = rng.integers(0, 3, n).astype(str)
+    s = pd.Series(tipos, dtype=object)
+    fmt = "{:.2f}".format
+    total = pd.Series(np.where(tipos == "Apartamento", 0, area)).map(fmt)
+    return (
+        s
+        + ", "
+        + total
+        + " de área total, "
+        + pd.Series(area).map(fmt)
+        + " de área privativa, "
+        + pd.Series(terreno).map(fmt)
+        + " de área do terreno,  "
+        + quartos
+        + " qto(s), a.serv, WC, 1 sala(s), cozinha, "
+        + vagas
+        + " vaga(s) de garagem."
+    )
+
+
+def new_imoveis(rng: np.random.Generator, n: int, first_id: int) -> pd.DataFrame:
+    """n imóveis novos (números first_id, first_id + 1, ...)."""
+    ufs = choice(rng, UF_WEIGHTS, n)
+    numero = (8_444_400_000_000 + first_id + np.arange(n)).astype(str)
+    c = rng.integers(0, CIDADES_POR_UF, n)
+    b = rng.integers(0, BAIRROS_POR_CIDADE, n)
+    cidades = np.array(CIDADES, dtype=object)[c % len(CIDADES)] + " " + c.astype(str)
+    bairros = np.array(BAIRROS, dtype=object)[b % len(BAIRROS)] + " " + b.astype(str)
+    ruas = np.array(RUAS, dtype=object)[rng.integers(0, len(RUAS), n)]
+    enderecos = (
+        ruas
+        + " "
+        + bairros
+        + ", N. "
+        + rng.integers(1, 3000, n).astype(str)
+        + ", LT "
+        + rng.integers(1, 40, n).astype(str)
+    )
+    avaliacao = rng.integers(60_000, 1_500_000, n) * 100
+    preco = (avaliacao * rng.uniform(0.4, 1.0, n)).astype(np.int64)
+    tipos = choice(rng, TIPOS, n)
+    df = pd.DataFrame(
+        {
+            "numero": numero,
+            "uf": ufs,
+            "cidade": cidades,
+            "bairro": bairros,
+            "endereco": enderecos,
+            "avaliacao_c": avaliacao,
+            "avaliacao": brl(avaliacao),
+            "descricao": descricoes(rng, tipos).to_numpy(),
+            "modalidade": choice(rng, MODALIDADES, n),
+        }
+    )
+    df["link"] = LINK_BASE + df["numero"]
+    return with_prices(df, preco)
+
+
+def next_day(
+    rng: np.random.Generator,
+    state: pd.DataFrame,
+    n_enter: int,
+    n_exit: int,
+    n_update: int,
+    first_id: int,
+) -> pd.DataFrame:
+    # EXIT: some uma amostra; UPDATE: queda de preço em outra; ENTER: novos
+    keep = np.ones(len(state), dtype=bool)
+    keep[rng.choice(len(state), min(n_exit, len(state)), replace=False)] = False
+    state = state[keep].reset_index(drop=True)
+    upd = rng.choice(len(state), min(n_update, len(state)), replace=False)
+    preco = state["preco_c"].to_numpy().copy()
+    preco[upd] = (preco[upd] * rng.uniform(0.85, 0.99, len(upd))).astype(np.int64)
+    changed = with_prices(state.iloc[upd], preco[upd])
+    state.loc[upd, ["preco_c", "preco", "desconto"]] = changed[
+        ["preco_c", "preco", "desconto"]
+    ].to_numpy()
+    return pd.concat([state, new_imoveis(rng, n_enter, first_id)], ignore_index=True)
+
+
+def csv_lines(state: pd.DataFrame) -> pd.Series:
+    # as 5 primeiras células levam um espaço antes do ';', como na lista real
+    padded = [" " + state["numero"]] + [state[c] for c in CSV_COLS[1:5]]
+    plain = [state[c] for c in CSV_COLS[5:]]
+    return (
+        padded[0].str.cat(padded[1:] + [plain[0]], sep=" ;").str.cat(plain[1:], sep=";")
+    )
+
+
+def write_day(root: Path, day: date, state: pd.DataFrame) -> int:
+    """Grava um Lista_imoveis_XX.csv por UF em root/dt=*/UF=*; devolve os bytes."""
+    preamble = f" Lista de Imóveis da Caixa;;Data de geração:;{day:%d/%m/%Y};;;;;;;"
+    size = 0
+    for i, (uf, lines) in enumerate(csv_lines(state).groupby(state["uf"])):
+        # cabeçalho e fim de linha variam por UF (arquivos de origens diferentes)
+        eol = "\r\n" if i % 4 == 3 else "\n"
+        header = " " + HEADERS[i % len(HEADERS)]
+        text = eol.join(["", preamble, header, "", *lines.tolist(), ""])
+        path = root / f"dt={day.isoformat()}" / f"UF={uf}" / f"Lista_imoveis_{uf}.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size += path.write_bytes(text.encode("cp1252"))
+    return size
+
+
+def generate(
+    root: Path,
+    scale: float = 1.0,
+    days: int = 3,
+    start: str = "2025-01-01",
+    enter_rate: float = 0.02,
+    exit_rate: float = 0.02,
+    update_rate: float = 0.05,
+    seed: int = 0,
+):
+    """Gera `days` dias consecutivos em root e devolve um resumo por dia.
+
+    Taxas são frações do catálogo do dia anterior; entered/exited/updated do
+    resumo são o que o diff do ingest tem que encontrar.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(BASE_ROWS * scale)
+    summary = []
+    state, next_id = None, 0
+    for k in range(days):
+        t0 = time.perf_counter()
+        day = date.fromisoformat(start) + timedelta(days=k)
+        if state is None:
+            state = new_imoveis(rng, n, next_id)
+            entered, exited, updated = len(state), 0, 0
+        else:
+            entered = int(enter_rate * len(state))
+            exited = int(exit_rate * len(state))
+            updated = int(update_rate * (len(state) - exited))
+            state = next_day(rng, state, entered, exited, updated, next_id)
+        next_id += entered
+        size = write_day(root, day, state)
+        summary.append(
+            {
+                "dt": day.isoformat(),
+                "rows": len(state),
+                "entered": entered,
+                "exited": exited,
+                "updated": updated,
+                "bytes": size,
+                "seconds": round(time.perf_counter() - t0, 2),
+            }
+        )
+    return summary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", type=Path, default=Path("data") / "bench" / "caixa")
+    ap.add_argument("--scale", type=float, default=1.0, help="1 = ~40 mil imóveis/dia")
+    ap.add_argument("--days", type=int, default=3)
+    ap.add_argument("--start", default="2025-01-01")
+    ap.add_argument("--enter-rate", type=float, default=0.02)
+    ap.add_argument("--exit-rate", type=float, default=0.02)
+    ap.add_argument("--update-rate", type=float, default=0.05)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    for day in generate(
+        args.out,
+        scale=args.scale,
+        days=args.days,
+        start=args.start,
+        enter_rate=args.enter_rate,
+        exit_rate=args.exit_rate,
+        update_rate=args.update_rate,
+        seed=args.seed,
+    ):
+        print(json.dumps(day))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import ingest
+import memoria
+
+# Uso: python -m bench.viewer_memory
+# Bytes por imóvel do DataFrame do viewer (modo memória) lido de current_imoveis:
+# "json_normalize" é o loader original (payload inteiro em objetos Python),
+# "texto" o SELECT com os campos de exibição como str e "compacto" o de
+# memoria.py (textos sob demanda). "arrow" é o mesmo DataFrame compacto aberto
+# do snapshot que o ingest grava (memoria.write_snapshot/read_snapshot): o
+# load_s dele contra o do "compacto" é o ganho no cold start do app.
+
+TEXT_SELECT = """
+    uf AS "UF",
+    numero_imovel AS "Nº do imóvel",
+    cidade AS "Cidade",
+    bairro AS "Bairro",
+    payload_json->>'Endereço' AS "Endereço",
+    payload_json->>'Preço' AS "Preço",
+    payload_json->>'Valor de avaliação' AS "Valor de avaliação",
+    payload_json->>'Desconto' AS "Desconto",
+    payload_json->>'Descrição' AS "Descrição",
+    modalidade AS "Modalidade de venda",
+    payload_json->>'Link de acesso' AS "Link de acesso",
+    preco::float8 AS "Preço_num",
+    valor_avaliacao::float8 AS "Avaliação_num",
+    desconto::float8 AS "Desconto_num",
+    tipo AS "Tipo",
+    area_total::float8 AS "Área total",
+    area_privativa::float8 AS "Área privativa",
+    area_terreno::float8 AS "Área do terreno",
+    quartos AS "Quartos",
+    vagas AS "Vagas",
+    fp,
+    last_seen,
+    source_file
+"""
+
+
+def load_json_normalize(conn) -> pd.DataFrame:
+    base = pd.read_sql(
+        "SELECT uf, numero_imovel, payload_json, fp, last_seen, source_file "
+        "FROM current_imoveis",
+        conn,
+    )
+    df = pd.json_normalize(base["payload_json"].tolist())
+    for col in ["fp", "last_seen", "source_file"]:
+        df[col] = base[col]
+    for col, out in [
+        ("Preço", "Preço_num"),
+        ("Valor de avaliação", "Avaliação_num"),
+        ("Desconto", "Desconto_num"),
+    ]:
+        df[out] = pd.to_numeric(ingest.parse_decimal_ptbr(df[col]))
+    return df
+
+
+def load_text(conn) -> pd.DataFrame:
+    return pd.read_sql(f"SELECT {TEXT_SELECT} FROM current_imoveis", conn)
+
+
+def load_compact(conn) -> pd.DataFrame:
+    return memoria.compact_frame(
+        pd.read_sql(f"SELECT {memoria.COMPACT_SELECT} FROM current_imoveis", conn)
+    )
+
+
+def load_arrow(path: Path) -> pd.DataFrame:
+    df, _ = memoria.read_snapshot(path)
+    return df
+
+
+def report(name: str, df: pd.DataFrame, seconds: float):
+    total = int(df.memory_usage(deep=True).sum())
+    print(
+        json.dumps(
+            {
+                "repr": name,
+                "rows": len(df),
+                "bytes_per_row": round(memoria.bytes_per_row(df)),
+                "mb": round(total / 2**20, 1),
+                "load_s": round(seconds, 2),
+            }
+        )
+    )
+
+
+def main():
+    conn = ingest.get_db_connection()
+    try:
+        for name, loader in [
+            ("json_normalize", load_json_normalize),
+            ("texto", load_text),
+            ("compacto", load_compact),
+        ]:
+            t0 = time.perf_counter()
+            df = loader(conn)
+            report(name, df, time.perf_counter() - t0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "current.arrow"
+            memoria.write_snapshot(df, None, path)
+            t0 = time.perf_counter()
+            snap = load_arrow(path)
+            report("arrow", snap, time.perf_counter() - t0)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import historico
+from ingest import BASE_DIR, LAKE_DIR, compact_day
+
+
+def discover_dts() -> list[str]:
+    return sorted(p.name.removeprefix("dt=") for p in BASE_DIR.glob("dt=*"))
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description=f"Compacta {BASE_DIR}/dt=*/UF=*/*.csv em Parquet ({LAKE_DIR})"
+    )
+    ap.add_argument("--dt", action="append", help="partição a compactar (repetível)")
+    ap.add_argument("--all", action="store_true", help="todas as partições dt=*")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument(
+        "--force",
+        action="store_true",
+        help="recompacta mesmo se a partição já estiver em dia",
+    )
+    ap.add_argument(
+        "--historico",
+        action="store_true",
+        help="depois de compactar, traz os dt novos para o DuckDB do histórico",
+    )
+    args = ap.parse_args()
+
+    dts = discover_dts() if args.all else (args.dt or [])
+    if not dts:
+        ap.error("informe --dt ou --all")
+
+    for dt in dts:
+        t0 = time.perf_counter()
+        try:
+            summary = compact_day(dt, workers=args.workers, force=args.force)
+            summary["seconds"] = round(time.perf_counter() - t0, 2)
+        except Exception as e:
+            summary = {"dt": dt, "error": str(e)}
+        print(json.dumps(summary, ensure_ascii=False))
+
+    if args.historico:
+        t0 = time.perf_counter()
+        con = historico.connect()  # traz os dt novos do lake
+        try:
+            loaded = len(historico.available_dates(con))
+        finally:
+            con.close()
+        summary = {"historico": str(historico.HISTORICO_DB), "loaded_dts": loaded}
+        summary["seconds"] = round(time.perf_counter() - t0, 2)
+        print(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
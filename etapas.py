@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage, o pico de RSS fica None
+    resource = None
+
+# Medição das etapas do ingest_day: tempo de parede, CPU, RSS e linhas por
+# etapa (a leitura também por UF, medida no processo que leu o arquivo). Vai
+# para o resumo JSON ("stages") e, etapa a etapa, para o logger "ingest" como
+# uma linha JSON. Memória por etapa:
+#   rss_mb, rss_delta_mb  RSS no fim da etapa e quanto cresceu desde o início
+#                         (de /proc/self/statm; None fora do Linux)
+#   peak_rss_mb           pico de RSS durante a etapa: o VmHWM é zerado no
+#                         início (/proc/self/clear_refs) e lido no fim. Sem isso
+#                         (fora do Linux), vai process_max_rss_mb, o pico do
+#                         processo desde que ele começou
+#   INGEST_TRACEMALLOC=1        pico do tracemalloc por etapa (deixa o ingest
+#                               bem mais lento; só para investigar memória)
+#   INGEST_PROFILE=diff,read_uf grava um perfil de cada etapa listada em
+#                               INGEST_PROFILE_DIR: cProfile (.prof, abrir com
+#                               pstats/snakeviz) ou, com
+#                               INGEST_PROFILER=pyinstrument, HTML
+TRACEMALLOC = os.getenv("INGEST_TRACEMALLOC", "") == "1"
+PROFILE_STAGES = {s for s in os.getenv("INGEST_PROFILE", "").split(",") if s}
+PROFILER = os.getenv("INGEST_PROFILER", "cprofile")
+PROFILE_DIR = Path(os.getenv("INGEST_PROFILE_DIR", str(Path("data") / "profiles")))
+
+log = logging.getLogger("ingest")
+
+
+def rss_mb() -> float | None:
+    """RSS atual do processo, em MiB; None sem /proc (fora do Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+def reset_peak_rss() -> bool:
+    """Zera o pico de RSS (VmHWM) do processo; False se não dá (fora do Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float | None:
+    """VmHWM do processo (pico de RSS desde o último reset_peak_rss), em MiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 2**10, 1)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# Picos parciais das medições em andamento neste processo: uma etapa aninhada
+# zera o VmHWM, então as de fora guardam o pico visto até ali
+_open_peaks: list[list[float]] = []
+
+
+def _fold_peak() -> None:
+    peak = peak_rss_mb()
+    if peak is not None:
+        for p in _open_peaks:
+            p[0] = max(p[0], peak)
+
+
+def max_rss_mb() -> float | None:
+    """Pico de RSS do processo até agora, em MiB."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB no Linux, bytes no macOS
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+@contextmanager
+def profiled(stage: str, label: str):
+    # Perfil só das etapas pedidas em INGEST_PROFILE; devolve o caminho gravado
+    if stage not in PROFILE_STAGES:
+        yield None
+        return
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    if PROFILER == "pyinstrument":
+        from pyinstrument import Profiler  # opcional: só quando pedido
+
+        path = PROFILE_DIR / f"{label}.html"
+        prof = Profiler()
+        prof.start()
+        try:
+            yield path
+        finally:
+            prof.stop()
+            path.write_text(prof.output_html(), encoding="utf-8")
+    else:
+        path = PROFILE_DIR / f"{label}.prof"
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield path
+        finally:
+            prof.disable()
+            prof.dump_stats(path)
+
+
+@contextmanager
+def measure(stage: str, label: str | None = None, trace: bool = True, **fields):
+    """Mede o bloco; o dict devolvido pode receber campos (ex.: rows) dentro dele.
+
+    trace=False não mexe no pico do tracemalloc (medições aninhadas em outra
+    etapa, que zerariam o pico dela).
+    """
+    rec = {"stage": stage, **fields}
+    tracing = trace and TRACEMALLOC
+    started = tracing and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    elif tracing:
+        tracemalloc.reset_peak()
+    rss = rss_mb()
+    _fold_peak()
+    peak = [0.0] if reset_peak_rss() else None
+    if peak is not None:
+        _open_peaks.append(peak)
+    wall, cpu = time.perf_counter(), time.process_time()
+    path = None
+    try:
+        with profiled(stage, label or stage) as path:
+            yield rec
+    finally:
+        rec["wall_s"] = round(time.perf_counter() - wall, 4)
+        rec["cpu_s"] = round(time.process_time() - cpu, 4)
+        rec["rss_mb"] = rss_mb()
+        if rss is not None and rec["rss_mb"] is not None:
+            rec["rss_delta_mb"] = round(rec["rss_mb"] - rss, 1)
+        if peak is not None:
+            _fold_peak()
+            _open_peaks[:] = [p for p in _open_peaks if p is not peak]
+            rec["peak_rss_mb"] = peak[0]
+        else:
+            rec["process_max_rss_mb"] = max_rss_mb()
+        if tracing:
+            rec["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        if started:
+            tracemalloc.stop()
+        if path is not None:
+            rec["profile"] = str(path)
+
+
+class Stages:
+    """Medições de um ingest, na ordem em que as etapas terminaram."""
+
+    def __init__(self, dt: str, emit: bool = True):
+        self.dt = dt
+        self.emit = emit
+        self.records: list[dict] = []
+        self.fields: dict = {}
+
+    @contextmanager
+    def scope(self, **fields):
+        # campos fixos (ex.: uf do lote no ingest em streaming) das etapas
+        # medidas dentro do bloco; valores None são ignorados
+        saved = self.fields
+        self.fields = {**saved, **{k: v for k, v in fields.items() if v is not None}}
+        try:
+            yield
+        finally:
+            self.fields = saved
+
+    @contextmanager
+    def stage(self, name: str, rows: int | None = None, **fields):
+        fields = {**self.fields, **fields}
+        label = "-".join([self.dt, name, *map(str, self.fields.values())])
+        with measure(name, label=label, rows=rows, **fields) as rec:
+            yield rec
+        self.add(rec)
+
+    def add(self, rec: dict) -> None:
+        # também recebe as medições feitas nos processos de leitura (por UF)
+        self.records.append(rec)
+        if self.emit:
+            line = {"event": "ingest_stage", "dt": self.dt, **rec}
+            log.info(json.dumps(line, ensure_ascii=False))
@@ -2,59 +2,275 @@ from __future__ import annotations
 
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import hashlib
+import json
+import random
+import threading
 import time
 import requests
+from requests.adapters import HTTPAdapter
 
 BASE = "https://venda-imoveis.caixa.gov.br"
+DATA_DIR = Path("data") / "caixa"
+MANIFEST_NAME = "manifest.json"
 UFS = [
     "AC","AL","AM","AP","BA","CE","DF","ES","GO","MA","MG","MS","MT",
     "PA","PB","PE","PI","PR","RJ","RN","RO","RR","RS","SC","SE","SP","TO"
 ]
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; CaixaCSVBot/1.0)",
+    "Accept": "text/csv,text/plain,*/*",
+    "Referer": f"{BASE}/",
+}
 
-def download_csv(uf: str, out_dir: Path, timeout: int = 60) -> Path:
-    out_dir.mkdir(parents=True, exist_ok=True)
+MAX_WORKERS = 4          # downloads simultâneos
+RATE_PER_HOST = 3.0      # requisições por segundo por host (gentileza com o servidor)
+MAX_RETRIES = 4
+BACKOFF = 0.5            # segundos; dobra a cada tentativa (+ jitter)
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# erros de rede que valem nova tentativa; conexão caindo no meio do corpo
+# (o caso comum nos arquivos grandes) chega como ChunkedEncodingError
+RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.HTTPError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
 
-    # cache buster (timestamp)
-    cb = int(time.time())
-    url = f"{BASE}/listaweb/Lista_imoveis_{uf}.csv?{cb}"
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; CaixaCSVBot/1.0)",
-        "Accept": "text/csv,text/plain,*/*",
-        "Referer": f"{BASE}/",
-    }
+class HostRateLimiter:
+    """Espaça o início das requisições para um mesmo host (thread-safe)."""
 
-    with requests.Session() as s:
-        r = s.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-        r.raise_for_status()
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next: dict[str, float] = {}
+        self._lock = threading.Lock()
 
-        # alguns servidores mandam CSV como text/plain; ok
-        file_path = out_dir / f"Lista_imoveis_{uf}.csv"
-        file_path.write_bytes(r.content)
-        return file_path
+    def wait(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
-def main():
-    dt = datetime.now().strftime("%Y-%m-%d")
-    root = Path("data") / "caixa" / f"dt={dt}"
 
-    # baixa geral (opcional)
-    download_csv("geral", root / "UF=geral")
+def make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update(HEADERS)
+    return s
+
+
+def load_previous_manifest(dt: str, data_dir: Path = DATA_DIR) -> dict:
+    # arquivos do manifest mais recente de uma partição anterior a dt
+    for day_dir in sorted(data_dir.glob("dt=*"), reverse=True):
+        manifest = day_dir / MANIFEST_NAME
+        if day_dir.name < f"dt={dt}" and manifest.exists():
+            return json.loads(manifest.read_text(encoding="utf-8")).get("files", {})
+    return {}
+
+
+def download_csv(
+    uf: str,
+    out_dir: Path,
+    timeout: int = 60,
+    session: requests.Session | None = None,
+    limiter: HostRateLimiter | None = None,
+    base: str = BASE,
+    previous: dict | None = None,
+) -> dict:
+    """Baixa o CSV da UF e devolve a entrada do manifest.
+
+    Com `previous` (entrada do último manifest) a requisição é condicional
+    (ETag / Last-Modified). Se o servidor responder 304, ou o conteúdo vier
+    idêntico (mesmo sha256), nada é gravado: a entrada aponta para o arquivo
+    da partição anterior com changed=False.
+    """
+    # sem cache buster: ele impedia qualquer cache/requisição condicional
+    url = f"{base}/listaweb/Lista_imoveis_{uf}.csv"
+    host = urlsplit(url).netloc
+
+    file_path = out_dir / f"Lista_imoveis_{uf}.csv"
+    tmp_path = file_path.with_suffix(".csv.part")
+
+    headers = {}
+    if previous and previous.get("path") and Path(previous["path"]).exists():
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+    else:
+        previous = None
+
+    own_session = session is None
+    s = make_session(1) if own_session else session
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            if limiter is not None:
+                limiter.wait(host)
+            try:
+                with s.get(
+                    url,
+                    headers=headers,
+                    timeout=timeout,
+                    allow_redirects=True,
+                    stream=True,
+                ) as r:
+                    if r.status_code == 304 and previous:
+                        return {**previous, "changed": False, "status": 304}
+                    if r.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+                        raise requests.HTTPError(f"HTTP {r.status_code}", response=r)
+                    r.raise_for_status()
+
+                    # alguns servidores mandam CSV como text/plain; ok
+                    out_dir.mkdir(parents=True, exist_ok=True)
+                    digest = hashlib.sha256()
+                    size = 0
+                    with open(tmp_path, "wb") as f:
+                        for chunk in r.iter_content(CHUNK_SIZE):
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                    # corpo truncado sem erro do urllib3: compara com o
+                    # Content-Length (sem compressão ele é o tamanho gravado)
+                    expected = r.headers.get("Content-Length")
+                    if (
+                        expected is not None
+                        and "Content-Encoding" not in r.headers
+                        and size != int(expected)
+                    ):
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"{url}: {size} de {expected} bytes recebidos"
+                        )
+                    entry = {
+                        "path": file_path.as_posix(),
+                        "sha256": digest.hexdigest(),
+                        "size": size,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                        "changed": True,
+                        "status": r.status_code,
+                    }
+
+                if previous and previous.get("sha256") == entry["sha256"]:
+                    # idêntico à partição anterior: não guarda cópia duplicada
+                    return {**entry, "path": previous["path"], "changed": False}
+                tmp_path.replace(file_path)
+                return entry
+            except RETRY_ERRORS as e:
+                resp = getattr(e, "response", None)
+                retriable = resp is None or resp.status_code in RETRY_STATUS
+                if not retriable or attempt >= MAX_RETRIES:
+                    raise
+                # backoff exponencial com jitter
+                time.sleep(BACKOFF * 2**attempt + random.uniform(0, BACKOFF))
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        if own_session:
+            s.close()
 
-    # baixa por UF
-    ok, fail = [], []
-    for uf in UFS:
+
+def download_all(
+    ufs: list[str],
+    root: Path,
+    workers: int = MAX_WORKERS,
+    rate_per_host: float = RATE_PER_HOST,
+    base: str = BASE,
+    timeout: int = 60,
+    previous: dict | None = None,
+) -> list[dict]:
+    """Baixa as UFs em paralelo com uma sessão compartilhada.
+
+    Devolve, na ordem de `ufs`, um dict por UF com a entrada do manifest,
+    bytes transferidos, segundos e erro. `previous` é o dict UF -> entrada do
+    último manifest (para requisições condicionais / deduplicação).
+    """
+    limiter = HostRateLimiter(rate_per_host)
+    previous = previous or {}
+
+    def one(uf: str) -> dict:
+        t0 = time.perf_counter()
         try:
-            path = download_csv(uf, root / f"UF={uf}")
-            ok.append((uf, path))
-            time.sleep(0.3)  # gentileza com o servidor
+            entry = download_csv(
+                uf,
+                root / f"UF={uf}",
+                timeout,
+                session=s,
+                limiter=limiter,
+                base=base,
+                previous=previous.get(uf),
+            )
+            return {
+                "uf": uf,
+                "entry": entry,
+                "bytes": 0 if entry["status"] == 304 else entry["size"],
+                "seconds": time.perf_counter() - t0,
+                "error": None,
+            }
         except Exception as e:
-            fail.append((uf, str(e)))
+            return {
+                "uf": uf,
+                "entry": None,
+                "bytes": 0,
+                "seconds": time.perf_counter() - t0,
+                "error": str(e),
+            }
+
+    with make_session(workers) as s, ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(one, ufs))
+
+
+def write_manifest(root: Path, dt: str, results: list[dict]) -> Path:
+    files = {}
+    for r in results:
+        if r["entry"] is not None:
+            files[r["uf"]] = {k: v for k, v in r["entry"].items() if k != "status"}
+        else:
+            files[r["uf"]] = {"path": None, "changed": None, "error": r["error"]}
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / MANIFEST_NAME
+    path.write_text(
+        json.dumps({"dt": dt, "files": files}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    return path
+
+
+def main():
+    dt = datetime.now().strftime("%Y-%m-%d")
+    root = DATA_DIR / f"dt={dt}"
+
+    # baixa geral (opcional) + por UF
+    t0 = time.perf_counter()
+    results = download_all(["geral"] + UFS, root, previous=load_previous_manifest(dt))
+    write_manifest(root, dt, results)
+
+    ok = [r for r in results if r["error"] is None]
+    fail = [r for r in results if r["error"] is not None]
+    for r in results:
+        if r["error"] is not None:
+            status = "FAIL"
+        else:
+            status = "NEW " if r["entry"]["changed"] else "SAME"
+        print(f"{status} {r['uf']:<5} {r['bytes']:>10} bytes {r['seconds']:6.2f}s")
 
-    print(f"OK: {len(ok)} | FAIL: {len(fail)}")
+    total = sum(r["bytes"] for r in ok)
+    same = sum(1 for r in ok if not r["entry"]["changed"])
+    print(
+        f"OK: {len(ok)} (sem mudança: {same}) | FAIL: {len(fail)} | "
+        f"{total} bytes em {time.perf_counter() - t0:.2f}s"
+    )
     if fail:
-        for uf, err in fail:
-            print("FAIL", uf, err)
+        for r in fail:
+            print("FAIL", r["uf"], r["error"])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
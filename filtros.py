@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Índice dos filtros da sidebar do app.py, montado uma vez por versão dos dados
+# (ingest_version): códigos categóricos + posições por valor, arrays ordenados
+# para as faixas numéricas e tabelas de contagem para a cascata cidade→bairro.
+# Um rerun só combina essas estruturas, sem varrer/copiar o DataFrame.
+CATEGORICAL_COLS = ["Modalidade de venda", "UF", "Cidade", "Bairro", "Tipo"]
+RANGE_COLS = ["Preço_num", "Quartos"]
+
+
+class FilterIndex:
+    """Índice de um DataFrame fixo (imóveis ou facetas com peso `n`).
+
+    `rows()` aplica os mesmos filtros de app.apply_filters e devolve as
+    posições das linhas selecionadas (None = todas).
+    """
+
+    def __init__(self, df: pd.DataFrame, weight_col: str | None = None):
+        self.n = len(df)
+        self.weights = (
+            np.ones(self.n, dtype=np.int64)
+            if weight_col is None
+            else df[weight_col].to_numpy(dtype=np.int64)
+        )
+
+        # categóricas: códigos por linha (-1 = nulo), valores ordenados e as
+        # posições de cada valor contíguas em `order` (início em `starts`)
+        self.codes, self.values, self.order, self.starts = {}, {}, {}, {}
+        self.counts = {}
+        for col in CATEGORICAL_COLS:
+            if col not in df.columns:
+                continue
+            codes, values = pd.factorize(df[col], sort=True)
+            codes = codes.astype(np.int32)
+            order = np.argsort(codes, kind="stable")
+            self.codes[col] = codes
+            self.values[col] = pd.Index(values)
+            self.order[col] = order
+            self.starts[col] = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            valid = codes >= 0
+            self.counts[col] = np.bincount(
+                codes[valid], weights=self.weights[valid], minlength=len(values)
+            ).astype(np.int64)
+
+        # faixas: valores ordenados (NaN no fim) + posições nessa ordem
+        self.sorted, self.sorted_pos = {}, {}
+        for col in RANGE_COLS:
+            if col not in df.columns:
+                continue
+            vals = pd.to_numeric(df[col], errors="coerce").to_numpy(
+                dtype=float, na_value=np.nan
+            )
+            order = np.argsort(vals, kind="stable")
+            self.sorted[col] = vals[order]
+            self.sorted_pos[col] = order
+
+        # limites da sidebar (facetas trazem min/max por grupo)
+        lo = df.get("Preço_min", df.get("Preço_num"))
+        hi = df.get("Preço_max", df.get("Preço_num"))
+        self.price_bounds = None
+        if lo is not None and lo.notna().any():
+            self.price_bounds = (float(lo.min()), float(hi.max()))
+        self.quartos_max = None
+        if "Quartos" in df.columns and df["Quartos"].notna().any():
+            self.quartos_max = int(df["Quartos"].max())
+
+        # cascata cidade→bairro: peso por par (cidade, bairro)
+        self.cidade_bairro = None
+        if "Cidade" in self.codes and "Bairro" in self.codes:
+            pairs = pd.DataFrame(
+                {
+                    "cidade": self.codes["Cidade"],
+                    "bairro": self.codes["Bairro"],
+                    "n": self.weights,
+                }
+            )
+            pairs = pairs[(pairs["cidade"] >= 0) & (pairs["bairro"] >= 0)]
+            grouped = pairs.groupby(["cidade", "bairro"])["n"].sum()
+            self.cidade_bairro = grouped.reset_index()
+
+    # -------------------------
+    # opções da sidebar
+    # -------------------------
+    def options(self, col: str) -> list[str]:
+        if col not in self.values:
+            return []
+        return [v for v in self.values[col] if str(v).strip()]
+
+    def option_counts(self, col: str) -> dict[str, int]:
+        return dict(zip(self.values[col], self.counts[col].tolist()))
+
+    def value_counts(self, col: str, rows: np.ndarray | None = None) -> pd.Series:
+        """Peso por valor de `col` nas linhas `rows` (todas se None)."""
+        codes = self.codes[col] if rows is None else self.codes[col][rows]
+        weights = self.weights if rows is None else self.weights[rows]
+        valid = codes >= 0
+        counts = np.bincount(
+            codes[valid], weights=weights[valid], minlength=len(self.values[col])
+        ).astype(np.int64)
+        return pd.Series(counts, index=self.values[col]).loc[lambda s: s > 0]
+
+    def bairros(self, cidades: list[str]) -> dict[str, int]:
+        """Bairros (com contagem) das cidades escolhidas; todas se vazio."""
+        if self.cidade_bairro is None:
+            return {}
+        pairs = self.cidade_bairro
+        if cidades:
+            sel = self.values["Cidade"].get_indexer(cidades)
+            pairs = pairs[pairs["cidade"].isin(sel[sel >= 0])]
+        counts = pairs.groupby("bairro")["n"].sum()
+        labels = self.values["Bairro"][counts.index]
+        return {b: int(c) for b, c in zip(labels, counts.to_numpy()) if str(b).strip()}
+
+    # -------------------------
+    # filtros
+    # -------------------------
+    def _positions(self, col: str, code: int) -> np.ndarray:
+        starts = self.starts[col]
+        return self.order[col][starts[code] : starts[code + 1]]
+
+    def value_mask(self, col: str, selected: list[str]) -> np.ndarray | None:
+        # None quando a seleção não exclui nada (todos os valores, sem nulos)
+        values, starts = self.values[col], self.starts[col]
+        codes = values.get_indexer(selected)
+        codes = np.unique(codes[codes >= 0])
+        if len(codes) == len(values) and starts[0] == 0:
+            return None
+        n_sel = int((starts[codes + 1] - starts[codes]).sum())
+        if n_sel * 8 < self.n:
+            # seleção pequena: marca só as posições dos valores escolhidos
+            mask = np.zeros(self.n, dtype=bool)
+            for code in codes:
+                mask[self._positions(col, code)] = True
+            return mask
+        lut = np.zeros(len(values) + 1, dtype=bool)  # último = nulo (-1)
+        lut[codes] = True
+        return lut[self.codes[col]]
+
+    def range_mask(self, col: str, lo=None, hi=None) -> np.ndarray | None:
+        vals = self.sorted[col]
+        start = 0 if lo is None else np.searchsorted(vals, lo, side="left")
+        valid = len(vals) - int(np.isnan(vals).sum())
+        end = valid if hi is None else np.searchsorted(vals[:valid], hi, side="right")
+        if start == 0 and end == len(vals):
+            return None
+        mask = np.zeros(self.n, dtype=bool)
+        mask[self.sorted_pos[col][start:end]] = True
+        return mask
+
+    def rows(
+        self,
+        mod_sel: list[str],
+        uf_sel: list[str],
+        cidade_sel: list[str],
+        bairro_sel: list[str],
+        preco_min,
+        preco_max,
+        tipo_sel: list[str],
+        quartos_min: int,
+    ) -> np.ndarray | None:
+        masks = []
+        for col, sel in [
+            ("Tipo", tipo_sel),
+            ("Modalidade de venda", mod_sel),
+            ("UF", uf_sel),
+            ("Cidade", cidade_sel),
+            ("Bairro", bairro_sel),
+        ]:
+            if sel and col in self.codes:
+                masks.append(self.value_mask(col, sel))
+        if quartos_min and "Quartos" in self.sorted:
+            masks.append(self.range_mask("Quartos", lo=quartos_min))
+        if preco_min is not None and "Preço_num" in self.sorted:
+            masks.append(self.range_mask("Preço_num", preco_min, preco_max))
+
+        masks = [m for m in masks if m is not None]
+        if not masks:
+            return None
+        mask = masks[0]
+        for m in masks[1:]:
+            mask = mask & m
+        return np.flatnonzero(mask)
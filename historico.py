@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+from ingest import LAKE_DIR, LAKE_FILE_NAME, LAKE_MANIFEST_NAME
+
+# Consultas de histórico (várias datas) com DuckDB, sem Postgres nem rede.
+# O lake Parquet do compacta.py (um arquivo por dt/UF) é carregado, dia a dia,
+# num banco DuckDB local; na carga cada linha já recebe o preço/dt anterior do
+# imóvel (via `ultimo`, uma linha por imóvel), então séries e "janelas" viram
+# varreduras simples. As funções recebem a conexão de connect() e devolvem
+# DataFrames.
+HISTORICO_DB = LAKE_DIR / "historico.duckdb"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS imoveis (
+        dt DATE,
+        uf VARCHAR,
+        numero_imovel VARCHAR,
+        cidade VARCHAR,
+        bairro VARCHAR,
+        modalidade VARCHAR,
+        tipo VARCHAR,
+        preco DOUBLE,
+        valor_avaliacao DOUBLE,
+        desconto DOUBLE,
+        area_total DOUBLE,
+        area_privativa DOUBLE,
+        area_terreno DOUBLE,
+        quartos SMALLINT,
+        vagas SMALLINT,
+        preco_anterior DOUBLE,
+        dt_anterior DATE
+    );
+    CREATE TABLE IF NOT EXISTS ultimo (
+        uf VARCHAR,
+        numero_imovel VARCHAR,
+        first_seen DATE,
+        last_seen DATE,
+        snapshots INTEGER,
+        preco_inicial DOUBLE,
+        preco_atual DOUBLE,
+        PRIMARY KEY (uf, numero_imovel)
+    );
+    CREATE TABLE IF NOT EXISTS carregados (dt DATE PRIMARY KEY, assinatura VARCHAR);
+"""
+
+# Colunas do lake (texto do CSV + tipadas) com os nomes do Postgres
+LAKE_COLS = """
+    "UF" AS uf,
+    "Nº do imóvel" AS numero_imovel,
+    "Cidade" AS cidade,
+    "Bairro" AS bairro,
+    "Modalidade de venda" AS modalidade,
+    tipo,
+    preco,
+    valor_avaliacao,
+    desconto_num AS desconto,
+    area_total,
+    area_privativa,
+    area_terreno,
+    quartos,
+    vagas
+"""
+
+
+def _sql_list(paths: list[Path]) -> str:
+    quoted = ("'" + p.as_posix().replace("'", "''") + "'" for p in paths)
+    return "[" + ", ".join(quoted) + "]"
+
+
+def lake_partitions(lake_dir: Path = LAKE_DIR) -> dict[str, str]:
+    # dt -> assinatura do manifest (muda se algum CSV de origem mudar)
+    out = {}
+    for manifest in sorted(lake_dir.glob(f"dt=*/{LAKE_MANIFEST_NAME}")):
+        m = json.loads(manifest.read_text(encoding="utf-8"))
+        files = {uf: e["sha256"] for uf, e in m["files"].items()}
+        dt = manifest.parent.name.removeprefix("dt=")
+        out[dt] = json.dumps([m.get("version"), files], sort_keys=True)
+    return out
+
+
+def day_scan(day_dir: Path, dt: str) -> str:
+    """SELECT das linhas de um dt no lake.
+
+    Arquivos por UF têm precedência; do geral só entram imóveis que não
+    vieram no arquivo da própria UF (mesma regra do ingest).
+    """
+    files = sorted(day_dir.glob(f"UF=*/{LAKE_FILE_NAME}"))
+    by_uf = [f for f in files if f.parent.name != "UF=geral"]
+    geral = [f for f in files if f.parent.name == "UF=geral"]
+
+    def scan(paths: list[Path]) -> str:
+        # hive_partitioning desligado: o UF=geral do caminho não pode
+        # sobrescrever a coluna UF das linhas
+        return f"""
+            SELECT DATE '{dt}' AS dt, {LAKE_COLS}
+            FROM read_parquet({_sql_list(paths)}, hive_partitioning = false,
+                              union_by_name = true)
+        """
+
+    if not geral:
+        return scan(by_uf)
+    if not by_uf:
+        return scan(geral)
+    return f"""
+        WITH por_uf AS ({scan(by_uf)})
+        SELECT * FROM por_uf
+        UNION ALL
+        SELECT * FROM ({scan(geral)}) g
+        WHERE NOT EXISTS (
+            SELECT 1 FROM por_uf p
+            WHERE p.uf = g.uf AND p.numero_imovel = g.numero_imovel
+        )
+    """
+
+
+def load_day(con: duckdb.DuckDBPyConnection, dt: str, lake_dir: Path = LAKE_DIR):
+    # só vale para dt posterior a tudo que já foi carregado (ordem de `ultimo`)
+    con.execute(
+        f"""
+        INSERT INTO imoveis
+        SELECT n.*, u.preco_atual, u.last_seen
+        FROM ({day_scan(lake_dir / f"dt={dt}", dt)}) n
+        LEFT JOIN ultimo u USING (uf, numero_imovel)
+    """
+    )
+    con.execute(
+        """
+        INSERT INTO ultimo
+        SELECT uf, numero_imovel, dt, dt, 1, preco, preco
+        FROM imoveis WHERE dt = ?
+        ON CONFLICT (uf, numero_imovel) DO UPDATE SET
+            last_seen = EXCLUDED.last_seen,
+            snapshots = snapshots + 1,
+            preco_atual = EXCLUDED.preco_atual
+    """,
+        [dt],
+    )
+
+
+def refresh(con: duckdb.DuckDBPyConnection, lake_dir: Path = LAKE_DIR) -> int:
+    """Carrega no banco os dt novos do lake; devolve quantos dt foram carregados.
+
+    Dias novos no fim da série são só anexados. Se um dt já carregado mudou,
+    sumiu do lake ou chegou um dt anterior ao último, recarrega tudo.
+    """
+    con.execute(SCHEMA)
+    lake = lake_partitions(lake_dir)
+    loaded = {
+        str(dt): sig for dt, sig in con.execute("SELECT * FROM carregados").fetchall()
+    }
+    pending = sorted(dt for dt, sig in lake.items() if loaded.get(dt) != sig)
+    if not pending and loaded.keys() <= lake.keys():
+        return 0
+
+    if not loaded.keys() <= lake.keys() or (loaded and pending[0] <= max(loaded)):
+        con.execute("DELETE FROM imoveis; DELETE FROM ultimo; DELETE FROM carregados")
+        pending = sorted(lake)
+
+    for dt in pending:
+        con.execute("BEGIN")
+        load_day(con, dt, lake_dir)
+        con.execute("INSERT INTO carregados VALUES (?, ?)", [dt, lake[dt]])
+        con.execute("COMMIT")
+    return len(pending)
+
+
+def connect(
+    db_path: Path | None = HISTORICO_DB, lake_dir: Path = LAKE_DIR
+) -> duckdb.DuckDBPyConnection:
+    """Abre (ou cria) o banco do histórico e traz os dt novos do lake.
+
+    `db_path=None` usa um banco em memória (recarrega tudo a cada conexão).
+    """
+    if not any(lake_dir.glob(f"dt=*/{LAKE_MANIFEST_NAME}")):
+        raise FileNotFoundError(
+            f"Nenhum Parquet em {lake_dir}; rode `python compacta.py --all`"
+        )
+    con = duckdb.connect(":memory:" if db_path is None else str(db_path))
+    refresh(con, lake_dir)
+    return con
+
+
+def connect_readonly(db_path: Path = HISTORICO_DB) -> duckdb.DuckDBPyConnection:
+    """Abre o banco já carregado só para leitura, sem refresh (uso do viewer).
+
+    O DuckDB trava o arquivo: quem lê deve abrir, consultar e fechar, para o
+    refresh (`python historico.py` ou `compacta.py --historico`) conseguir
+    gravar entre uma consulta e outra.
+    """
+    if not db_path.exists():
+        raise FileNotFoundError(f"{db_path} não existe; rode `python historico.py`")
+    return duckdb.connect(str(db_path), read_only=True)
+
+
+def available_dates(con: duckdb.DuckDBPyConnection) -> list:
+    return [
+        r[0] for r in con.execute("SELECT dt FROM carregados ORDER BY dt").fetchall()
+    ]
+
+
+def price_history(
+    con: duckdb.DuckDBPyConnection, uf: str, numero_imovel: str
+) -> pd.DataFrame:
+    """Preço, avaliação e desconto do imóvel em cada dt em que apareceu."""
+    return con.execute(
+        """
+        SELECT
+            dt,
+            preco,
+            valor_avaliacao,
+            desconto,
+            modalidade,
+            preco - preco_anterior AS variacao
+        FROM imoveis
+        WHERE uf = ? AND numero_imovel = ?
+        ORDER BY dt
+    """,
+        [uf, numero_imovel],
+    ).df()
+
+
+def time_on_market(
+    con: duckdb.DuckDBPyConnection, uf: str | None = None, only_current: bool = True
+) -> pd.DataFrame:
+    """Primeira/última data vista, dias no mercado e preço inicial x atual.
+
+    Com `only_current`, só imóveis presentes na data mais recente carregada.
+    """
+    return con.execute(
+        """
+        SELECT
+            uf,
+            numero_imovel,
+            first_seen,
+            last_seen,
+            date_diff('day', first_seen, last_seen) AS dias_no_mercado,
+            snapshots,
+            preco_inicial,
+            preco_atual
+        FROM ultimo
+        WHERE (? IS NULL OR uf = ?)
+          AND (NOT ? OR last_seen = (SELECT max(dt) FROM carregados))
+        ORDER BY dias_no_mercado DESC, uf, numero_imovel
+    """,
+        [uf, uf, only_current],
+    ).df()
+
+
+def price_drops_by_day(
+    con: duckdb.DuckDBPyConnection, uf: str | None = None
+) -> pd.DataFrame:
+    """Por dt e UF: quantos imóveis baixaram/subiram de preço desde a última
+    vez em que apareceram, e a queda média."""
+    return con.execute(
+        """
+        SELECT
+            dt,
+            uf,
+            count(*) FILTER (WHERE preco < preco_anterior) AS quedas,
+            count(*) FILTER (WHERE preco > preco_anterior) AS altas,
+            avg(1 - preco / preco_anterior) FILTER (WHERE preco < preco_anterior)
+                AS queda_media_pct
+        FROM imoveis
+        WHERE ? IS NULL OR uf = ?
+        GROUP BY dt, uf
+        ORDER BY dt, uf
+    """,
+        [uf, uf],
+    ).df()
+
+
+def listings_by_day(
+    con: duckdb.DuckDBPyConnection, uf: str | None = None
+) -> pd.DataFrame:
+    """Série diária por UF: imóveis listados, entradas, preço mediano e
+    desconto médio."""
+    return con.execute(
+        """
+        SELECT
+            dt,
+            uf,
+            count(*) AS imoveis,
+            count(*) FILTER (WHERE dt_anterior IS NULL) AS novos,
+            median(preco) AS preco_mediano,
+            avg(desconto) AS desconto_medio
+        FROM imoveis
+        WHERE ? IS NULL OR uf = ?
+        GROUP BY dt, uf
+        ORDER BY dt, uf
+    """,
+        [uf, uf],
+    ).df()
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description=f"Atualiza {HISTORICO_DB} com os dt novos de {LAKE_DIR}"
+    )
+    ap.add_argument("--db", type=Path, default=HISTORICO_DB)
+    ap.add_argument("--lake", type=Path, default=LAKE_DIR)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    con = connect(args.db, args.lake)
+    summary = {
+        "loaded_dts": len(available_dates(con)),
+        "rows": con.execute("SELECT count(*) FROM imoveis").fetchone()[0],
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    print(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,30 @@
 from __future__ import annotations
 
+import argparse
 import hashlib
 import io
 import json
+import logging
 import os
 import re
-from datetime import datetime, timedelta
+import shutil
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
 from psycopg2.extras import execute_values
 
+import etapas
+import memoria
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
@@ -20,6 +32,17 @@ load_dotenv()
 # CONFIG
 # =============================
 BASE_DIR = Path("data") / "caixa"
+MANIFEST_NAME = "manifest.json"  # gravado pelo extrai.py em cada dt=*
+# UFs com lista própria na Caixa (as mesmas que o extrai.py baixa)
+UFS = (
+    "AC AL AM AP BA CE DF ES GO MA MG MS MT PA PB PE PI PR RJ RN RO RR RS SC SE SP TO"
+).split()
+
+# Cópia colunar dos CSVs (compacta.py): LAKE_DIR/dt=*/UF=*/part-0.parquet
+LAKE_DIR = Path("data") / "lake"
+LAKE_FILE_NAME = "part-0.parquet"
+LAKE_MANIFEST_NAME = "_manifest.json"
+LAKE_VERSION = 2  # muda quando o layout dos arquivos muda (força recompactar)
 
 KEY = "Nº do imóvel"
 
@@ -46,14 +69,213 @@ PREFERRED_COLS = [
     "Link de acesso",
 ]
 
+# Modo do fingerprint: "md5" (padrão, compatível com o histórico) ou "fast"
+# (hash não criptográfico vetorizado; valores gravados com prefixo de versão)
+FP_MODE = os.getenv("FP_MODE", "md5")
+FP_FAST_PREFIX = "h1:"
+
+# Campos materializados como colunas tipadas de current_imoveis (campo -> coluna)
+TYPED_NUMERIC_COLS = {
+    "Preço": "preco",
+    "Valor de avaliação": "valor_avaliacao",
+    "Desconto": "desconto",
+}
+TYPED_TEXT_COLS = {
+    "Cidade": "cidade",
+    "Bairro": "bairro",
+    "Modalidade de venda": "modalidade",
+}
+# Extraídos do texto livre da Descrição ("Casa, 0.00 de área total, ...")
+DESCRICAO_COLS = [
+    "tipo",
+    "area_total",
+    "area_privativa",
+    "area_terreno",
+    "quartos",
+    "vagas",
+]
+TYPED_COLS = [
+    *TYPED_NUMERIC_COLS.values(),
+    *TYPED_TEXT_COLS.values(),
+    *DESCRICAO_COLS,
+]
 
-def get_db_connection():
+SNAPSHOT_COLS = ["dt", "uf", "numero_imovel", "payload_json", "fp", "source_file"]
+CURRENT_COLS = [
+    "uf",
+    "numero_imovel",
+    "payload_json",
+    "fp",
+    "last_seen",
+    "source_file",
+    *TYPED_COLS,
+]
+CHANGES_COLS = [
+    "dt",
+    "uf",
+    "tipo_evento",
+    "numero_imovel",
+    "changed_fields",
+    "before_json",
+    "after_json",
+]
+
+# Estado do ingest por (dt, UF): hash do arquivo de origem, usado pelo modo
+# incremental para pular UFs cujo CSV não mudou desde o dia anterior
+INGEST_STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS ingest_state (
+        dt DATE,
+        uf VARCHAR(10),
+        source_sha256 VARCHAR(64),
+        fp_mode VARCHAR(10),
+        source_file TEXT,
+        ingested_at TIMESTAMP DEFAULT now(),
+        PRIMARY KEY (dt, uf)
+    )
+"""
+
+# Versão do ingest: cada ingest_day grava uma linha (publicada no commit) e
+# marca com ela as linhas de current_imoveis que gravou; as removidas ficam em
+# current_removed. O app recarrega só o que mudou desde a versão em cache.
+INGEST_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS ingest_versions (
+        version BIGSERIAL PRIMARY KEY,
+        dt DATE,
+        ingested_at TIMESTAMP DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS current_removed (
+        version BIGINT,
+        uf VARCHAR(10),
+        numero_imovel VARCHAR(50)
+    );
+    CREATE INDEX IF NOT EXISTS idx_current_removed_version
+        ON current_removed (version);
+"""
+# Trava (pg_advisory_xact_lock) que serializa os ingests: versões são
+# publicadas na ordem em que foram alocadas
+INGEST_LOCK_ID = 7_140_001
+
+# Colunas tipadas + índices dos filtros/ordenações usados pelo app e pela API
+CURRENT_TYPED_DDL = """
+    ALTER TABLE current_imoveis
+        ADD COLUMN IF NOT EXISTS preco NUMERIC,
+        ADD COLUMN IF NOT EXISTS valor_avaliacao NUMERIC,
+        ADD COLUMN IF NOT EXISTS desconto NUMERIC,
+        ADD COLUMN IF NOT EXISTS cidade TEXT,
+        ADD COLUMN IF NOT EXISTS bairro TEXT,
+        ADD COLUMN IF NOT EXISTS modalidade TEXT,
+        ADD COLUMN IF NOT EXISTS tipo TEXT,
+        ADD COLUMN IF NOT EXISTS area_total NUMERIC,
+        ADD COLUMN IF NOT EXISTS area_privativa NUMERIC,
+        ADD COLUMN IF NOT EXISTS area_terreno NUMERIC,
+        ADD COLUMN IF NOT EXISTS quartos SMALLINT,
+        ADD COLUMN IF NOT EXISTS vagas SMALLINT,
+        ADD COLUMN IF NOT EXISTS ingest_version BIGINT;
+    CREATE INDEX IF NOT EXISTS idx_current_ingest_version
+        ON current_imoveis (ingest_version);
+    CREATE INDEX IF NOT EXISTS idx_current_uf_cidade_bairro
+        ON current_imoveis (uf, cidade, bairro);
+    CREATE INDEX IF NOT EXISTS idx_current_cidade_bairro
+        ON current_imoveis (cidade, bairro);
+    CREATE INDEX IF NOT EXISTS idx_current_modalidade ON current_imoveis (modalidade);
+    CREATE INDEX IF NOT EXISTS idx_current_preco ON current_imoveis (preco);
+    CREATE INDEX IF NOT EXISTS idx_current_uf_preco ON current_imoveis (uf, preco);
+    CREATE INDEX IF NOT EXISTS idx_current_tipo_quartos
+        ON current_imoveis (tipo, quartos);
+    CREATE INDEX IF NOT EXISTS idx_current_area_privativa
+        ON current_imoveis (area_privativa);
+"""
+
+# Histórico em snapshot_imoveis: "full" grava o catálogo inteiro todo dia;
+# "delta" grava o catálogo inteiro só nos checkpoints (a cada
+# SNAPSHOT_CHECKPOINT_DAYS dias, ou quando o dia anterior não foi ingerido) e,
+# nos outros dias, só as linhas do diff em snapshot_deltas. as_of() remonta
+# qualquer dia nos dois modos.
+SNAPSHOT_MODE = os.getenv("SNAPSHOT_MODE", "full")
+SNAPSHOT_CHECKPOINT_DAYS = int(os.getenv("SNAPSHOT_CHECKPOINT_DAYS", "7"))
+
+# Tabelas do histórico por dt (colunas de setup_db.js) e seus índices.
+# snapshot_deltas: ENTER/UPDATE com o payload novo, EXIT com payload NULL.
+HISTORY_TABLES = {
+    "snapshot_imoveis": """
+        dt DATE NOT NULL,
+        uf VARCHAR(10),
+        numero_imovel VARCHAR(50),
+        payload_json JSONB,
+        fp VARCHAR(100),
+        source_file TEXT
+    """,
+    "snapshot_deltas": """
+        dt DATE NOT NULL,
+        uf VARCHAR(10),
+        numero_imovel VARCHAR(50),
+        payload_json JSONB,
+        fp VARCHAR(100),
+        source_file TEXT
+    """,
+    "changes": """
+        dt DATE NOT NULL,
+        uf VARCHAR(10),
+        tipo_evento VARCHAR(50),
+        numero_imovel VARCHAR(50),
+        changed_fields TEXT,
+        before_json JSONB,
+        after_json JSONB
+    """,
+}
+HISTORY_INDEXES = {
+    "snapshot_imoveis": [
+        "CREATE INDEX IF NOT EXISTS idx_snapshot_dt ON snapshot_imoveis (dt)",
+        "CREATE INDEX IF NOT EXISTS idx_snapshot_uf_num "
+        "ON snapshot_imoveis (uf, numero_imovel)",
+    ],
+    "snapshot_deltas": [
+        "CREATE INDEX IF NOT EXISTS idx_snapshot_deltas_dt ON snapshot_deltas (dt)"
+    ],
+    "changes": ["CREATE INDEX IF NOT EXISTS idx_changes_dt ON changes (dt)"],
+}
+# snapshot_days: dias ingeridos e se o dia é checkpoint (vazia, é preenchida
+# com os dias já gravados em snapshot_imoveis, todos completos)
+SNAPSHOT_DAYS_DDL = """
+    CREATE TABLE IF NOT EXISTS snapshot_days (
+        dt DATE PRIMARY KEY,
+        checkpoint BOOLEAN NOT NULL
+    )
+"""
+
+# Tabelas do histórico particionadas por dt (RANGE), convertidas com
+# `ingest.py --partitions`: o ingest cria uma partição por dia e o reingest
+# de um dia só faz TRUNCATE dela. A política de `--partitions` junta os dias
+# de meses encerrados há mais de PARTITION_ROLLUP_DAYS numa partição mensal e,
+# com PARTITION_RETENTION_DAYS > 0, desanexa as partições mais antigas que
+# isso para o schema ARCHIVE_SCHEMA (fora das consultas, sem apagar nada).
+PARTITION_ROLLUP_DAYS = int(os.getenv("PARTITION_ROLLUP_DAYS", "62"))
+PARTITION_RETENTION_DAYS = int(os.getenv("PARTITION_RETENTION_DAYS", "0"))
+ARCHIVE_SCHEMA = "arquivo"
+PARTITION_BOUND_RE = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+# Carga no Postgres: "copy" (COPY FROM STDIN) ou "values" (execute_values)
+LOAD_MODE = os.getenv("LOAD_MODE", "copy")
+COPY_CHUNK_ROWS = 5_000
+
+# Processos para o parse por UF (0 = um por CPU, 1 = sem pool)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))
+
+# Ingest em streaming (padrão): cada arquivo (UF) passa sozinho por parse ->
+# fingerprint -> diff -> carga, então o pico de memória é o da maior UF e não o
+# do catálogo inteiro (com o arquivo geral, mais o geral inteiro, ver
+# day_batches). INGEST_STREAM=0 volta ao lote único (o dia inteiro num
+# DataFrame; "stream_off" no resumo).
+INGEST_STREAM = os.getenv("INGEST_STREAM", "1") != "0"
+
+
+def get_db_connection(database: str | None = None):
     return psycopg2.connect(
         host=os.getenv("host"),
         port=os.getenv("port"),
         user=os.getenv("user", "").replace('"', ""),
         password=os.getenv("password", "").replace('"', ""),
-        database=os.getenv("database", "db_leiloes").replace('"', ""),
+        database=database or os.getenv("database", "db_leiloes").replace('"', ""),
         sslmode=os.getenv("sslmode", "disable"),
     )
 
@@ -81,6 +303,14 @@ HEADER_MARKERS = [
 ]
 
 
+# Ordem de tentativa (utf-8-sig cobre utf-8 com e sem BOM)
+CSV_ENCODINGS = ("utf-8-sig", "cp1252", "latin1")
+
+EOL_RE = re.compile(rb"\r\n|\r|\n")
+
+EMPTY_VALUES = frozenset(("", "nan", "None"))
+
+
 def decode_bytes(raw: bytes) -> str:
     for enc in ("utf-8-sig", "utf-8", "cp1252", "latin1"):
         try:
@@ -90,42 +320,52 @@ def decode_bytes(raw: bytes) -> str:
     return raw.decode("latin1", errors="replace")
 
 
+def header_score(line: str) -> int:
+    low = line.lower()
+    return sum(1 for m in HEADER_MARKERS if m.lower() in low)
+
+
 def find_header_line_index(lines: list[str]) -> int:
     for i, line in enumerate(lines):
-        score = 0
-        low = line.lower()
-        for m in HEADER_MARKERS:
-            if m.lower() in low:
-                score += 1
-        if score >= 3:
+        if header_score(line) >= 3:
             return i
     return -1
 
 
-def parse_caixa_csv_text(text: str) -> pd.DataFrame:
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    lines = text.split("\n")
-    header_idx = find_header_line_index(lines)
-    if header_idx == -1:
-        raise ValueError("Não encontrei a linha de cabeçalho (colunas).")
+def find_header_offset(raw: bytes, encoding: str) -> int:
+    # Varre linha a linha só até o cabeçalho (sem dividir o arquivo inteiro).
+    # Cada linha lida é decodificada, então erro de encoding aparece aqui.
+    pos, n = 0, len(raw)
+    while pos <= n:
+        m = EOL_RE.search(raw, pos)
+        end = m.start() if m else n
+        if header_score(raw[pos:end].decode(encoding)) >= 3:
+            return pos
+        if not m:
+            break
+        pos = m.end()
+    return -1
 
-    csv_body = "\n".join(lines[header_idx:]).strip()
 
-    df = pd.read_csv(
-        io.StringIO(csv_body),
-        sep=";",
-        engine="python",
-        dtype=str,
-        skip_blank_lines=True,
+def clean_caixa_df(df: pd.DataFrame) -> pd.DataFrame:
+    cols = [str(c).strip() for c in df.columns]
+    keep = [i for i, c in enumerate(cols) if c and not re.fullmatch(r"\s*", c)]
+
+    # trim + vazios ("", "nan", "None") -> None numa única passada por todas as
+    # células (equivale ao astype(str).str.strip() coluna a coluna)
+    vals = df.iloc[:, keep].to_numpy(dtype=object)
+    cleaned = []
+    for v in vals.ravel():
+        t = (v if isinstance(v, str) else str(v)).strip()
+        cleaned.append(None if t in EMPTY_VALUES else t)
+    return pd.DataFrame(
+        np.array(cleaned, dtype=object).reshape(vals.shape),
+        index=df.index,
+        columns=[cols[i] for i in keep],
     )
 
-    df.columns = [str(c).strip() for c in df.columns]
-    df = df.loc[:, [c for c in df.columns if c and not re.fullmatch(r"\s*", str(c))]]
-
-    for c in df.columns:
-        df[c] = df[c].astype(str).str.strip()
-        df.loc[df[c].isin(["nan", "None", ""]), c] = None
 
+def rename_caixa_columns(df: pd.DataFrame) -> pd.DataFrame:
     # normaliza nomes (cobre Nº/N°/N etc)
     rename_map: dict[str, str] = {}
     for c in df.columns:
@@ -180,6 +420,48 @@ def parse_caixa_csv_text(text: str) -> pd.DataFrame:
     return df
 
 
+def parse_caixa_csv_text(text: str) -> pd.DataFrame:
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = text.split("\n")
+    header_idx = find_header_line_index(lines)
+    if header_idx == -1:
+        raise ValueError("Não encontrei a linha de cabeçalho (colunas).")
+
+    csv_body = "\n".join(lines[header_idx:]).strip()
+
+    df = pd.read_csv(
+        io.StringIO(csv_body),
+        sep=";",
+        dtype=str,
+        skip_blank_lines=True,
+    )
+    return rename_caixa_columns(clean_caixa_df(df))
+
+
+def parse_caixa_csv_bytes(raw: bytes) -> pd.DataFrame:
+    # Mesma escolha de encoding do decode_bytes, mas sem decodificar o arquivo
+    # inteiro antes: o corpo vai direto (a partir do cabeçalho) para o engine C,
+    # que decodifica em streaming; se falhar, tenta o próximo encoding.
+    for enc in CSV_ENCODINGS:
+        try:
+            offset = find_header_offset(raw, enc)
+            if offset == -1:
+                raise ValueError("Não encontrei a linha de cabeçalho (colunas).")
+            buf = io.BytesIO(raw)
+            buf.seek(offset)
+            df = pd.read_csv(
+                buf,
+                sep=";",
+                dtype=str,
+                skip_blank_lines=True,
+                encoding=enc,
+            )
+            break
+        except UnicodeDecodeError:
+            continue
+    return rename_caixa_columns(clean_caixa_df(df))
+
+
 # =============================
 # FINGERPRINT
 # =============================
@@ -192,10 +474,61 @@ def fingerprint_row(row: pd.Series) -> str:
     return hashlib.md5(raw).hexdigest()
 
 
+def fingerprint_mode(fp) -> str:
+    if isinstance(fp, str) and fp.startswith(FP_FAST_PREFIX):
+        return "fast"
+    return "md5"
+
+
+def hash_field_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Regras do fingerprint_row, por coluna: ausente/None -> "", resto str().strip()
+    parts = {}
+    for col in FIELDS_FOR_HASH:
+        if col not in df.columns:
+            parts[col] = pd.Series("", index=df.index, dtype=object)
+            continue
+        s = df[col].astype(object)
+        na = s.isna().to_numpy()
+        out = s.where(~na, "").astype(str).str.strip()
+        if na.any():
+            # None vira "", mas NaN/NA viram str(v) ("nan"), como no fingerprint_row
+            out[na] = ["" if v is None else str(v).strip() for v in s.to_numpy()[na]]
+        parts[col] = out
+    return pd.DataFrame(parts, index=df.index)
+
+
+def fingerprint_frame(df: pd.DataFrame, mode: str | None = None) -> pd.Series:
+    mode = mode or FP_MODE
+    parts = hash_field_frame(df)
+    if parts.empty:
+        return pd.Series([], index=df.index, dtype=object)
+
+    if mode == "fast":
+        hashes = pd.util.hash_pandas_object(
+            parts, index=False, categorize=False
+        ).to_numpy()
+        return pd.Series(
+            [f"{FP_FAST_PREFIX}{h:016x}" for h in hashes.tolist()],
+            index=df.index,
+            dtype=object,
+        )
+    if mode != "md5":
+        raise ValueError(f"FP_MODE inválido: {mode}")
+
+    first, *rest = FIELDS_FOR_HASH
+    joined = parts[first].str.cat([parts[c] for c in rest], sep="||")
+    md5 = hashlib.md5
+    return pd.Series(
+        [md5(x.encode("utf-8", errors="ignore")).hexdigest() for x in joined],
+        index=df.index,
+        dtype=object,
+    )
+
+
 def add_fingerprint(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
     df[KEY] = df[KEY].astype(str).str.replace(r"\s+", "", regex=True)
-    df["_fp"] = df.apply(fingerprint_row, axis=1)
+    df["_fp"] = fingerprint_frame(df)
     return df
 
 
@@ -210,11 +543,61 @@ def compute_changed_fields(before: dict, after: dict) -> list[str]:
 # =============================
 # IO
 # =============================
+def read_manifest(dt: str) -> dict | None:
+    path = BASE_DIR / f"dt={dt}" / MANIFEST_NAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
 def list_today_csvs(dt: str) -> list[Path]:
-    day_dir = BASE_DIR / f"dt={dt}"
-    if not day_dir.exists():
-        return []
-    return sorted(day_dir.glob("UF=*/Lista_imoveis_*.csv"))
+    # Com manifest, UFs sem mudança apontam para o arquivo da partição onde o
+    # conteúdo foi gravado (o extrai.py não duplica arquivos idênticos)
+    manifest = read_manifest(dt)
+    if manifest is not None:
+        files = manifest.get("files", {})
+        csvs = [
+            Path(files[uf]["path"])
+            for uf in sorted(files, key=lambda u: f"UF={u}")
+            if files[uf].get("path")
+        ]
+    else:
+        day_dir = BASE_DIR / f"dt={dt}"
+        if not day_dir.exists():
+            return []
+        csvs = sorted(day_dir.glob("UF=*/Lista_imoveis_*.csv"))
+
+    # As listas por UF têm precedência sobre o geral: do geral só entram
+    # imóveis ausentes do arquivo da própria UF. Com as 27 UFs baixadas ele é
+    # ignorado (sobraria só a diferença de horário entre as listas) e o dia
+    # segue no caminho por UF (incremental, streaming)
+    ufs = {uf_from_path(p) for p in csvs}
+    if ufs.issuperset(UFS):
+        csvs = [p for p in csvs if uf_from_path(p) != "geral"]
+    return csvs
+
+
+def source_hashes(dt: str, csvs: list[Path]) -> dict[str, str]:
+    # sha256 por UF: do manifest quando existir, senão calculado do arquivo
+    files = (read_manifest(dt) or {}).get("files", {})
+    out = {}
+    for p in csvs:
+        uf = uf_from_path(p)
+        entry = files.get(uf) or {}
+        if entry.get("sha256") and entry.get("path") == p.as_posix():
+            out[uf] = entry["sha256"]
+        else:
+            with open(p, "rb") as f:
+                out[uf] = hashlib.file_digest(f, "sha256").hexdigest()
+    return out
+
+
+def changed_ufs(dt: str) -> set[str] | None:
+    # UFs cujo arquivo mudou em relação à partição anterior (None = sem manifest)
+    manifest = read_manifest(dt)
+    if manifest is None:
+        return None
+    return {uf for uf, e in manifest.get("files", {}).items() if e.get("changed")}
 
 
 def uf_from_path(p: Path) -> str:
@@ -226,8 +609,7 @@ def uf_from_path(p: Path) -> str:
 
 
 def df_from_csv_file(csv_path: Path) -> pd.DataFrame:
-    text = decode_bytes(csv_path.read_bytes())
-    df = parse_caixa_csv_text(text)
+    df = parse_caixa_csv_bytes(csv_path.read_bytes())
 
     if "UF" not in df.columns or df["UF"].isna().all():
         df["UF"] = uf_from_path(csv_path)
@@ -257,21 +639,1071 @@ def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
 
 
 # =============================
-# MAIN
+# COLUNAS TIPADAS
 # =============================
-def ingest_day(dt: str) -> dict:
+DECIMAL_RE = r"-?\d+(?:\.\d+)?"
+
+
+def parse_decimal_ptbr(series: pd.Series) -> pd.Series:
+    """'1.234.567,89' -> '1234567.89' (texto exato para NUMERIC).
+
+    Valores sem vírgula já vêm com ponto decimal (o Desconto da Caixa é
+    '45.32') e são mantidos. O que não for número vira None.
+    """
+    s = series.astype("string").str.replace(r"[^\d,.\-]", "", regex=True)
+    ptbr = s.str.contains(",", regex=False, na=False)
+    s = s.mask(ptbr, s.str.replace(".", "", regex=False).str.replace(",", "."))
+    ok = s.str.fullmatch(DECIMAL_RE).fillna(False).astype(bool)
+    return s.astype(object).where(ok, None)
+
+
+# Um padrão por coluna de DESCRICAO_COLS (grupo 1 = valor)
+DESCRICAO_PATTERNS = {
+    "tipo": re.compile(r"^\s*([^,]*[^,\s])"),
+    "area_total": re.compile(r"(\d+(?:\.\d+)?) de [áa]rea total"),
+    "area_privativa": re.compile(r"(\d+(?:\.\d+)?) de [áa]rea privativa"),
+    "area_terreno": re.compile(r"(\d+(?:\.\d+)?) de [áa]rea do terreno"),
+    "quartos": re.compile(r"(\d+) qto\(s\)"),
+    "vagas": re.compile(r"(\d+) vaga\(s\)"),
+}
+DESCRICAO_AREAS = ("area_total", "area_privativa", "area_terreno")
+
+
+def descricao_columns(series: pd.Series) -> pd.DataFrame:
+    """Tipo, áreas, quartos e vagas extraídos da Descrição (str.extract por coluna).
+
+    Os padrões rodam só sobre os textos distintos (o mesmo imóvel repete a
+    Descrição dia após dia no histórico). Áreas 0.00 significam "não
+    informada" na lista da Caixa e viram None, assim como campos ausentes.
+    """
+    codes, uniques = pd.factorize(series)
+    s = pd.Series(uniques, dtype="string")
+    out = pd.DataFrame(index=series.index)
+    for col, pattern in DESCRICAO_PATTERNS.items():
+        v = s.str.extract(pattern, expand=False)
+        if col in DESCRICAO_AREAS:
+            v = v.mask(pd.to_numeric(v, errors="coerce") == 0)
+        v = v.astype(object).where(v.notna(), None).to_numpy()
+        out[col] = np.where(codes >= 0, v.take(codes, mode="clip"), None)
+    return out
+
+
+def typed_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # colunas de TYPED_COLS a partir dos campos do CSV (ausentes -> None)
+    out = pd.DataFrame(index=df.index)
+    for field, col in TYPED_NUMERIC_COLS.items():
+        out[col] = parse_decimal_ptbr(df[field]) if field in df.columns else None
+    for field, col in TYPED_TEXT_COLS.items():
+        if field in df.columns:
+            s = df[field].astype("string").str.strip()
+            out[col] = s.astype(object).where(s.fillna("") != "", None)
+        else:
+            out[col] = None
+    if "Descrição" in df.columns:
+        out[DESCRICAO_COLS] = descricao_columns(df["Descrição"])
+    else:
+        out[DESCRICAO_COLS] = None
+    return out[TYPED_COLS]
+
+
+# =============================
+# PARSE POR UF (PARALELO)
+# =============================
+def parse_csv_columns(csv_path: Path) -> tuple[list[str], list[np.ndarray]]:
+    # roda no worker: devolve colunas soltas (nomes + arrays), mais barato de
+    # serializar entre processos do que um DataFrame
+    df = normalize_df(df_from_csv_file(csv_path))
+    return list(df.columns), [df.iloc[:, i].to_numpy() for i in range(df.shape[1])]
+
+
+def parse_csv_measured(csv_path: Path) -> tuple[list[str], list[np.ndarray], dict]:
+    # parse_csv_columns + a medição da UF, feita no processo que leu o arquivo
+    uf = uf_from_path(csv_path)
+    label = f"{csv_path.parent.parent.name.removeprefix('dt=')}-read_uf-{uf}"
+    with etapas.measure("read_uf", label=label, trace=False, uf=uf) as rec:
+        cols, arrays = parse_csv_columns(csv_path)
+        rec["rows"] = len(arrays[0]) if arrays else 0
+    return cols, arrays, rec
+
+
+def merge_columnar(parts: list[tuple[list[str], list[np.ndarray]]]) -> pd.DataFrame:
+    # equivalente ao pd.concat(dfs, ignore_index=True): união das colunas na
+    # ordem em que aparecem, NaN onde o arquivo não tem a coluna
+    columns: list[str] = []
+    for cols, _ in parts:
+        columns += [c for c in cols if c not in columns]
+
+    sizes = [len(arrays[0]) if arrays else 0 for _, arrays in parts]
+    data = {}
+    for c in columns:
+        chunks = [
+            arrays[cols.index(c)] if c in cols else np.full(n, np.nan, dtype=object)
+            for (cols, arrays), n in zip(parts, sizes)
+        ]
+        data[c] = np.concatenate(chunks)
+    return pd.DataFrame(data, columns=columns)
+
+
+def map_files(fn, items: list, workers: int | None = None) -> list:
+    workers = INGEST_WORKERS if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(items))
+
+    if workers <= 1:
+        return [fn(x) for x in items]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map preserva a ordem dos arquivos (mesma ordem de linhas do loop)
+        return list(pool.map(fn, items))
+
+
+def imap_files(fn, items: list, workers: int | None = None):
+    """map_files como gerador: resultados na ordem de items, com no máximo
+    `workers` arquivos sendo lidos à frente de quem consome."""
+    workers = INGEST_WORKERS if workers is None else workers
+    workers = min(workers or os.cpu_count() or 1, len(items))
+
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for x in items:
+            pending.append(pool.submit(fn, x))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_day_csvs(
+    csvs: list[Path], workers: int | None = None, stages: etapas.Stages | None = None
+) -> pd.DataFrame:
+    if stages is None:
+        return merge_columnar(map_files(parse_csv_columns, csvs, workers))
+    parts = map_files(parse_csv_measured, csvs, workers)
+    for *_, rec in parts:
+        stages.add(rec)
+    return merge_columnar([(cols, arrays) for cols, arrays, _ in parts])
+
+
+# =============================
+# LAKE (PARQUET)
+# =============================
+# Colunas gravadas como dicionário (categorical) no Parquet
+LAKE_CATEGORICAL = [
+    "UF",
+    "Cidade",
+    "Bairro",
+    "Modalidade de venda",
+    "source_file",
+    "tipo",
+]
+# Leitores como o DuckDB não diferenciam maiúsculas: "desconto" colidiria
+# com a coluna "Desconto" do CSV
+LAKE_TYPED_RENAME = {"desconto": "desconto_num"}
+
+
+def lake_day_dir(dt: str, root: Path | None = None) -> Path:
+    return (root or LAKE_DIR) / f"dt={dt}"
+
+
+def read_lake_manifest(dt: str) -> dict | None:
+    path = lake_day_dir(dt) / LAKE_MANIFEST_NAME
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def lake_frame(cols: list[str], arrays: list[np.ndarray]) -> pd.DataFrame:
+    # colunas do CSV como vieram + TYPED_COLS com tipo de verdade (menos
+    # cidade/bairro/modalidade, que repetiriam as colunas do CSV)
+    df = pd.DataFrame(dict(zip(cols, arrays)), columns=cols)
+    typed = typed_columns(df).drop(columns=list(TYPED_TEXT_COLS.values()))
+    for col in [*TYPED_NUMERIC_COLS.values(), *DESCRICAO_AREAS]:
+        typed[col] = pd.to_numeric(typed[col]).astype("float64")
+    for col in ("quartos", "vagas"):
+        typed[col] = pd.to_numeric(typed[col]).astype("Int16")
+    df = pd.concat([df, typed.rename(columns=LAKE_TYPED_RENAME)], axis=1)
+    for col in LAKE_CATEGORICAL:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def compact_csv(job: tuple[Path, Path]) -> int:
+    # roda no worker: CSV -> Parquet (zstd); devolve o número de linhas
+    csv_path, out_path = job
+    df = lake_frame(*parse_csv_columns(csv_path))
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(
+        out_path, engine="pyarrow", compression="zstd", compression_level=9, index=False
+    )
+    return len(df)
+
+
+def read_lake_columns(path: Path) -> tuple[list[str], list[np.ndarray]]:
+    # inverso de lake_frame: só as colunas do CSV (str/None), direto do Arrow
+    pf = pq.ParquetFile(path)  # arquivo isolado: sem inferir partição pelo caminho
+    typed = {*TYPED_COLS, *LAKE_TYPED_RENAME.values()}
+    cols = [c for c in pf.schema_arrow.names if c not in typed]
+    table = pf.read(columns=cols)
+    arrays = []
+    for c in cols:
+        col = table.column(c)
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        arrays.append(col.to_numpy(zero_copy_only=False))
+    return cols, arrays
+
+
+def read_lake_day(
+    dt: str, ufs: list[str], stages: etapas.Stages | None = None
+) -> pd.DataFrame:
+    # mesmo DataFrame que parse_day_csvs devolveria para os CSVs dessas UFs
+    day = lake_day_dir(dt)
+    parts = []
+    for uf in ufs:
+        label = f"{dt}-read_uf-{uf}"
+        with etapas.measure("read_uf", label=label, trace=False, uf=uf) as rec:
+            cols, arrays = read_lake_columns(day / f"UF={uf}" / LAKE_FILE_NAME)
+            rec["rows"] = len(arrays[0]) if arrays else 0
+        parts.append((cols, arrays))
+        if stages is not None:
+            stages.add(rec)
+    return merge_columnar(parts)
+
+
+def day_sources(dt: str, from_lake: bool = False) -> tuple[dict, dict]:
+    """({uf: sha256}, {uf: arquivo de origem}) da partição dt."""
+    if from_lake:
+        # Parquet do compacta.py: sha256/arquivo de origem vêm do manifest
+        manifest = read_lake_manifest(dt)
+        if manifest is None:
+            raise FileNotFoundError(f"Partição dt={dt} não compactada em {LAKE_DIR}")
+        hashes = {uf: e["sha256"] for uf, e in manifest["files"].items()}
+        paths = {uf: e["source_file"] for uf, e in manifest["files"].items()}
+    else:
+        csvs = list_today_csvs(dt)
+        if not csvs:
+            raise FileNotFoundError(
+                f"Nenhum CSV encontrado em {BASE_DIR}/dt={dt}/UF=*/"
+            )
+        hashes = source_hashes(dt, csvs)
+        paths = {uf_from_path(p): p.as_posix() for p in csvs}
+    return hashes, paths
+
+
+def compact_day(dt: str, workers: int | None = None, force: bool = False) -> dict:
+    """Grava os CSVs de dt como Parquet particionado (dt=*/UF=*) em LAKE_DIR.
+
+    Um arquivo por CSV de origem, com as colunas originais (texto, para o
+    ingest reproduzir payload/fp) e TYPED_COLS tipadas. Sem `force`, pula a
+    partição se o manifest do lake já tem os mesmos sha256 de origem.
+    """
     csvs = list_today_csvs(dt)
     if not csvs:
         raise FileNotFoundError(f"Nenhum CSV encontrado em {BASE_DIR}/dt={dt}/UF=*/")
 
-    dfs = []
-    for p in csvs:
-        d = df_from_csv_file(p)
-        d = normalize_df(d)
-        dfs.append(d)
+    hashes = source_hashes(dt, csvs)
+    previous = read_lake_manifest(dt)
+    if (
+        not force
+        and previous is not None
+        and previous.get("version") == LAKE_VERSION
+        and {uf: e["sha256"] for uf, e in previous["files"].items()} == hashes
+    ):
+        return {"dt": dt, "files": len(csvs), "status": "skipped"}
+
+    out = lake_day_dir(dt)
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    jobs = [(p, tmp / f"UF={uf_from_path(p)}" / LAKE_FILE_NAME) for p in csvs]
+    rows = map_files(compact_csv, jobs, workers)
+
+    files = {
+        uf_from_path(p): {
+            "source_file": p.as_posix(),
+            "sha256": hashes[uf_from_path(p)],
+            "rows": n,
+        }
+        for p, n in zip(csvs, rows)
+    }
+    (tmp / LAKE_MANIFEST_NAME).write_text(
+        json.dumps(
+            {"dt": dt, "version": LAKE_VERSION, "files": files},
+            ensure_ascii=False,
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    shutil.rmtree(out, ignore_errors=True)
+    tmp.rename(out)
+
+    return {
+        "dt": dt,
+        "files": len(csvs),
+        "rows": int(sum(rows)),
+        "csv_bytes": sum(p.stat().st_size for p in csvs),
+        "parquet_bytes": sum(f.stat().st_size for f in out.glob("UF=*/*.parquet")),
+        "status": "success",
+    }
 
-    today = pd.concat(dfs, ignore_index=True)
-    today = add_fingerprint(today)
+
+# =============================
+# CARGA (COPY)
+# =============================
+def copy_text_lines(frame: pd.DataFrame) -> pd.Series:
+    # Uma linha do formato texto do COPY por registro: campos separados por TAB,
+    # NULL = \N, e \ TAB LF CR escapados; tudo por coluna, sem tuplas Python
+    cols = []
+    for i in range(frame.shape[1]):
+        s = frame.iloc[:, i].astype(object)
+        na = s.isna()
+        txt = s.where(~na, "").astype(str)
+        if txt.str.contains(r"[\\\t\n\r]", regex=True).any():
+            txt = (
+                txt.str.replace("\\", "\\\\", regex=False)
+                .str.replace("\t", "\\t", regex=False)
+                .str.replace("\n", "\\n", regex=False)
+                .str.replace("\r", "\\r", regex=False)
+            )
+        cols.append(txt.where(~na, "\\N"))
+    return cols[0].str.cat(cols[1:], sep="\t") if len(cols) > 1 else cols[0]
+
+
+def bulk_insert(
+    cur, table: str, columns: list[str], frame: pd.DataFrame, mode: str | None = None
+) -> int:
+    """Insere `frame` (colunas na ordem de `columns`) em `table`.
+
+    Por padrão usa COPY FROM STDIN em blocos de COPY_CHUNK_ROWS linhas;
+    com mode="values" (ou LOAD_MODE=values) volta ao execute_values.
+    """
+    mode = mode or LOAD_MODE
+    if frame.empty:
+        return 0
+
+    if mode == "values":
+        # NaN/NA viram NULL, como o \N do COPY
+        rows = frame.astype(object).where(frame.notna(), None)
+        execute_values(
+            cur,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+            rows.values.tolist(),
+        )
+        return len(frame)
+    if mode != "copy":
+        raise ValueError(f"LOAD_MODE inválido: {mode}")
+
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    for start in range(0, len(frame), COPY_CHUNK_ROWS):
+        lines = copy_text_lines(frame.iloc[start : start + COPY_CHUNK_ROWS])
+        cur.copy_expert(sql, io.StringIO("\n".join(lines.tolist()) + "\n"))
+    return len(frame)
+
+
+# =============================
+# PARTIÇÕES (histórico por dt)
+# =============================
+def is_partitioned(cur, table: str) -> bool:
+    cur.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,)
+    )
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def create_history_table(cur, table: str, partitioned: bool) -> None:
+    by = " PARTITION BY RANGE (dt)" if partitioned else ""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({HISTORY_TABLES[table]}){by}")
+    for ddl in HISTORY_INDEXES[table]:
+        cur.execute(ddl)
+
+
+def table_partitions(cur, table: str) -> list[tuple[str, date, date]]:
+    """(nome, início, fim exclusivo) das partições de `table`, por início."""
+    cur.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """,
+        (table,),
+    )
+    out = []
+    for name, bound in cur.fetchall():
+        m = PARTITION_BOUND_RE.search(bound)
+        if m:
+            out.append((name, date.fromisoformat(m[1]), date.fromisoformat(m[2])))
+    return sorted(out, key=lambda p: p[1])
+
+
+def day_partition(cur, table: str, dt: str) -> tuple[str, date, date] | None:
+    d = date.fromisoformat(dt)
+    for part in table_partitions(cur, table):
+        if part[1] <= d < part[2]:
+            return part
+    return None
+
+
+def ensure_day_partition(cur, table: str, dt: str) -> None:
+    # Antes de inserir linhas de dt: cria a partição diária se nenhuma
+    # (diária ou mensal) cobre o dia; tabela comum não precisa de nada
+    if not is_partitioned(cur, table) or day_partition(cur, table, dt):
+        return
+    d = date.fromisoformat(dt)
+    cur.execute(
+        f"""
+        CREATE TABLE {table}_{d:%Y%m%d} PARTITION OF {table}
+        FOR VALUES FROM (%s) TO (%s)
+    """,
+        (d, d + timedelta(days=1)),
+    )
+
+
+def clear_day(cur, table: str, dt: str) -> None:
+    """Apaga as linhas de dt: TRUNCATE da partição do dia (sem tuplas mortas
+    para o vacuum); DELETE em tabela comum ou partição mensal."""
+    if not is_partitioned(cur, table):
+        cur.execute(f"DELETE FROM {table} WHERE dt = %s", (dt,))
+        return
+    part = day_partition(cur, table, dt)
+    if part is None:
+        return
+    name, start, end = part
+    if end - start == timedelta(days=1):
+        cur.execute(f"TRUNCATE {name}")
+    else:
+        cur.execute(f"DELETE FROM {name} WHERE dt = %s", (dt,))
+
+
+def day_relation(cur, table: str, dt: str) -> str:
+    # partição que guarda dt (tabela comum: a própria tabela)
+    part = day_partition(cur, table, dt) if is_partitioned(cur, table) else None
+    return part[0] if part else table
+
+
+def analyze_if_stale(cur, rel: str) -> bool:
+    """ANALYZE de rel se o autovacuum ainda não passou depois da última carga
+    (mais de 10% das linhas modificadas desde o último ANALYZE)."""
+    cur.execute(
+        """
+        SELECT n_mod_since_analyze > n_live_tup / 10
+        FROM pg_stat_user_tables WHERE relid = to_regclass(%s)
+    """,
+        (rel,),
+    )
+    row = cur.fetchone()
+    if not (row and row[0]):
+        return False
+    cur.execute(f"ANALYZE {rel}")
+    return True
+
+
+def partition_table(cur, table: str) -> int:
+    """Converte `table` numa tabela particionada por dt (uma partição por dia
+    já gravado), copiando as linhas; cria a tabela se não existe. Devolve
+    quantas linhas foram copiadas."""
+    if is_partitioned(cur, table):
+        return 0
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    if not cur.fetchone()[0]:
+        create_history_table(cur, table, partitioned=True)
+        return 0
+
+    # os índices vão junto com a tabela antiga (nomes livres para a nova)
+    cur.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    cur.execute(
+        f"CREATE TABLE {table} ({HISTORY_TABLES[table]}) PARTITION BY RANGE (dt)"
+    )
+    cur.execute(f"SELECT DISTINCT dt FROM {table}_legacy WHERE dt IS NOT NULL")
+    for (d,) in cur.fetchall():
+        ensure_day_partition(cur, table, d.isoformat())
+    cols = ", ".join(
+        line.split()[0] for line in HISTORY_TABLES[table].strip().splitlines()
+    )
+    cur.execute(
+        f"INSERT INTO {table} ({cols}) "
+        f"SELECT {cols} FROM {table}_legacy WHERE dt IS NOT NULL"
+    )
+    copied = cur.rowcount
+    cur.execute(f"DROP TABLE {table}_legacy")
+    for ddl in HISTORY_INDEXES[table]:
+        cur.execute(ddl)
+    return copied
+
+
+def rollup_month(cur, table: str, month: date) -> int:
+    """Junta as partições diárias do mês de `month` numa partição mensal;
+    devolve quantas partições diárias foram juntadas."""
+    end = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    days = [
+        p
+        for p in table_partitions(cur, table)
+        if month <= p[1] < end and p[2] - p[1] == timedelta(days=1)
+    ]
+    if not days:
+        return 0
+    name = f"{table}_{month:%Y%m}"
+    cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+    for part, _, _ in days:
+        cur.execute(f"INSERT INTO {name} SELECT * FROM {part}")
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {part}")
+        cur.execute(f"DROP TABLE {part}")
+    # CHECK igual ao limite: o ATTACH não precisa varrer a tabela
+    cur.execute(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_dt "
+        "CHECK (dt IS NOT NULL AND dt >= %s AND dt < %s)",
+        (month, end),
+    )
+    cur.execute(
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+        (month, end),
+    )
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_dt")
+    return len(days)
+
+
+def archive_partitions(cur, table: str, before: date) -> list[tuple[str, date]]:
+    # Partições que terminam até `before` saem da tabela para ARCHIVE_SCHEMA;
+    # devolve (nome, fim exclusivo) de cada uma
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+    moved = []
+    for name, _, end in table_partitions(cur, table):
+        if end <= before:
+            cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+            moved.append((name, end))
+    return moved
+
+
+def manage_partitions(
+    today: str | None = None,
+    rollup_days: int = PARTITION_ROLLUP_DAYS,
+    retention_days: int = PARTITION_RETENTION_DAYS,
+) -> dict:
+    """Particiona as tabelas do histórico (se ainda não) e aplica a política
+    de rollup mensal e retenção. Roda sob a trava do ingest."""
+    d = date.fromisoformat(today) if today else date.today()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    summary = {"copied": {}, "rolled_up": {}, "archived": {}}
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (INGEST_LOCK_ID,))
+        for table in HISTORY_TABLES:
+            summary["copied"][table] = partition_table(cur, table)
+
+        # meses encerrados antes de d - rollup_days
+        limit = (d - timedelta(days=rollup_days)).replace(day=1)
+        for table in HISTORY_TABLES:
+            months = {p[1].replace(day=1) for p in table_partitions(cur, table)}
+            summary["rolled_up"][table] = sum(
+                rollup_month(cur, table, m) for m in sorted(months) if m < limit
+            )
+
+        if retention_days > 0:
+            cutoff = d - timedelta(days=retention_days)
+            # no modo delta, o checkpoint em que se apoiam os dias mantidos fica
+            cur.execute(SNAPSHOT_DAYS_DDL)
+            cur.execute(
+                "SELECT max(dt) FROM snapshot_days WHERE checkpoint AND dt <= %s",
+                (cutoff,),
+            )
+            base = cur.fetchone()[0] or cutoff
+            until = None
+            for table in HISTORY_TABLES:
+                moved = archive_partitions(
+                    cur, table, cutoff if table == "changes" else base
+                )
+                summary["archived"][table] = [name for name, _ in moved]
+                if table != "changes" and moved:
+                    until = max([until or base, *(end for _, end in moved)])
+            if until:
+                # dias arquivados deixam de existir para o as_of
+                cur.execute("DELETE FROM snapshot_days WHERE dt < %s", (until,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return summary
+
+
+# =============================
+# SNAPSHOT (checkpoints + deltas)
+# =============================
+def ensure_snapshot_tables(cur) -> None:
+    cur.execute("SELECT to_regclass('snapshot_deltas') IS NULL")
+    if cur.fetchone()[0]:
+        create_history_table(
+            cur, "snapshot_deltas", is_partitioned(cur, "snapshot_imoveis")
+        )
+    cur.execute(SNAPSHOT_DAYS_DDL)
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM snapshot_days)")
+    if cur.fetchone()[0]:
+        cur.execute(
+            "INSERT INTO snapshot_days SELECT DISTINCT dt, true FROM snapshot_imoveis"
+        )
+
+
+def snapshot_day(cur, dt: str) -> bool | None:
+    # True = checkpoint, False = delta, None = dia não ingerido
+    cur.execute("SELECT checkpoint FROM snapshot_days WHERE dt = %s", (dt,))
+    row = cur.fetchone()
+    return None if row is None else row[0]
+
+
+def as_of_sql(cur, dt: str) -> tuple[str, dict] | None:
+    """SELECT (sql, params) do catálogo no último dia ingerido até `dt`.
+
+    Linhas do checkpoint mais recente + as de snapshot_deltas depois dele (a
+    mais nova de cada imóvel vence; payload NULL = saiu), nas colunas de
+    SNAPSHOT_COLS. None se não há dia ingerido até `dt`.
+    """
+    cur.execute(
+        """
+        SELECT d.dt, (
+            SELECT max(c.dt) FROM snapshot_days c
+            WHERE c.checkpoint AND c.dt <= d.dt
+        )
+        FROM snapshot_days d
+        WHERE d.dt <= %s
+        ORDER BY d.dt DESC
+        LIMIT 1
+    """,
+        (dt,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    day, checkpoint = row
+    params = {"day": day, "checkpoint": checkpoint}
+    if day == checkpoint:
+        sql = """
+            SELECT dt, uf, numero_imovel, payload_json, fp, source_file
+            FROM snapshot_imoveis WHERE dt = %(day)s
+        """
+        return sql, params
+    sql = """
+        SELECT %(day)s::date AS dt, uf, numero_imovel, payload_json, fp, source_file
+        FROM (
+            SELECT DISTINCT ON (uf, numero_imovel) *
+            FROM (
+                SELECT dt, uf, numero_imovel, payload_json, fp, source_file
+                FROM snapshot_imoveis WHERE dt = %(checkpoint)s
+                UNION ALL
+                SELECT dt, uf, numero_imovel, payload_json, fp, source_file
+                FROM snapshot_deltas
+                WHERE dt > %(checkpoint)s AND dt <= %(day)s
+            ) u
+            ORDER BY uf, numero_imovel, dt DESC
+        ) s
+        WHERE payload_json IS NOT NULL
+    """
+    return sql, params
+
+
+def as_of(cur, dt: str) -> pd.DataFrame:
+    """Catálogo (colunas de SNAPSHOT_COLS) como ficou no último ingest até `dt`.
+
+    Num dia de delta, imóveis sem mudança de fp desde o checkpoint mantêm o
+    payload/source_file do dia em que foram gravados (como current_imoveis).
+    """
+    q = as_of_sql(cur, dt)
+    if q is None:
+        return pd.DataFrame(columns=SNAPSHOT_COLS)
+    sql, params = q
+    cur.execute(
+        f"""
+        SELECT dt::text, uf, numero_imovel, payload_json::text, fp, source_file
+        FROM ({sql}) a
+    """,
+        params,
+    )
+    return pd.DataFrame(cur.fetchall(), columns=SNAPSHOT_COLS)
+
+
+def previous_snapshot(cur, ydt: str) -> str:
+    """Tabela com o snapshot de ydt (linhas com dt = ydt) para o diff.
+
+    Checkpoint ou dia não ingerido: a própria snapshot_imoveis. Dia de delta:
+    prev_snapshot, temporária remontada com as_of_sql.
+    """
+    if snapshot_day(cur, ydt) is not False:
+        return "snapshot_imoveis"
+    sql, params = as_of_sql(cur, ydt)
+    cur.execute("DROP TABLE IF EXISTS prev_snapshot")
+    cur.execute(f"CREATE TEMP TABLE prev_snapshot ON COMMIT DROP AS {sql}", params)
+    cur.execute("CREATE INDEX ON prev_snapshot (uf, numero_imovel)")
+    cur.execute("ANALYZE prev_snapshot")
+    return "prev_snapshot"
+
+
+def is_checkpoint_day(cur, dt: str, ydt: str) -> bool:
+    if SNAPSHOT_MODE != "delta":
+        return True
+    if snapshot_day(cur, ydt) is None:
+        return True  # o diff de hoje não é contra um estado gravado
+    cur.execute(
+        "SELECT max(dt) FROM snapshot_days WHERE checkpoint AND dt < %s", (dt,)
+    )
+    last = cur.fetchone()[0]
+    days = (datetime.fromisoformat(dt).date() - last).days if last else None
+    return days is None or days >= SNAPSHOT_CHECKPOINT_DAYS
+
+
+def checkpoint_next_day(cur, dt: str, rewritten: frozenset = frozenset()) -> None:
+    # Reingest de dt: o delta do próximo dia ingerido (dt+1 no ingest diário;
+    # depois de um buraco, no backfill) foi gravado contra o dt antigo, então
+    # ele vira checkpoint (remontado antes de dt mudar). Dias em `rewritten`
+    # também serão regravados e ficam de fora.
+    cur.execute("SELECT min(dt)::text FROM snapshot_days WHERE dt > %s", (dt,))
+    ndt = cur.fetchone()[0]
+    if ndt is None or ndt in rewritten or snapshot_day(cur, ndt) is not False:
+        return
+    sql, params = as_of_sql(cur, ndt)
+    cols = ", ".join(SNAPSHOT_COLS)
+    ensure_day_partition(cur, "snapshot_imoveis", ndt)
+    cur.execute(f"INSERT INTO snapshot_imoveis ({cols}) {sql}", params)
+    clear_day(cur, "snapshot_deltas", ndt)
+    cur.execute("UPDATE snapshot_days SET checkpoint = true WHERE dt = %s", (ndt,))
+
+
+def build_snapshot_delta(
+    dt: str,
+    today: pd.DataFrame,
+    entered: pd.DataFrame,
+    exited: pd.DataFrame,
+    updated: pd.DataFrame,
+) -> pd.DataFrame:
+    # Linhas de snapshot_deltas do dia: ENTER/UPDATE com o estado de hoje,
+    # EXIT com payload/fp/source_file nulos
+    keys = pd.concat(
+        [entered[["uf", "numero_imovel"]], updated[["uf", "numero_imovel"]]]
+    )
+    rows = today.merge(keys, on=["uf", "numero_imovel"])[SNAPSHOT_COLS]
+    gone = exited[["uf", "numero_imovel"]].assign(
+        dt=dt, payload_json=None, fp=None, source_file=None
+    )
+    return pd.concat([rows, gone[SNAPSHOT_COLS]], ignore_index=True)
+
+
+# =============================
+# DIFF
+# =============================
+def payload_field_strings(
+    df: pd.DataFrame, cols: list[str] = FIELDS_FOR_HASH, strip: bool = True
+) -> pd.DataFrame:
+    # `cols` como o compute_changed_fields enxerga o payload: str(v).strip(),
+    # None -> "None", coluna ausente -> "" (strip=False: o valor como o ->> do
+    # Postgres devolve, ver PAYLOAD_HASH_SQL)
+    out = {}
+    for col in cols:
+        if col not in df.columns:
+            out[col] = pd.Series("", index=df.index, dtype=object)
+            continue
+        s = df[col].astype(object)
+        s = s.where(s.notna(), "None").astype(str)
+        out[col] = s.str.strip() if strip else s
+    return pd.DataFrame(out, index=df.index)
+
+
+def payload_hash_frame(df: pd.DataFrame) -> pd.Series:
+    """md5 de todos os PREFERRED_COLS do payload (o mesmo que PAYLOAD_HASH_SQL
+    calcula sobre um payload_json gravado).
+
+    O fp só cobre FIELDS_FOR_HASH; este hash pega as mudanças no resto
+    (Endereço, Descrição), que não são UPDATE mas precisam chegar a
+    current_imoveis.
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    parts = payload_field_strings(df, PREFERRED_COLS, strip=False)
+    # join por linha direto das listas (o str.cat custava o dobro)
+    rows = zip(*(parts[c].tolist() for c in PREFERRED_COLS))
+    md5, sep = hashlib.md5, PAYLOAD_HASH_SEP
+    return pd.Series(
+        [md5(sep.join(r).encode("utf-8", errors="ignore")).hexdigest() for r in rows],
+        index=df.index,
+        dtype=object,
+    )
+
+
+def changed_fields_series(before: pd.DataFrame, after: pd.DataFrame) -> pd.Series:
+    # "Preço,Desconto" por linha (None quando nada mudou), na ordem de FIELDS_FOR_HASH
+    acc = pd.Series("", index=before.index, dtype=object)
+    for col in FIELDS_FOR_HASH:
+        acc = acc + np.where(before[col] != after[col], col + ",", "")
+    return acc.str[:-1].where(acc != "", None)
+
+
+# valor do campo no payload no formato de payload_field_strings (ausente -> "")
+PAYLOAD_FIELD_SQL = (
+    "CASE WHEN s.payload_json ? %s "
+    "THEN COALESCE(s.payload_json->>%s, 'None') ELSE '' END"
+)
+# payload_hash_frame de um payload_json gravado (com PAYLOAD_HASH_PARAMS)
+PAYLOAD_HASH_SEP = "\x1f"
+PAYLOAD_HASH_SQL = (
+    f"md5(concat_ws(%s, {', '.join([PAYLOAD_FIELD_SQL] * len(PREFERRED_COLS))}))"
+)
+PAYLOAD_HASH_PARAMS = [PAYLOAD_HASH_SEP] + [
+    c for col in PREFERRED_COLS for c in (col, col)
+]
+
+
+def fetch_previous_rows(
+    cur, dt: str, keys: pd.DataFrame, table: str = "snapshot_imoveis"
+) -> pd.DataFrame:
+    """Busca em table[dt] só as chaves pedidas (alinhado a keys).
+
+    Devolve payload_json como texto (sem parse) e os FIELDS_FOR_HASH já no
+    formato de payload_field_strings, extraídos no próprio Postgres.
+    """
+    cols = ["payload_json"] + FIELDS_FOR_HASH
+    if keys.empty:
+        return pd.DataFrame(columns=cols, index=keys.index, dtype=object)
+
+    field_sql = ", ".join([PAYLOAD_FIELD_SQL] * len(FIELDS_FOR_HASH))
+    field_params = [c for col in FIELDS_FOR_HASH for c in (col, col)]
+    cur.execute(
+        f"""
+        SELECT s.uf, s.numero_imovel, s.payload_json::text, {field_sql}
+        FROM {table} s
+        JOIN unnest(%s::text[], %s::text[]) AS k(uf, numero_imovel)
+            ON s.uf = k.uf AND s.numero_imovel = k.numero_imovel
+        WHERE s.dt = %s
+    """,
+        field_params + [keys["uf"].tolist(), keys["numero_imovel"].tolist(), dt],
+    )
+    found = pd.DataFrame(cur.fetchall(), columns=["uf", "numero_imovel"] + cols)
+    rows = keys[["uf", "numero_imovel"]].merge(
+        found, on=["uf", "numero_imovel"], how="left"
+    )
+    rows.index = keys.index
+    for col in FIELDS_FOR_HASH:
+        rows[col] = rows[col].str.strip()
+    return rows[cols]
+
+
+def diff_against_previous(
+    cur,
+    ydt: str,
+    today: pd.DataFrame,
+    exclude_ufs: list[str],
+    table: str = "snapshot_imoveis",
+    ufs: list[str] | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Compara o snapshot de hoje (em memória) com o de ydt no banco (em
+    `table`, ver previous_snapshot).
+
+    De ontem só vem (uf, numero_imovel, fp, payload_hash) das UFs fora de
+    exclude_ufs (ou só das `ufs`, no lote do streaming); payloads completos são
+    buscados apenas para as linhas que saíram ou mudaram. Devolve (entered,
+    exited, updated, refreshed): os três primeiros com as colunas usadas na
+    montagem de `changes`; refreshed são as chaves com o mesmo fp e payload
+    diferente (só current_imoveis muda).
+    """
+    if ufs is not None:
+        where, param = "uf = ANY(%s)", ufs
+    else:
+        where, param = "NOT (uf = ANY(%s))", exclude_ufs
+    cur.execute(
+        f"""
+        SELECT s.uf, s.numero_imovel, s.fp, {PAYLOAD_HASH_SQL}
+        FROM {table} s WHERE s.dt = %s AND {where}
+    """,
+        PAYLOAD_HASH_PARAMS + [ydt, param],
+    )
+    y = pd.DataFrame(
+        cur.fetchall(), columns=["uf", "numero_imovel", "fp", "payload_hash"]
+    )
+    fields = [c for c in FIELDS_FOR_HASH if c in today.columns]
+    t = today[["uf", "numero_imovel", "fp", "payload_hash", "payload_json"] + fields]
+
+    m = t.merge(
+        y,
+        on=["uf", "numero_imovel"],
+        how="outer",
+        suffixes=("_t", "_y"),
+        indicator=True,
+    )
+
+    entered = m.loc[
+        m["_merge"] == "left_only", ["uf", "numero_imovel", "payload_json"]
+    ]
+
+    exited = m.loc[m["_merge"] == "right_only", ["uf", "numero_imovel"]].copy()
+    prev = fetch_previous_rows(cur, ydt, exited, table)
+    exited["payload_json"] = prev["payload_json"]
+
+    common = m.loc[m["_merge"] == "both"].rename(
+        columns={"payload_json": "after_json"}
+    )
+
+    # fp de ontem gravado em outro FP_MODE: recalcula a partir do payload
+    stale = common["fp_y"].map(fingerprint_mode) != FP_MODE
+    if stale.any():
+        prev = fetch_previous_rows(cur, ydt, common[stale], table)
+        payloads = [json.loads(x) for x in prev["payload_json"]]
+        common.loc[stale, "fp_y"] = fingerprint_frame(
+            pd.DataFrame(payloads, index=prev.index)
+        )
+
+    changed = common[common["fp_y"] != common["fp_t"]]
+    prev = fetch_previous_rows(cur, ydt, changed, table)
+    updated = changed[["uf", "numero_imovel", "fp_y", "fp_t", "after_json"]].assign(
+        before_json=prev["payload_json"],
+        changed_fields=changed_fields_series(
+            prev[FIELDS_FOR_HASH], payload_field_strings(changed)
+        ),
+    )
+    return entered, exited, updated, refreshed_keys(common)
+
+
+def refreshed_keys(common: pd.DataFrame) -> pd.DataFrame:
+    # Mesmo fp e payload diferente (Endereço, Descrição...): não vai para
+    # changes, mas current_imoveis precisa do payload novo
+    same_fp = common["fp_y"] == common["fp_t"]
+    other = common["payload_hash_y"] != common["payload_hash_t"]
+    return common.loc[same_fp & other, ["uf", "numero_imovel"]]
+
+
+# Estado de um dia para o diff encadeado do backfill: chave, fp, payload,
+# payload_hash e os FIELDS_FOR_HASH no formato de payload_field_strings
+STATE_COLS = ["uf", "numero_imovel", "fp", "payload_json", "payload_hash"]
+STATE_COLS += FIELDS_FOR_HASH
+
+
+def state_frame(today: pd.DataFrame) -> pd.DataFrame:
+    return today[STATE_COLS[:5]].assign(**payload_field_strings(today))
+
+
+def load_state(cur, dt: str | None) -> pd.DataFrame:
+    """Estado (STATE_COLS) do snapshot gravado de dt; vazio se dt é None."""
+    if dt is None:
+        return pd.DataFrame(columns=STATE_COLS, dtype=object)
+    table = previous_snapshot(cur, dt)
+    field_sql = ", ".join([PAYLOAD_FIELD_SQL] * len(FIELDS_FOR_HASH))
+    field_params = [c for col in FIELDS_FOR_HASH for c in (col, col)]
+    cur.execute(
+        f"""
+        SELECT s.uf, s.numero_imovel, s.fp, s.payload_json::text,
+               {PAYLOAD_HASH_SQL}, {field_sql}
+        FROM {table} s
+        WHERE s.dt = %s
+    """,
+        PAYLOAD_HASH_PARAMS + field_params + [dt],
+    )
+    state = pd.DataFrame(cur.fetchall(), columns=STATE_COLS)
+    for col in FIELDS_FOR_HASH:
+        state[col] = state[col].str.strip()
+    return state
+
+
+def diff_in_memory(
+    prev: pd.DataFrame, today: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """diff_against_previous com o dia anterior já em memória (STATE_COLS).
+
+    Mesmas saídas (entered, exited, updated, refreshed); before_json vem do
+    payload guardado no estado, sem ida ao banco.
+    """
+    fields = [c for c in FIELDS_FOR_HASH if c in today.columns]
+    t = today[["uf", "numero_imovel", "fp", "payload_hash", "payload_json"] + fields]
+    renames = {c: f"{c}_y" for c in FIELDS_FOR_HASH}
+    y = prev.rename(columns={"payload_json": "before_json", **renames})
+
+    m = t.merge(
+        y,
+        on=["uf", "numero_imovel"],
+        how="outer",
+        suffixes=("_t", "_y"),
+        indicator=True,
+    )
+
+    entered = m.loc[
+        m["_merge"] == "left_only", ["uf", "numero_imovel", "payload_json"]
+    ]
+    exited = m.loc[
+        m["_merge"] == "right_only", ["uf", "numero_imovel", "before_json"]
+    ].rename(columns={"before_json": "payload_json"})
+
+    common = m.loc[m["_merge"] == "both"].rename(
+        columns={"payload_json": "after_json"}
+    )
+
+    # fp do estado gravado em outro FP_MODE: recalcula a partir do payload
+    stale = common["fp_y"].map(fingerprint_mode) != FP_MODE
+    if stale.any():
+        payloads = [json.loads(x) for x in common.loc[stale, "before_json"]]
+        common.loc[stale, "fp_y"] = fingerprint_frame(
+            pd.DataFrame(payloads, index=common.index[stale])
+        )
+
+    changed = common[common["fp_y"] != common["fp_t"]]
+    before = changed[list(renames.values())].set_axis(FIELDS_FOR_HASH, axis=1)
+    updated = changed[["uf", "numero_imovel", "fp_y", "fp_t", "after_json"]].assign(
+        before_json=changed["before_json"],
+        changed_fields=changed_fields_series(before, payload_field_strings(changed)),
+    )
+    return entered, exited, updated, refreshed_keys(common)
+
+
+def build_changes(
+    dt: str, entered: pd.DataFrame, exited: pd.DataFrame, updated: pd.DataFrame
+) -> pd.DataFrame:
+    # Linhas de `changes` montadas por coluna, reaproveitando os payload_json
+    # já serializados (sem json.loads/json.dumps por linha)
+    parts = [
+        pd.DataFrame(
+            {
+                "uf": entered["uf"],
+                "tipo_evento": "ENTER",
+                "numero_imovel": entered["numero_imovel"],
+                "changed_fields": None,
+                "before_json": None,
+                "after_json": entered["payload_json"],
+            }
+        ),
+        pd.DataFrame(
+            {
+                "uf": exited["uf"],
+                "tipo_evento": "EXIT",
+                "numero_imovel": exited["numero_imovel"],
+                "changed_fields": None,
+                "before_json": exited["payload_json"],
+                "after_json": None,
+            }
+        ),
+        pd.DataFrame(
+            {
+                "uf": updated["uf"],
+                "tipo_evento": "UPDATE",
+                "numero_imovel": updated["numero_imovel"],
+                "changed_fields": updated["changed_fields"],
+                "before_json": updated["before_json"],
+                "after_json": updated["after_json"],
+            }
+        ),
+    ]
+    changes = pd.concat(parts, ignore_index=True).astype(object)
+    changes.insert(0, "dt", dt)
+    return changes[CHANGES_COLS]
+
+
+# =============================
+# MAIN
+# =============================
+def build_today_payload(
+    today: pd.DataFrame, dt: str, stages: etapas.Stages | None = None
+) -> pd.DataFrame:
+    stages = stages or etapas.Stages(dt, emit=False)
+    with stages.stage("fingerprint", rows=len(today)):
+        today = add_fingerprint(today)
 
     def row_payload_dict(row: pd.Series) -> dict:
         return {
@@ -280,200 +1712,684 @@ def ingest_day(dt: str) -> dict:
             if c in today.columns
         }
 
-    today_payload = today.copy()
-    today_payload["payload_json"] = today_payload.apply(
-        lambda r: json.dumps(row_payload_dict(r), ensure_ascii=False), axis=1
-    )
+    # today já é a cópia feita pelo add_fingerprint: as colunas novas vão nela
+    with stages.stage("payload_json", rows=len(today)):
+        today_payload = today
+        today_payload["payload_json"] = today_payload.apply(
+            lambda r: json.dumps(row_payload_dict(r), ensure_ascii=False), axis=1
+        )
+        today_payload["payload_hash"] = payload_hash_frame(today_payload)
     today_payload["numero_imovel"] = today_payload[KEY]
     today_payload["uf"] = today_payload["UF"]
     today_payload["dt"] = dt
     today_payload["fp"] = today_payload["_fp"]
     today_payload["source_file"] = today_payload.get("source_file", None)
+    with stages.stage("typed_columns", rows=len(today)):
+        today_payload[TYPED_COLS] = typed_columns(today_payload)
 
     # ====== DEDUP FINAL ======
-    today_payload = today_payload.drop_duplicates(
-        subset=["uf", "numero_imovel"], keep="first"
-    ).copy()
+    # (sem chaves repetidas, o caso comum, devolve o próprio frame sem copiar)
+    dup = today_payload.duplicated(subset=["uf", "numero_imovel"], keep="first")
+    return today_payload[~dup].copy() if dup.any() else today_payload
+
+
+def apply_diff_to_current(
+    cur,
+    dt: str,
+    today: pd.DataFrame,
+    entered: pd.DataFrame,
+    exited: pd.DataFrame,
+    updated: pd.DataFrame,
+    version: int | None = None,
+    refreshed: pd.DataFrame | None = None,
+) -> tuple[int, int]:
+    """Mantém current_imoveis só com as linhas que o diff apontou.
+
+    ENTER/UPDATE (e `refreshed`, mesmo fp com outro payload) viram upsert (ON
+    CONFLICT) e EXIT remove o imóvel; linhas com o mesmo payload de ontem (ou
+    já idênticas no banco) não são tocadas, então `last_seen`/`source_file`
+    guardam o dia em que o conteúdo atual foi gravado. Nada é sobrescrito por
+    um ingest de dia anterior ao já gravado. Linhas gravadas levam
+    `ingest_version = version` e as removidas vão para current_removed.
+    Devolve (upserted, removed).
+    """
+    keys = pd.concat(
+        [
+            entered[["uf", "numero_imovel"]],
+            updated[["uf", "numero_imovel"]],
+            *([] if refreshed is None else [refreshed[["uf", "numero_imovel"]]]),
+        ]
+    )
+    rows = today.merge(keys, on=["uf", "numero_imovel"]).rename(
+        columns={"dt": "last_seen"}
+    )[CURRENT_COLS]
+    upserted = upsert_current(cur, rows, version)
+
+    cur.execute(
+        """
+        WITH removed AS (
+            DELETE FROM current_imoveis c
+            USING unnest(%s::text[], %s::text[]) AS x(uf, numero_imovel)
+            WHERE c.uf = x.uf AND c.numero_imovel = x.numero_imovel
+              AND c.last_seen < %s
+            RETURNING c.uf, c.numero_imovel
+        )
+        INSERT INTO current_removed (version, uf, numero_imovel)
+        SELECT %s, uf, numero_imovel FROM removed
+    """,
+        (exited["uf"].tolist(), exited["numero_imovel"].tolist(), dt, version),
+    )
+    return upserted, cur.rowcount
 
-    conn = get_db_connection()
-    cur = conn.cursor()
 
-    try:
-        # Idempotência (limpar dados do dia anterior ao inserir de novo)
-        cur.execute("DELETE FROM snapshot_imoveis WHERE dt = %s", (dt,))
-        cur.execute("DELETE FROM changes WHERE dt = %s", (dt,))
-
-        # 1. Inserir em snapshot_imoveis
-        snapshot_rows = today_payload[
-            ["dt", "uf", "numero_imovel", "payload_json", "fp", "source_file"]
-        ].values.tolist()
+def upsert_current(cur, rows: pd.DataFrame, version: int | None) -> int:
+    # rows (CURRENT_COLS) -> current_imoveis via tabela temporária; só grava
+    # linhas com conteúdo diferente e last_seen não anterior ao do banco
+    cur.execute("DROP TABLE IF EXISTS current_stage")
+    cur.execute(
+        "CREATE TEMP TABLE current_stage (LIKE current_imoveis) ON COMMIT DROP"
+    )
+    bulk_insert(cur, "current_stage", CURRENT_COLS, rows)
+    cols = ", ".join(CURRENT_COLS)
+    sets = ", ".join(
+        f"{c} = EXCLUDED.{c}" for c in [*CURRENT_COLS[2:], "ingest_version"]
+    )
+    cur.execute(
+        f"""
+        INSERT INTO current_imoveis ({cols}, ingest_version)
+        SELECT {cols}, %s FROM current_stage
+        ON CONFLICT (uf, numero_imovel) DO UPDATE SET {sets}
+        WHERE (current_imoveis.fp, current_imoveis.payload_json)
+              IS DISTINCT FROM (EXCLUDED.fp, EXCLUDED.payload_json)
+          AND current_imoveis.last_seen <= EXCLUDED.last_seen
+    """,
+        (version,),
+    )
+    return cur.rowcount
+
+
+def newer_ingested_day(cur, dt: str) -> str | None:
+    # Dia já ingerido depois de dt: current_imoveis é o estado dele, e o diff
+    # de dt (regravando o passado) não pode mexer em current
+    cur.execute("SELECT max(dt)::text FROM snapshot_days WHERE dt > %s", (dt,))
+    return cur.fetchone()[0]
+
+
+def rebuild_current(cur, dt: str, version: int) -> tuple[int, int]:
+    """Acerta current_imoveis com o snapshot gravado de dt (o último dia
+    ingerido), depois de um backfill que regravou dias sem mexer em current.
+
+    Remove o que não está no snapshot e regrava só as linhas diferentes (com
+    last_seen = dt). Devolve (upserted, removed).
+    """
+    table = previous_snapshot(cur, dt)
+    cur.execute(
+        f"""
+        WITH removed AS (
+            DELETE FROM current_imoveis c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} s
+                WHERE s.dt = %s AND s.uf = c.uf AND s.numero_imovel = c.numero_imovel
+            )
+            RETURNING c.uf, c.numero_imovel
+        )
+        INSERT INTO current_removed (version, uf, numero_imovel)
+        SELECT %s, uf, numero_imovel FROM removed
+    """,
+        (dt, version),
+    )
+    removed = cur.rowcount
+
+    cur.execute(
+        f"""
+        SELECT s.uf, s.numero_imovel, s.payload_json::text, s.fp, s.source_file
+        FROM {table} s
+        LEFT JOIN current_imoveis c
+            ON c.uf = s.uf AND c.numero_imovel = s.numero_imovel
+        WHERE s.dt = %s
+          AND (c.fp, c.payload_json) IS DISTINCT FROM (s.fp, s.payload_json)
+    """,
+        (dt,),
+    )
+    found = cur.fetchall()
+    if not found:
+        return 0, removed
+    cols = ["uf", "numero_imovel", "payload_json", "fp", "source_file"]
+    rows = pd.DataFrame(found, columns=cols).assign(last_seen=dt)
+    typed = typed_columns(pd.DataFrame([json.loads(p) for p in rows["payload_json"]]))
+    rows[TYPED_COLS] = typed[TYPED_COLS].to_numpy()
+    return upsert_current(cur, rows[CURRENT_COLS], version), removed
+
+
+def ensure_typed_columns(cur, version: int | None = None) -> None:
+    # Cria as colunas tipadas só quando faltam (ALTER TABLE travaria as
+    # leituras até o commit) e preenche linhas gravadas antes delas existirem
+    expected = [*TYPED_COLS, "ingest_version"]
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'current_imoveis' AND column_name = ANY(%s)
+    """,
+        (expected,),
+    )
+    if len(cur.fetchall()) < len(expected):
+        cur.execute(CURRENT_TYPED_DDL)
+
+    cur.execute(
+        """
+        SELECT uf, numero_imovel, payload_json::text FROM current_imoveis
+        WHERE (modalidade IS NULL AND payload_json->>'Modalidade de venda' <> '')
+           OR (tipo IS NULL AND payload_json->>'Descrição' <> '')
+    """
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return
+    typed = typed_columns(pd.DataFrame([json.loads(r[2]) for r in rows]))
+    typed.insert(0, "numero_imovel", [r[1] for r in rows])
+    typed.insert(0, "uf", [r[0] for r in rows])
+
+    cur.execute(
+        "CREATE TEMP TABLE typed_stage (LIKE current_imoveis) ON COMMIT DROP"
+    )
+    bulk_insert(cur, "typed_stage", ["uf", "numero_imovel", *TYPED_COLS], typed)
+    sets = ", ".join(f"{c} = t.{c}" for c in TYPED_COLS)
+    cur.execute(
+        f"""
+        UPDATE current_imoveis c SET {sets}, ingest_version = %s
+        FROM typed_stage t
+        WHERE c.uf = t.uf AND c.numero_imovel = t.numero_imovel
+    """,
+        (version,),
+    )
+
+
+def clear_ingested_day(cur, dt: str) -> None:
+    # Apaga o que um ingest anterior de dt gravou (histórico, snapshot_days e
+    # ingest_state); current_imoveis é corrigido pelo próprio diff
+    for table in HISTORY_TABLES:
+        clear_day(cur, table, dt)
+    cur.execute("DELETE FROM snapshot_days WHERE dt = %s", (dt,))
+    cur.execute("DELETE FROM ingest_state WHERE dt = %s", (dt,))
+
+
+def ensure_day_tables(cur, dt: str, checkpoint: bool) -> None:
+    ensure_day_partition(cur, "changes", dt)
+    ensure_day_partition(
+        cur, "snapshot_imoveis" if checkpoint else "snapshot_deltas", dt
+    )
+
+
+def store_batch(
+    cur,
+    dt: str,
+    today: pd.DataFrame,
+    entered: pd.DataFrame,
+    exited: pd.DataFrame,
+    updated: pd.DataFrame,
+    checkpoint: bool,
+    version: int,
+    stages: etapas.Stages | None = None,
+    update_current: bool = True,
+    refreshed: pd.DataFrame | None = None,
+) -> tuple[int, int, int]:
+    """Grava um lote já comparado (o dia inteiro ou as UFs de um lote do
+    streaming): snapshot (ou delta), changes e current_imoveis (a não ser com
+    update_current=False, ver newer_ingested_day). Devolve (snapshot_rows,
+    upserted, removed).
+    """
+    stages = stages or etapas.Stages(dt, emit=False)
+
+    # 1. Inserir em snapshot_imoveis (só checkpoints no modo delta)
+    with stages.stage("load_snapshot") as st:
+        if checkpoint:
+            snapshot_rows = bulk_insert(
+                cur, "snapshot_imoveis", SNAPSHOT_COLS, today[SNAPSHOT_COLS]
+            )
+        else:
+            delta = build_snapshot_delta(dt, today, entered, exited, updated)
+            snapshot_rows = bulk_insert(cur, "snapshot_deltas", SNAPSHOT_COLS, delta)
+        st["rows"] = snapshot_rows
+
+    # 2. changes do lote
+    with stages.stage("load_changes") as st:
+        changes = build_changes(dt, entered, exited, updated)
+        st["rows"] = bulk_insert(cur, "changes", CHANGES_COLS, changes)
+
+    # 3. Atualizar current_imoveis a partir do diff (só ENTER/UPDATE/EXIT)
+    if not update_current:
+        return snapshot_rows, 0, 0
+    with stages.stage("load_current") as st:
+        upserted, removed = apply_diff_to_current(
+            cur, dt, today, entered, exited, updated, version, refreshed
+        )
+        st["rows"] = upserted + removed
+    return snapshot_rows, upserted, removed
+
+
+def store_day_state(
+    cur,
+    dt: str,
+    checkpoint: bool,
+    hashes: dict[str, str],
+    paths: dict[str, str],
+    stages: etapas.Stages | None = None,
+) -> None:
+    # Fecha o dia: snapshot_days e ingest_state (gravados depois dos lotes)
+    stages = stages or etapas.Stages(dt, emit=False)
+    with stages.stage("load_state", rows=len(hashes)):
+        cur.execute(
+            "INSERT INTO snapshot_days (dt, checkpoint) VALUES (%s, %s)",
+            (dt, checkpoint),
+        )
         execute_values(
             cur,
             """
-            INSERT INTO snapshot_imoveis (dt, uf, numero_imovel, payload_json, fp, source_file)
+            INSERT INTO ingest_state (dt, uf, source_sha256, fp_mode, source_file)
             VALUES %s
         """,
-            snapshot_rows,
+            [(dt, uf, h, FP_MODE, paths[uf]) for uf, h in hashes.items()],
         )
 
-        ydt = (datetime.fromisoformat(dt) - timedelta(days=1)).date().isoformat()
 
-        # 2. Carregar ontem e hoje para comparação
-        cur.execute(
-            "SELECT uf, numero_imovel, payload_json, fp FROM snapshot_imoveis WHERE dt = %s",
-            (ydt,),
-        )
-        y_rows = cur.fetchall()
-        y = (
-            pd.DataFrame(y_rows, columns=["uf", "numero_imovel", "payload_json", "fp"])
-            if y_rows
-            else pd.DataFrame(columns=["uf", "numero_imovel", "payload_json", "fp"])
-        )
+def store_day(
+    cur,
+    dt: str,
+    today: pd.DataFrame,
+    entered: pd.DataFrame,
+    exited: pd.DataFrame,
+    updated: pd.DataFrame,
+    checkpoint: bool,
+    version: int,
+    hashes: dict[str, str],
+    paths: dict[str, str],
+    stages: etapas.Stages | None = None,
+    update_current: bool = True,
+    refreshed: pd.DataFrame | None = None,
+) -> tuple[int, int, int]:
+    """Grava o dia já comparado: snapshot (ou delta), changes, snapshot_days,
+    current_imoveis e ingest_state. Devolve (snapshot_rows, upserted, removed).
+    """
+    ensure_day_tables(cur, dt, checkpoint)
+    out = store_batch(
+        cur,
+        dt,
+        today,
+        entered,
+        exited,
+        updated,
+        checkpoint,
+        version,
+        stages,
+        update_current,
+        refreshed,
+    )
+    store_day_state(cur, dt, checkpoint, hashes, paths, stages)
+    return out
+
+
+def unchanged_ufs(cur, ydt: str, hashes: dict[str, str]) -> set[str]:
+    # UFs com o mesmo arquivo (e mesmo FP_MODE) que o ingest de ontem.
+    # O arquivo geral (só presente quando falta a lista de alguma UF, ver
+    # list_today_csvs) pode completar qualquer UF, então com ele o incremental
+    # não se aplica ("incremental_off": "geral" no resumo).
+    if "geral" in hashes:
+        return set()
+    cur.execute(
+        "SELECT uf, source_sha256, fp_mode FROM ingest_state WHERE dt = %s", (ydt,)
+    )
+    prev = {uf: (h, mode) for uf, h, mode in cur.fetchall()}
+    return {uf for uf, h in hashes.items() if prev.get(uf) == (h, FP_MODE)}
 
-        cur.execute(
-            "SELECT uf, numero_imovel, payload_json, fp FROM snapshot_imoveis WHERE dt = %s",
-            (dt,),
-        )
-        t_rows = cur.fetchall()
-        t = pd.DataFrame(t_rows, columns=["uf", "numero_imovel", "payload_json", "fp"])
-
-        changes_rows = []
-
-        if y.empty:
-            entered = t.copy()
-            exited = pd.DataFrame(columns=t.columns)
-            updated = pd.DataFrame(
-                columns=[
-                    "uf",
-                    "numero_imovel",
-                    "fp_y",
-                    "fp_t",
-                    "before_json",
-                    "after_json",
-                ]
-            )
-        else:
-            y["k"] = y["uf"].astype(str) + "::" + y["numero_imovel"].astype(str)
-            t["k"] = t["uf"].astype(str) + "::" + t["numero_imovel"].astype(str)
 
-            y_keys = set(y["k"])
-            t_keys = set(t["k"])
+SNAPSHOT_FETCH_ROWS = 20_000
 
-            entered = t[t["k"].isin(t_keys - y_keys)].copy()
-            exited = y[y["k"].isin(y_keys - t_keys)].copy()
 
-            common = t_keys & y_keys
-            y_common = y[y["k"].isin(common)][["k", "fp", "payload_json"]].rename(
-                columns={"fp": "fp_y", "payload_json": "before_json"}
-            )
-            t_common = t[t["k"].isin(common)][
-                ["k", "uf", "numero_imovel", "fp", "payload_json"]
-            ].rename(columns={"fp": "fp_t", "payload_json": "after_json"})
-            merged = t_common.merge(y_common, on="k", how="inner")
-            updated = merged[merged["fp_y"] != merged["fp_t"]].copy()
-
-        for _, r in entered.iterrows():
-            changes_rows.append(
-                (
-                    dt,
-                    r["uf"],
-                    "ENTER",
-                    r["numero_imovel"],
-                    None,
-                    None,
-                    json.dumps(
-                        r["payload_json"]
-                        if isinstance(r["payload_json"], dict)
-                        else json.loads(r["payload_json"]),
-                        ensure_ascii=False,
-                    ),
-                )
-            )
+def write_current_snapshot(conn, version: int) -> dict | None:
+    """Grava o snapshot Arrow do viewer (memoria.SNAPSHOT_PATH) a partir de
+    current_imoveis já commitado.
 
-        for _, r in exited.iterrows():
-            changes_rows.append(
-                (
-                    dt,
-                    r["uf"],
-                    "EXIT",
-                    r["numero_imovel"],
-                    None,
-                    json.dumps(
-                        r["payload_json"]
-                        if isinstance(r["payload_json"], dict)
-                        else json.loads(r["payload_json"]),
-                        ensure_ascii=False,
-                    ),
-                    None,
-                )
+    Roda depois do commit: se falhar, o ingest vale do mesmo jeito e o app
+    volta a ler do Postgres.
+    """
+    if not memoria.SNAPSHOT_PATH:
+        return None
+    t0 = time.perf_counter()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            # categorias e linhas do mesmo snapshot do banco
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cur.execute(memoria.categories_select("current_imoveis"))
+            categories = memoria.fixed_categories(cur.fetchall())
+        # cursor no servidor: cada bloco vira um record batch do arquivo, sem
+        # juntar a tabela em memória
+        with conn.cursor(name="current_snapshot") as cur:
+            cur.itersize = SNAPSHOT_FETCH_ROWS
+            cur.execute(f"SELECT {memoria.COMPACT_SELECT} FROM current_imoveis")
+
+            def blocks():
+                while rows := cur.fetchmany(SNAPSHOT_FETCH_ROWS):
+                    cols = [d[0] for d in cur.description]
+                    df = pd.DataFrame(rows, columns=cols)
+                    yield memoria.compact_frame(df, categories)
+
+            rows, size = memoria.write_snapshot_batches(
+                blocks(), version, memoria.SNAPSHOT_PATH
             )
+        conn.rollback()
+        if not rows:
+            return None
+    except Exception as e:
+        conn.rollback()
+        return {"path": memoria.SNAPSHOT_PATH, "error": str(e)}
+    return {
+        "path": memoria.SNAPSHOT_PATH,
+        "rows": rows,
+        "bytes": size,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+
+def counts_by_uf(
+    today: pd.DataFrame,
+    entered: pd.DataFrame,
+    exited: pd.DataFrame,
+    updated: pd.DataFrame,
+) -> dict[str, dict[str, int]]:
+    # linhas lidas e eventos do diff por UF (resumo do ingest)
+    frames = {"rows": today, "entered": entered, "exited": exited, "updated": updated}
+    counts = pd.DataFrame({k: f["uf"].value_counts() for k, f in frames.items()})
+    return counts.fillna(0).astype(int).sort_index().to_dict(orient="index")
+
+
+def day_batches(
+    dt: str,
+    paths: dict[str, str],
+    ufs: list[str],
+    from_lake: bool,
+    workers: int | None,
+    stages: etapas.Stages,
+):
+    """Lotes (uf, today) das `ufs` de dt, na ordem dada.
+
+    Em streaming, um lote por arquivo (uf = UF do arquivo), lido quando o
+    anterior já foi gravado (com workers, no máximo `workers` à frente); senão
+    um lote só com todas as UFs (uf = None).
+
+    O arquivo geral (ver list_today_csvs) é lido antes e fica em memória: as
+    linhas dele completam o lote da própria UF (o dedup do
+    build_today_payload mantém a linha do arquivo da UF, como no
+    historico.day_scan) e as das UFs sem arquivo vão num último lote
+    (uf = "geral").
+    """
+    if not ufs:
+        return
+    if not INGEST_STREAM:
+        with stages.stage("read") as st:
+            if from_lake:
+                today = read_lake_day(dt, ufs, stages)
+            else:
+                today = parse_day_csvs([Path(paths[uf]) for uf in ufs], workers, stages)
+            st["rows"] = len(today)
+        yield None, today
+        return
+
+    geral = None
+    if "geral" in ufs:
+        ufs = [uf for uf in ufs if uf != "geral"]
+        _, geral = next(uf_frames(dt, paths, ["geral"], from_lake, 1, stages))
+    for uf, today in uf_frames(dt, paths, ufs, from_lake, workers, stages):
+        if geral is not None:
+            today = pd.concat([today, geral[geral["UF"] == uf]], ignore_index=True)
+        yield uf, today
+    if geral is not None:
+        rest = geral[~geral["UF"].isin(ufs)]
+        if len(rest):
+            yield "geral", rest.reset_index(drop=True)
+
+
+def uf_frames(
+    dt: str,
+    paths: dict[str, str],
+    ufs: list[str],
+    from_lake: bool,
+    workers: int | None,
+    stages: etapas.Stages,
+):
+    # Um DataFrame por arquivo das `ufs`, na ordem dada (ver day_batches)
+    if from_lake:
+        for uf in ufs:
+            yield uf, read_lake_day(dt, [uf], stages)
+        return
+    csvs = [Path(paths[uf]) for uf in ufs]
+    parsed = imap_files(parse_csv_measured, csvs, workers)
+    for uf, (cols, arrays, rec) in zip(ufs, parsed):
+        stages.add(rec)
+        yield uf, merge_columnar([(cols, arrays)])
+
+
+def diff_and_store(
+    cur,
+    dt: str,
+    ydt: str,
+    today: pd.DataFrame,
+    exclude_ufs: list[str],
+    ufs: list[str] | None,
+    prev_table: str,
+    checkpoint: bool,
+    version: int,
+    stages: etapas.Stages,
+    update_current: bool = True,
+) -> tuple[dict, dict]:
+    # Diff de um lote contra as mesmas UFs de ontem + gravação; os frames do
+    # diff morrem aqui, só as contagens (totais e por UF) voltam
+    with stages.stage("diff", rows=len(today)):
+        entered, exited, updated, refreshed = diff_against_previous(
+            cur, ydt, today, exclude_ufs, prev_table, ufs
+        )
+    snapshot_rows, upserted, removed = store_batch(
+        cur,
+        dt,
+        today,
+        entered,
+        exited,
+        updated,
+        checkpoint,
+        version,
+        stages,
+        update_current,
+        refreshed,
+    )
+    counts = {
+        "rows_today": int(len(today)),
+        "entered": int(len(entered)),
+        "exited": int(len(exited)),
+        "updated": int(len(updated)),
+        "refreshed": int(len(refreshed)),
+        "snapshot_rows": snapshot_rows,
+        "current_upserted": upserted,
+        "current_removed": removed,
+    }
+    return counts, counts_by_uf(today, entered, exited, updated)
+
+
+def ingest_day(
+    dt: str,
+    workers: int | None = None,
+    incremental: bool = False,
+    from_lake: bool = False,
+) -> dict:
+    """Ingere a partição dt (diff contra dt-1) e devolve o resumo.
+
+    O resumo traz, além das contagens, as medições de cada etapa ("stages":
+    tempo, CPU, memória e linhas; em streaming, por UF, ver etapas.py) e as
+    contagens por UF ("by_uf").
+    """
+    t0 = time.perf_counter()
+    stages = etapas.Stages(dt)
+    hashes, paths = day_sources(dt, from_lake)
+    ydt = (datetime.fromisoformat(dt) - timedelta(days=1)).date().isoformat()
 
-        for _, r in updated.iterrows():
-            before = (
-                r["before_json"]
-                if isinstance(r["before_json"], dict)
-                else json.loads(r["before_json"])
-            )
-            after = (
-                r["after_json"]
-                if isinstance(r["after_json"], dict)
-                else json.loads(r["after_json"])
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        with stages.stage("lock"):
+            cur.execute(INGEST_STATE_DDL)
+            cur.execute(INGEST_VERSION_DDL)
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (INGEST_LOCK_ID,))
+            cur.execute(
+                "INSERT INTO ingest_versions (dt) VALUES (%s) RETURNING version", (dt,)
             )
-            changed_fields = compute_changed_fields(before, after)
-            changes_rows.append(
-                (
+            version = cur.fetchone()[0]
+
+        with stages.stage("setup"):
+            ensure_typed_columns(cur, version)
+            # Incremental: UFs idênticas a ontem são copiadas de snapshot_imoveis
+            # (sem parse/diff); só as demais passam pelo pipeline completo
+            carried = sorted(unchanged_ufs(cur, ydt, hashes)) if incremental else []
+            incremental_off = "geral" if incremental and "geral" in hashes else None
+            to_parse = [uf for uf in paths if uf not in carried]
+
+        with stages.stage("prepare"):
+            # Idempotência (limpar dados do dia anterior ao inserir de novo); com
+            # as tabelas particionadas é um TRUNCATE da partição do dia
+            ensure_snapshot_tables(cur)
+            checkpoint_next_day(cur, dt)
+            clear_ingested_day(cur, dt)
+            # Reingestão de um dia antigo: current_imoveis já é o estado do dia
+            # mais novo e não muda (o diff de dt não é o diff do estado atual)
+            newer = newer_ingested_day(cur, dt)
+
+            checkpoint = is_checkpoint_day(cur, dt, ydt)
+            prev_table = previous_snapshot(cur, ydt)
+            if INGEST_STREAM:
+                # Sem estatísticas do que o ingest de ontem acabou de gravar, o
+                # planner erra as buscas por chave (diff, EXIT em current) e o
+                # erro se repete em cada lote
+                if prev_table == "snapshot_imoveis":
+                    analyze_if_stale(cur, day_relation(cur, prev_table, ydt))
+                analyze_if_stale(cur, "current_imoveis")
+            ensure_day_tables(cur, dt, checkpoint)
+
+        # Cada lote é comparado com as mesmas UFs de ontem e gravado antes de o
+        # próximo ser lido. Em streaming, o que fica em memória por etapa:
+        #   read_uf        um arquivo (com pool, mais até `workers` à frente)
+        #   fingerprint, payload_json, typed_columns   as linhas dessa UF
+        #   diff           (uf, numero_imovel, fp) de ontem só dessa UF; payloads
+        #                  só das linhas que saíram ou mudaram
+        #   load_*         os frames do lote, enviados em blocos de COPY_CHUNK_ROWS
+        totals, by_uf = Counter(), {}
+        done = set(carried)
+        rest = True  # UFs de ontem que não vieram em nenhum lote (todas EXIT)
+        batches = day_batches(dt, paths, to_parse, from_lake, workers, stages)
+        for uf, today in batches:
+            with stages.scope(uf=uf):
+                today = build_today_payload(today, dt, stages)
+                if uf is None:
+                    ufs, rest = None, False
+                else:
+                    ufs = sorted({uf, *today["uf"].unique()})
+                    if done.intersection(ufs):
+                        raise ValueError(
+                            f"UF {sorted(done.intersection(ufs))} em mais de um "
+                            f"arquivo de dt={dt}; use INGEST_STREAM=0"
+                        )
+                    done.update(ufs)
+                counts, batch_by_uf = diff_and_store(
+                    cur,
                     dt,
-                    r["uf"],
-                    "UPDATE",
-                    r["numero_imovel"],
-                    ",".join(changed_fields) if changed_fields else None,
-                    json.dumps(before, ensure_ascii=False),
-                    json.dumps(after, ensure_ascii=False),
+                    ydt,
+                    today,
+                    carried,
+                    ufs,
+                    prev_table,
+                    checkpoint,
+                    version,
+                    stages,
+                    newer is None,
                 )
+            del today
+            totals.update(counts)
+            by_uf.update(batch_by_uf)
+        if rest:
+            empty = pd.DataFrame(
+                columns=[*SNAPSHOT_COLS, "payload_hash", *TYPED_COLS]
             )
-
-        if changes_rows:
-            execute_values(
+            counts, batch_by_uf = diff_and_store(
                 cur,
-                """
-                INSERT INTO changes (dt, uf, tipo_evento, numero_imovel, changed_fields, before_json, after_json)
-                VALUES %s
-            """,
-                changes_rows,
+                dt,
+                ydt,
+                empty,
+                sorted(done),
+                None,
+                prev_table,
+                checkpoint,
+                version,
+                stages,
+                newer is None,
             )
-
-        # 3. Atualizar current_imoveis
-        cur.execute(
-            """
-            DELETE FROM current_imoveis
-            WHERE (uf, numero_imovel) IN (
-                SELECT uf, numero_imovel FROM snapshot_imoveis WHERE dt = %s
-            )
-        """,
-            (dt,),
-        )
-
-        current_rows = today_payload[
-            ["uf", "numero_imovel", "payload_json", "fp", "dt", "source_file"]
-        ].values.tolist()
-        execute_values(
-            cur,
-            """
-            INSERT INTO current_imoveis (uf, numero_imovel, payload_json, fp, last_seen, source_file)
-            VALUES %s
-        """,
-            current_rows,
-        )
-
-        conn.commit()
+            totals.update(counts)
+            by_uf.update(batch_by_uf)
+        store_day_state(cur, dt, checkpoint, hashes, paths, stages)
+
+        # UFs sem mudança: copia o snapshot de ontem, com o source_file de hoje
+        # (num dia de delta não gravam nada; só são contadas)
+        carried_rows = 0
+        if carried:
+            with stages.stage("carried") as st:
+                if checkpoint:
+                    cur.execute(
+                        f"""
+                        INSERT INTO snapshot_imoveis (dt, uf, numero_imovel, payload_json, fp, source_file)
+                        SELECT %s, s.uf, s.numero_imovel, s.payload_json, s.fp, v.source_file
+                        FROM {prev_table} s
+                        JOIN unnest(%s::text[], %s::text[]) AS v(uf, source_file) ON s.uf = v.uf
+                        WHERE s.dt = %s
+                    """,
+                        (dt, carried, [paths[uf] for uf in carried], ydt),
+                    )
+                    carried_rows = cur.rowcount
+                    totals["snapshot_rows"] += carried_rows
+                else:
+                    cur.execute(
+                        f"SELECT count(*) FROM {prev_table} "
+                        "WHERE dt = %s AND uf = ANY(%s)",
+                        (ydt, carried),
+                    )
+                    carried_rows = cur.fetchone()[0]
+                st["rows"] = carried_rows
+
+        with stages.stage("commit"):
+            conn.commit()
+
+        with stages.stage("current_snapshot") as st:
+            current_snapshot = write_current_snapshot(conn, version)
+            st["rows"] = (current_snapshot or {}).get("rows")
 
         summary = {
             "dt": dt,
             "yesterday": ydt,
-            "rows_today": int(len(t)),
-            "entered": int(len(entered)),
-            "exited": int(len(exited)),
-            "updated": int(len(updated)),
+            "rows_today": totals["rows_today"] + carried_rows,
+            "entered": totals["entered"],
+            "exited": totals["exited"],
+            "updated": totals["updated"],
+            "refreshed": totals["refreshed"],
+            "carried_ufs": carried,
+            "incremental_off": incremental_off,
+            "stream_off": None if INGEST_STREAM else "INGEST_STREAM=0",
+            "snapshot": "checkpoint" if checkpoint else "delta",
+            "snapshot_rows": totals["snapshot_rows"],
+            "current_upserted": totals["current_upserted"],
+            "current_removed": totals["current_removed"],
+            "current_kept_at": newer,
+            "ingest_version": version,
+            "current_snapshot": current_snapshot,
+            "by_uf": dict(sorted(by_uf.items())),
+            "stages": stages.records,
+            "seconds": round(time.perf_counter() - t0, 2),
+            "process_max_rss_mb": etapas.max_rss_mb(),
             "status": "success",
         }
         return summary
@@ -487,9 +2403,42 @@ def ingest_day(dt: str) -> dict:
 
 
 def main():
-    dt = datetime.now().date().isoformat()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dt", default=datetime.now().date().isoformat())
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="reprocessa só as UFs cujo CSV mudou desde o dia anterior",
+    )
+    ap.add_argument(
+        "--from-lake",
+        action="store_true",
+        help=f"lê o Parquet compactado em {LAKE_DIR} em vez dos CSVs",
+    )
+    ap.add_argument(
+        "--partitions",
+        action="store_true",
+        help="particiona snapshot_imoveis/snapshot_deltas/changes por dt e aplica "
+        "o rollup/retenção (PARTITION_ROLLUP_DAYS, PARTITION_RETENTION_DAYS); "
+        "não faz ingest",
+    )
+    args = ap.parse_args()
+    # medições das etapas (etapas.py) como linhas JSON no stderr
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.partitions:
+        print(json.dumps(manage_partitions(args.dt), ensure_ascii=False, indent=2))
+        return
+
+    dt = args.dt
     try:
-        summary = ingest_day(dt)
+        summary = ingest_day(
+            dt,
+            workers=args.workers,
+            incremental=args.incremental,
+            from_lake=args.from_lake,
+        )
         print(json.dumps(summary, ensure_ascii=False, indent=2))
     except Exception as e:
         print(json.dumps({"error": str(e)}, ensure_ascii=False, indent=2))
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+# Representação compacta de current_imoveis no viewer (modo memória): só os
+# campos de filtro/ordenação ficam em memória, como categorias e números; os
+# textos exibidos (Endereço, Preço formatado, ...) vêm do Postgres apenas para
+# a página na tela e o link é montado a partir do número do imóvel.
+LINK_BASE = "https://venda-imoveis.caixa.gov.br/sistema/detalhe-imovel.asp?hdnimovel="
+KEY_COLS = ["UF", "Nº do imóvel"]
+
+COMPACT_SELECT = """
+    uf AS "UF",
+    numero_imovel AS "Nº do imóvel",
+    cidade AS "Cidade",
+    bairro AS "Bairro",
+    modalidade AS "Modalidade de venda",
+    preco::float8 AS "Preço_num",
+    valor_avaliacao::float8 AS "Avaliação_num",
+    desconto::float8 AS "Desconto_num",
+    tipo AS "Tipo",
+    area_total::float8 AS "Área total",
+    area_privativa::float8 AS "Área privativa",
+    area_terreno::float8 AS "Área do terreno",
+    quartos AS "Quartos",
+    vagas AS "Vagas",
+    last_seen,
+    source_file
+"""
+
+# Carregados sob demanda, só para as linhas exibidas
+TEXT_SELECT = """
+    uf AS "UF",
+    numero_imovel AS "Nº do imóvel",
+    payload_json->>'Endereço' AS "Endereço",
+    payload_json->>'Preço' AS "Preço",
+    payload_json->>'Valor de avaliação' AS "Valor de avaliação",
+    payload_json->>'Desconto' AS "Desconto"
+"""
+
+CATEGORY_COLS = [
+    "UF",
+    "Cidade",
+    "Bairro",
+    "Modalidade de venda",
+    "Tipo",
+    "last_seen",
+    "source_file",
+]
+SMALLINT_COLS = ["Quartos", "Vagas"]
+
+# Cópia de current_imoveis no formato compacto, gravada pelo ingest_day a cada
+# versão publicada: Arrow IPC sem compressão, aberto com memory map no app.py
+# (cold start sem ler a tabela do Postgres). CURRENT_SNAPSHOT="" desliga.
+SNAPSHOT_PATH = os.getenv("CURRENT_SNAPSHOT", str(Path("data") / "current.arrow"))
+SNAPSHOT_VERSION_KEY = b"ingest_version"
+# Arrow -> dtypes de compact_frame (categorias voltam de dictionary sozinhas)
+ARROW_DTYPES = {
+    pa.int16(): pd.Int16Dtype(),
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+
+def categories_select(source: str) -> str:
+    # valores de cada coluna de CATEGORY_COLS numa passada (um grupo por valor)
+    cols = ", ".join(f'"{c}"' for c in CATEGORY_COLS)
+    sets = ", ".join(f'("{c}")' for c in CATEGORY_COLS)
+    return (
+        f"SELECT {cols} FROM (SELECT {COMPACT_SELECT} FROM {source}) s "
+        f"GROUP BY GROUPING SETS ({sets})"
+    )
+
+
+def fixed_categories(rows: list[tuple]) -> dict[str, pd.Index]:
+    """Categorias de compact_frame a partir das linhas de categories_select,
+    ordenadas como as de astype("category")."""
+    return {
+        col: pd.Index(sorted({r[i] for r in rows if r[i] is not None}), dtype=object)
+        for i, col in enumerate(CATEGORY_COLS)
+    }
+
+
+def compact_frame(
+    df: pd.DataFrame, categories: dict[str, pd.Index] | None = None
+) -> pd.DataFrame:
+    """Converte (no lugar) o resultado de COMPACT_SELECT para os tipos compactos.
+
+    Com `categories` (de fixed_categories), as categorias são essas e não só as
+    que aparecem em `df`: blocos lidos em partes ficam com o mesmo dicionário.
+    """
+    for col in CATEGORY_COLS:
+        if categories is None:
+            df[col] = df[col].astype("category")
+        else:
+            df[col] = pd.Categorical(df[col], categories=categories[col])
+    for col in SMALLINT_COLS:
+        df[col] = df[col].astype("Int16")
+    df["Nº do imóvel"] = df["Nº do imóvel"].astype("string[pyarrow]")
+    return df
+
+
+def write_snapshot(df: pd.DataFrame, version: int | None, path: str | Path) -> int:
+    """Grava `df` (compacto) com a versão do ingest; devolve o tamanho em bytes."""
+    return write_snapshot_batches([df], version, path)[1]
+
+
+def write_snapshot_batches(
+    frames: Iterable[pd.DataFrame], version: int | None, path: str | Path
+) -> tuple[int, int]:
+    """Grava os blocos compactos de `frames`, um record batch por bloco, com a
+    versão do ingest; devolve (linhas, bytes). Sem blocos não grava nada.
+
+    Só um bloco fica em memória. O schema é o do primeiro bloco: todos precisam
+    das mesmas categorias (compact_frame com `categories`), senão o dicionário
+    mudaria no meio do arquivo. Escreve num arquivo temporário e troca no fim:
+    quem já mapeou o arquivo antigo continua lendo o antigo.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    rows, writer, schema = 0, None, None
+    with pa.OSFile(str(tmp), "wb") as sink:
+        for df in frames:
+            if writer is None:
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                meta = dict(schema.metadata or {})
+                meta[SNAPSHOT_VERSION_KEY] = str(version).encode()
+                schema = schema.with_metadata(meta)
+                writer = pa.ipc.new_file(sink, schema)
+            batch = pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+            writer.write_batch(batch)
+            rows += len(df)
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        tmp.unlink()
+        return 0, 0
+    os.replace(tmp, path)
+    return rows, path.stat().st_size
+
+
+def read_snapshot(path: str | Path) -> tuple[pd.DataFrame, int | None] | None:
+    """(DataFrame compacto, versão do ingest) do snapshot; None se não existe.
+
+    Colunas numéricas sem nulos e o Nº do imóvel apontam direto para o
+    arquivo mapeado; só códigos das categorias e inteiros com nulo são copiados.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return None
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    raw = (table.schema.metadata or {}).get(SNAPSHOT_VERSION_KEY, b"None")
+    version = None if raw == b"None" else int(raw)
+    df = table.to_pandas(split_blocks=True, types_mapper=ARROW_DTYPES.get)
+    return df, version
+
+
+def link_de_acesso(numeros: pd.Series) -> pd.Series:
+    # Todos os CSVs da Caixa trazem exatamente LINK_BASE + número do imóvel
+    return LINK_BASE + numeros.astype(str)
+
+
+def with_text(page: pd.DataFrame, text: pd.DataFrame) -> pd.DataFrame:
+    """Página compacta + textos de exibição (de TEXT_SELECT) e link."""
+    keys = page[KEY_COLS].astype(str)
+    out = keys.merge(text, on=KEY_COLS, how="left")
+    out.index = page.index
+    page = page.assign(**{c: out[c] for c in text.columns if c not in KEY_COLS})
+    return page.assign(**{"Link de acesso": link_de_acesso(page["Nº do imóvel"])})
+
+
+def bytes_per_row(df: pd.DataFrame) -> float:
+    return float(df.memory_usage(deep=True).sum()) / max(len(df), 1)
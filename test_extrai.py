@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+import extrai
+
+# Uso: python -m unittest test_extrai
+# download_csv contra um servidor HTTP local que imita /listaweb da Caixa.
+
+BODY = bytes(range(256)) * 800  # 204800 bytes
+
+
+class CaixaStandIn(BaseHTTPRequestHandler):
+    # plan: uma resposta por requisição, na ordem ("ok", "cut", "503", ...)
+    plan: list[str] = []
+    requests_seen: list[str] = []
+
+    def do_GET(self):
+        type(self).requests_seen.append(self.path)
+        step = type(self).plan.pop(0) if type(self).plan else "ok"
+        if step == "503":
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        if step == "cut":
+            # conexão cai no meio do corpo
+            self.wfile.write(BODY[:1000])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadCsvTest(unittest.TestCase):
+    def setUp(self):
+        CaixaStandIn.plan = []
+        CaixaStandIn.requests_seen = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), CaixaStandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out = Path(self.tmp.name) / "UF=AC"
+        # sem espera entre as tentativas
+        patcher = mock.patch.object(extrai, "BACKOFF", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def download(self, **kwargs) -> dict:
+        return extrai.download_csv("AC", self.out, timeout=5, base=self.base, **kwargs)
+
+    def test_ok(self):
+        entry = self.download()
+        self.assertEqual(entry["size"], len(BODY))
+        self.assertEqual(entry["sha256"], hashlib.sha256(BODY).hexdigest())
+        self.assertEqual(Path(entry["path"]).read_bytes(), BODY)
+        self.assertEqual(CaixaStandIn.requests_seen, ["/listaweb/Lista_imoveis_AC.csv"])
+
+    def test_retries_body_cut_mid_transfer(self):
+        CaixaStandIn.plan = ["cut", "cut", "ok"]
+        entry = self.download()
+        self.assertEqual(len(CaixaStandIn.requests_seen), 3)
+        self.assertEqual(Path(entry["path"]).read_bytes(), BODY)
+        self.assertFalse(list(self.out.glob("*.part")))
+
+    def test_retries_retry_status(self):
+        CaixaStandIn.plan = ["503", "ok"]
+        entry = self.download()
+        self.assertEqual(len(CaixaStandIn.requests_seen), 2)
+        self.assertEqual(entry["size"], len(BODY))
+
+    def test_gives_up_without_partial_file(self):
+        CaixaStandIn.plan = ["cut"] * (extrai.MAX_RETRIES + 1)
+        with self.assertRaises(requests.RequestException):
+            self.download()
+        self.assertEqual(len(CaixaStandIn.requests_seen), extrai.MAX_RETRIES + 1)
+        self.assertFalse(list(self.out.glob("*")))
+
+    def test_unchanged_content_points_to_previous(self):
+        first = self.download()
+        entry = self.download(previous=first)
+        self.assertFalse(entry["changed"])
+        self.assertEqual(entry["path"], first["path"])
+
+
+if __name__ == "__main__":
+    unittest.main()
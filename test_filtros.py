@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import itertools
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from filtros import FilterIndex
+
+# Uso: python -m unittest test_filtros
+
+
+def reference_mask(
+    df: pd.DataFrame,
+    mod_sel: list[str],
+    uf_sel: list[str],
+    cidade_sel: list[str],
+    bairro_sel: list[str],
+    preco_min,
+    preco_max,
+    tipo_sel: list[str],
+    quartos_min: int,
+) -> pd.Series:
+    # Os filtros do app.apply_filters (app.py roda a página ao ser importado)
+    mask = pd.Series(True, index=df.index)
+    for col, sel in [
+        ("Tipo", tipo_sel),
+        ("Modalidade de venda", mod_sel),
+        ("UF", uf_sel),
+        ("Cidade", cidade_sel),
+        ("Bairro", bairro_sel),
+    ]:
+        if sel:
+            mask &= df[col].isin(sel)
+    if quartos_min:
+        mask &= df["Quartos"] >= quartos_min
+    if preco_min is not None:
+        mask &= (df["Preço_num"] >= preco_min) & (df["Preço_num"] <= preco_max)
+    return mask
+
+
+class FilterIndexTest(unittest.TestCase):
+    def frame(self, categorical: bool = False) -> pd.DataFrame:
+        rng = np.random.default_rng(7)
+        n = 400
+
+        def pick(values: list, p=None) -> np.ndarray:
+            return rng.choice(np.array(values, dtype=object), n, p=p)
+
+        df = pd.DataFrame(
+            {
+                "Modalidade de venda": pick(
+                    ["Venda Direta Online", "Licitação Aberta", "Leilão SFI", None]
+                ),
+                "UF": pick(["SP", "RJ", "AC", "MG"], p=[0.6, 0.3, 0.05, 0.05]),
+                "Cidade": pick(["SÃO PAULO", "CAMPINAS", "RIO", "", None]),
+                "Bairro": pick(["CENTRO", "ZONA RURAL", "", None, "VILA NOVA"]),
+                "Tipo": pick(["Casa", "Apartamento", "Terreno", None]),
+                "Preço_num": rng.choice(
+                    [np.nan, 50_000.0, 99_999.99, 100_000.0, 1e6], n
+                ),
+                "Quartos": rng.choice([np.nan, 0, 1, 2, 3, 5], n),
+            }
+        )
+        if categorical:
+            cols = ["Modalidade de venda", "UF", "Cidade", "Bairro", "Tipo"]
+            df[cols] = df[cols].astype("category")
+        return df
+
+    def selections(self, df: pd.DataFrame, col: str) -> list[list[str]]:
+        values = sorted(df[col].dropna().unique().tolist())
+        return [
+            [],
+            values[:1],  # um valor (marca só as posições dele)
+            values[1:],  # quase todos (tabela por código)
+            values,  # todos: só exclui os nulos
+            [values[0], "NÃO EXISTE"],
+        ]
+
+    def assert_rows(self, df: pd.DataFrame, idx: FilterIndex, args: tuple):
+        got = idx.rows(*args)
+        got = np.arange(len(df)) if got is None else got
+        expected = df[reference_mask(df, *args)].index.to_numpy()
+        self.assertEqual(got.tolist(), expected.tolist(), args)
+
+    def test_each_filter_alone(self):
+        for categorical in (False, True):
+            df = self.frame(categorical)
+            idx = FilterIndex(df)
+            empty = ([], [], [], [], None, None, [], 0)
+            for pos, col in [
+                (0, "Modalidade de venda"),
+                (1, "UF"),
+                (2, "Cidade"),
+                (3, "Bairro"),
+                (6, "Tipo"),
+            ]:
+                for sel in self.selections(df, col):
+                    args = list(empty)
+                    args[pos] = sel
+                    self.assert_rows(df, idx, tuple(args))
+            for quartos in (0, 1, 3, 6):
+                self.assert_rows(df, idx, (*empty[:7], quartos))
+            for lo, hi in [
+                (0, 1e9),
+                (50_000, 99_999.99),
+                (100_000, 100_000),
+                (2e6, 3e6),
+            ]:
+                self.assert_rows(df, idx, ([], [], [], [], lo, hi, [], 0))
+
+    def test_combined_filters(self):
+        df = self.frame(categorical=True)
+        idx = FilterIndex(df)
+        for mod, uf, cidade, bairro, tipo, quartos, preco in itertools.product(
+            self.selections(df, "Modalidade de venda")[:2],
+            self.selections(df, "UF")[1:3],
+            self.selections(df, "Cidade")[::2],
+            self.selections(df, "Bairro")[:2],
+            self.selections(df, "Tipo")[::3],
+            (0, 2),
+            [(None, None), (60_000, 1e6)],
+        ):
+            args = (mod, uf, cidade, bairro, *preco, tipo, quartos)
+            self.assert_rows(df, idx, args)
+
+    def test_option_counts(self):
+        df = self.frame()
+        idx = FilterIndex(df)
+        for col in ["Modalidade de venda", "UF", "Cidade", "Bairro", "Tipo"]:
+            expected = df[col].value_counts().sort_index()
+            self.assertEqual(idx.option_counts(col), expected.to_dict(), col)
+
+    def test_bairros(self):
+        df = self.frame()
+        idx = FilterIndex(df)
+        valid = df.dropna(subset=["Cidade", "Bairro"])
+        valid = valid[valid["Bairro"].str.strip() != ""]
+        for cidades in ([], ["CAMPINAS"], ["SÃO PAULO", "RIO", "NÃO EXISTE"]):
+            sel = valid[valid["Cidade"].isin(cidades)] if cidades else valid
+            expected = sel["Bairro"].value_counts().sort_index().to_dict()
+            self.assertEqual(idx.bairros(cidades), expected, cidades)
+
+    def test_weighted_facets(self):
+        # facetas do modo SQL: uma linha por grupo com o peso em `n`
+        df = self.frame().assign(n=np.arange(1, 401))
+        idx = FilterIndex(df, weight_col="n")
+        expected = df.groupby("UF")["n"].sum().to_dict()
+        self.assertEqual(idx.option_counts("UF"), expected)
+        valid = df.dropna(subset=["Cidade", "Bairro"])
+        valid = valid[(valid["Bairro"] != "") & (valid["Cidade"] == "RIO")]
+        expected = valid.groupby("Bairro")["n"].sum().to_dict()
+        self.assertEqual(idx.bairros(["RIO"]), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
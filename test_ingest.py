@@ -0,0 +1,550 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+import backfill
+import ingest
+import memoria
+
+# Uso: python -m unittest test_ingest
+# Os testes com banco usam um banco descartável (TEST_DATABASE), criado no mesmo
+# servidor do ingest e apagado a cada teste
+
+TEST_DATABASE = os.getenv("TEST_DATABASE", "leilao_test")
+
+
+class FingerprintFrameTest(unittest.TestCase):
+    # fingerprint_frame tem de dar o mesmo fp que fingerprint_row (o histórico
+    # gravado usa esse) em qualquer coisa que o parse deixe passar
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "Nº do imóvel": ["1", "2", "3", "4", "5", "6"],
+                "Preço": [
+                    "68.692,42",
+                    "  1.234.567,89 ",
+                    np.nan,
+                    "",
+                    "R$ 0,00",
+                    1234.5,
+                ],
+                "Valor de avaliação": ["250.000,00", None, "-", "7", pd.NA, "1e3"],
+                "Desconto": ["72.53", "72,53 ", "0", None, np.nan, 45],
+                "Modalidade de venda": [
+                    "Venda Direta Online",
+                    " Licitação Aberta",
+                    "Leilão SFI - Edital Único\t",
+                    None,
+                    "",
+                    "Venda Online",
+                ],
+                "Cidade": ["SÃO PAULO", "CRUZEIRO DO SUL ", None, "Ñ", "", " "],
+                "Bairro": [" ZONA RURAL ", np.nan, "", "Área\nrural", "CENTRO", None],
+            }
+        )
+
+    def assert_md5_matches_rows(self, df: pd.DataFrame):
+        expected = df.apply(ingest.fingerprint_row, axis=1)
+        got = ingest.fingerprint_frame(df, "md5")
+        self.assertEqual(got.tolist(), expected.tolist())
+        self.assertTrue(got.index.equals(df.index))
+
+    def test_md5_matches_fingerprint_row(self):
+        self.assert_md5_matches_rows(self.frame())
+
+    def test_md5_matches_without_a_hashed_column(self):
+        self.assert_md5_matches_rows(self.frame().drop(columns=["Bairro", "Desconto"]))
+
+    def test_md5_matches_on_a_non_default_index(self):
+        df = self.frame()
+        df.index = [10, 3, 7, 0, 99, 5]
+        self.assert_md5_matches_rows(df)
+
+    def test_fast_values_carry_the_prefix(self):
+        df = self.frame()
+        fast = ingest.fingerprint_frame(df, "fast")
+        self.assertTrue(fast.str.startswith(ingest.FP_FAST_PREFIX).all())
+        self.assertEqual(fast.map(ingest.fingerprint_mode).unique().tolist(), ["fast"])
+        self.assertEqual(fast.nunique(), len(df))
+        self.assertEqual(fast.tolist(), ingest.fingerprint_frame(df, "fast").tolist())
+        md5 = ingest.fingerprint_frame(df, "md5")
+        self.assertEqual(md5.map(ingest.fingerprint_mode).unique().tolist(), ["md5"])
+
+    def test_empty_frame(self):
+        df = self.frame().iloc[:0]
+        self.assertEqual(len(ingest.fingerprint_frame(df, "md5")), 0)
+        self.assertEqual(len(ingest.fingerprint_frame(df, "fast")), 0)
+
+
+# Tabelas que o backend cria (setup_db.js); o ingest cria o resto sozinho
+BASE_DDL = """
+    CREATE TABLE snapshot_imoveis (
+        dt DATE NOT NULL, uf VARCHAR(10), numero_imovel VARCHAR(50),
+        payload_json JSONB, fp VARCHAR(100), source_file TEXT
+    );
+    CREATE TABLE changes (
+        dt DATE NOT NULL, uf VARCHAR(10), tipo_evento VARCHAR(50),
+        numero_imovel VARCHAR(50), changed_fields TEXT,
+        before_json JSONB, after_json JSONB
+    );
+    CREATE TABLE current_imoveis (
+        uf VARCHAR(10), numero_imovel VARCHAR(50), payload_json JSONB,
+        fp VARCHAR(100), last_seen DATE, source_file TEXT,
+        PRIMARY KEY (uf, numero_imovel)
+    );
+"""
+CSV_HEADER = (
+    "N° do imóvel;UF;Cidade;Bairro;Endereço;Preço;Valor de avaliação;Desconto;"
+    "Descrição;Modalidade de venda;Link de acesso"
+)
+CASA = (
+    "Casa, 0.00 de área total, 62.50 de área privativa, 125.00 de área do "
+    "terreno, 2 qto(s), 1 vaga(s)."
+)
+LINK = "https://venda-imoveis.caixa.gov.br/sistema/detalhe-imovel.asp?hdnimovel="
+
+
+def imovel(uf: str, numero: str, preco: str = "100.000,00", **kw) -> dict:
+    return {
+        "numero": numero,
+        "uf": uf,
+        "cidade": kw.get("cidade", "CIDADE"),
+        "bairro": kw.get("bairro", "CENTRO"),
+        "endereco": kw.get("endereco", f"RUA {numero}, N. 1"),
+        "preco": preco,
+        "avaliacao": "150.000,00",
+        "desconto": "33.33",
+        "descricao": kw.get("descricao", CASA),
+        "modalidade": kw.get("modalidade", "Venda Direta Online"),
+    }
+
+
+def write_list(root: Path, dt: str, uf: str, rows: list[dict]) -> Path:
+    # Mesmo formato das listas da Caixa (cp1252, título, cabeçalho, linha vazia)
+    path = root / f"dt={dt}" / f"UF={uf}" / f"Lista_imoveis_{uf}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = ["", " Lista de Imóveis da Caixa;;Data de geração:;01/03/2026;;;;;;;"]
+    lines += [" " + CSV_HEADER, ""]
+    for r in rows:
+        values = [f" {r['numero']} ", *list(r.values())[1:], LINK + r["numero"]]
+        lines.append(";".join(values))
+    path.write_bytes(("\n".join(lines) + "\n").encode("cp1252"))
+    return path
+
+
+class DatabaseTestCase(unittest.TestCase):
+    # Banco descartável (TEST_DATABASE), recriado a cada teste; sem Postgres
+    # (variáveis host/user/password do .env) os testes são pulados
+    @classmethod
+    def setUpClass(cls):
+        if TEST_DATABASE == os.getenv("database", "db_leiloes").replace('"', ""):
+            raise unittest.SkipTest(
+                f"TEST_DATABASE={TEST_DATABASE} é o banco do ingest"
+            )
+        try:
+            admin = ingest.get_db_connection("postgres")
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"sem Postgres: {e}")
+        admin.close()
+        env = mock.patch.dict(os.environ, {"database": TEST_DATABASE})
+        env.start()
+        cls.addClassCleanup(env.stop)
+
+    def setUp(self):
+        self.conn = None
+        self.addCleanup(lambda: self.conn.close())
+        self.reset_database()
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        for patch in (
+            mock.patch.object(ingest, "BASE_DIR", self.root),
+            mock.patch.object(memoria, "SNAPSHOT_PATH", ""),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def reset_database(self):
+        if self.conn is not None:
+            self.conn.close()
+        admin = ingest.get_db_connection("postgres")
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute(f'DROP DATABASE IF EXISTS "{TEST_DATABASE}"')
+            cur.execute(
+                f"CREATE DATABASE \"{TEST_DATABASE}\" ENCODING 'UTF8' "
+                "TEMPLATE template0"
+            )
+        admin.close()
+        self.conn = ingest.get_db_connection()
+        with self.conn.cursor() as cur:
+            cur.execute(BASE_DDL)
+        self.conn.commit()
+
+    DAYS = ["2026-03-01", "2026-03-02", "2026-03-03"]
+
+    def write_days(self):
+        # Três dias seguidos com ENTER, EXIT, UPDATE, UFs idênticas e mudanças
+        # só fora do fp (Endereço, Descrição)
+        ac = [imovel("AC", "100"), imovel("AC", "101")]
+        ap = [imovel("AP", "200")]
+        sp = [imovel("SP", "300"), imovel("SP", "301"), imovel("SP", "302")]
+        rj = [imovel("RJ", "400"), imovel("RJ", "401")]
+        d1, d2, d3 = self.DAYS
+        for uf, rows in {"AC": ac, "AP": ap, "SP": sp, "RJ": rj}.items():
+            write_list(self.root, d1, uf, rows)
+
+        # Dia 2: AC e AP idênticos; SP com UPDATE, EXIT, ENTER e um endereço
+        # novo; RJ com a descrição alterada
+        write_list(self.root, d2, "AC", ac)
+        write_list(self.root, d2, "AP", ap)
+        sp = [
+            imovel("SP", "300", preco="90.000,00"),
+            imovel("SP", "302", endereco="RUA NOVA, N. 2"),
+            imovel("SP", "303"),
+        ]
+        write_list(self.root, d2, "SP", sp)
+        rj = [imovel("RJ", "400", descricao=CASA.replace("2 qto", "3 qto")), rj[1]]
+        write_list(self.root, d2, "RJ", rj)
+
+        # Dia 3: AC muda, AP e SP idênticos, RJ sem lista (todos saem)
+        write_list(self.root, d3, "AC", [imovel("AC", "100", preco="80.000,00")])
+        write_list(self.root, d3, "AP", ap)
+        write_list(self.root, d3, "SP", sp)
+
+    def ingest_all(self, days: list[str], incremental: bool) -> list[dict]:
+        self.reset_database()
+        return [
+            ingest.ingest_day(dt, workers=1, incremental=incremental) for dt in days
+        ]
+
+    def fetch(self, sql: str) -> list[tuple]:
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+            rows = cur.fetchall()
+        self.conn.commit()
+        return rows
+
+    def tables(self) -> dict[str, list[tuple]]:
+        return {
+            "snapshot_imoveis": self.fetch(
+                "SELECT dt, uf, numero_imovel, payload_json::text, fp, source_file "
+                "FROM snapshot_imoveis ORDER BY 1, 2, 3"
+            ),
+            "changes": self.fetch(
+                "SELECT dt, uf, tipo_evento, numero_imovel, changed_fields, "
+                "before_json::text, after_json::text FROM changes ORDER BY 1, 2, 3, 4"
+            ),
+            "current_imoveis": self.fetch(
+                "SELECT uf, numero_imovel, payload_json::text, fp, last_seen, "
+                "source_file FROM current_imoveis ORDER BY 1, 2"
+            ),
+        }
+
+
+class IncrementalIngestTest(DatabaseTestCase):
+    def test_incremental_matches_full_run(self):
+        self.write_days()
+        self.ingest_all(self.DAYS, incremental=False)
+        full = self.tables()
+        summaries = self.ingest_all(self.DAYS, incremental=True)
+        self.assertEqual(
+            [s["carried_ufs"] for s in summaries], [[], ["AC", "AP"], ["AP", "SP"]]
+        )
+        self.assertEqual([s["incremental_off"] for s in summaries], [None] * 3)
+        self.assertTrue(full["changes"])
+        for table, rows in self.tables().items():
+            self.assertEqual(rows, full[table], table)
+
+    def test_payload_only_changes_reach_current(self):
+        # Dia 2: Endereço (SP 302) e Descrição (RJ 400) mudam sem mudar o fp; não
+        # são UPDATE em changes, mas current_imoveis fica com o payload novo
+        # (pelo diff no Postgres do ingest_day e pelo diff em memória do backfill)
+        self.write_days()
+        d1, d2 = self.DAYS[:2]
+        snapshot_sql = (
+            "SELECT uf, numero_imovel, payload_json::text FROM snapshot_imoveis "
+            f"WHERE dt = '{d2}' ORDER BY 1, 2"
+        )
+        for run in ("ingest_day", "backfill"):
+            with self.subTest(run=run):
+                if run == "ingest_day":
+                    refreshed = self.ingest_all([d1, d2], incremental=False)[1]
+                else:
+                    self.reset_database()
+                    refreshed = backfill.backfill([d1, d2], workers=1)["days"][1]
+                self.assertEqual(refreshed["updated"], 1)
+                self.assertEqual(refreshed["refreshed"], 2)
+                current = self.tables()["current_imoveis"]
+                self.assertEqual([r[:3] for r in current], self.fetch(snapshot_sql))
+                typed = self.fetch(
+                    "SELECT quartos FROM current_imoveis WHERE numero_imovel = '400'"
+                )
+                self.assertEqual(typed, [(3,)])
+
+    def test_geral_turns_incremental_off(self):
+        d1, d2 = self.DAYS[:2]
+        ac = [imovel("AC", "100")]
+        for dt in (d1, d2):
+            write_list(self.root, dt, "AC", ac)
+        # Do geral só entra o que falta na lista da própria UF
+        geral = [imovel("AC", "100", preco="1,00"), imovel("RJ", "400")]
+        write_list(self.root, d2, "geral", geral)
+        summaries = self.ingest_all([d1, d2], incremental=True)
+        self.assertEqual(summaries[1]["carried_ufs"], [])
+        self.assertEqual(summaries[1]["incremental_off"], "geral")
+        changes = self.tables()["changes"]
+        self.assertEqual(
+            [r[1:4] for r in changes if r[0].isoformat() == d2],
+            [("RJ", "ENTER", "400")],
+        )
+        current = self.tables()["current_imoveis"]
+        self.assertEqual([r[:2] for r in current], [("AC", "100"), ("RJ", "400")])
+
+    def test_geral_streams_like_a_single_batch(self):
+        # Dia 2 sem a lista do RJ: o geral completa o AC (101 falta no arquivo
+        # do AC; o 100 do arquivo vence) e traz o RJ num lote próprio
+        d1, d2 = self.DAYS[:2]
+        write_list(self.root, d1, "AC", [imovel("AC", "100")])
+        write_list(self.root, d1, "RJ", [imovel("RJ", "400"), imovel("RJ", "401")])
+        write_list(self.root, d2, "AC", [imovel("AC", "100", preco="90.000,00")])
+        geral = [
+            imovel("AC", "100", preco="1,00"),
+            imovel("AC", "101"),
+            imovel("RJ", "400", preco="80.000,00"),
+        ]
+        write_list(self.root, d2, "geral", geral)
+        out = {}
+        for stream in (True, False):
+            with mock.patch.object(ingest, "INGEST_STREAM", stream):
+                summary = self.ingest_all([d1, d2], incremental=False)[1]
+            out[stream] = self.tables()
+            batches = {r.get("uf") for r in summary["stages"] if r["stage"] == "diff"}
+            # (None: o lote único, ou as UFs de ontem que não vieram hoje)
+            self.assertEqual(batches, {"AC", "geral", None} if stream else {None})
+            self.assertEqual(
+                summary["stream_off"], None if stream else "INGEST_STREAM=0"
+            )
+        self.assertEqual(out[True], out[False])
+        self.assertEqual(
+            [r[1:4] for r in out[True]["changes"] if r[0].isoformat() == d2],
+            [
+                ("AC", "ENTER", "101"),
+                ("AC", "UPDATE", "100"),
+                ("RJ", "EXIT", "401"),
+                ("RJ", "UPDATE", "400"),
+            ],
+        )
+
+
+class CopyTextLinesTest(unittest.TestCase):
+    def test_escapes_and_nulls(self):
+        df = pd.DataFrame(
+            {
+                "a": ["C:\\dir", "x\ty", "l1\nl2", "cr\r", None, np.nan],
+                "b": [1, 2.5, None, np.nan, pd.NA, "ok"],
+            }
+        )
+        self.assertEqual(
+            ingest.copy_text_lines(df).tolist(),
+            [
+                "C:\\\\dir\t1",
+                "x\\ty\t2.5",
+                "l1\\nl2\t\\N",
+                "cr\\r\t\\N",
+                "\\N\t\\N",
+                "\\N\tok",
+            ],
+        )
+
+
+class LoadModeTest(DatabaseTestCase):
+    # COPY e execute_values têm de gravar exatamente as mesmas linhas
+    DDL = """
+        CREATE TABLE {table} (
+            dt DATE, uf TEXT, payload_json JSONB, preco NUMERIC, quartos SMALLINT
+        )
+    """
+
+    def frame(self) -> pd.DataFrame:
+        payloads = [
+            {"Endereço": "RUA A\\B, N. 1", "Descrição": "linha 1\nlinha 2"},
+            {"Endereço": "TAB\tAQUI", "Bairro": None},
+            {"Cidade": "SÃO PAULO\r", "Preço": "\\N"},
+        ]
+        return pd.DataFrame(
+            {
+                "dt": ["2026-03-01"] * 5,
+                "uf": ["AC", "C:\\x", None, np.nan, "\\N"],
+                "payload_json": [
+                    *(json.dumps(p, ensure_ascii=False) for p in payloads),
+                    None,
+                    np.nan,
+                ],
+                "preco": [1.5, np.nan, None, 100000.0, 0.0],
+                "quartos": pd.array([2, None, pd.NA, 3, 0], dtype="Int16"),
+            }
+        )
+
+    def load(self, mode: str, chunk_rows: int = ingest.COPY_CHUNK_ROWS):
+        table = f"load_{mode}_{chunk_rows}"
+        df = self.frame()
+        with (
+            self.conn.cursor() as cur,
+            mock.patch.object(ingest, "COPY_CHUNK_ROWS", chunk_rows),
+        ):
+            cur.execute(self.DDL.format(table=table))
+            n = ingest.bulk_insert(cur, table, list(df.columns), df, mode)
+        self.conn.commit()
+        self.assertEqual(n, len(df))
+        return self.fetch(
+            f"SELECT dt, uf, payload_json::text, preco, quartos FROM {table} "
+            "ORDER BY payload_json::text, uf"
+        )
+
+    def test_copy_and_values_write_the_same_rows(self):
+        values = self.load("values")
+        self.assertEqual(self.load("copy"), values)
+        self.assertEqual(self.load("copy", chunk_rows=2), values)
+        # o "\N" literal continua texto; NaN, NA e None viram NULL
+        self.assertEqual(sorted(r[1] for r in values if r[1]), ["AC", "C:\\x", "\\N"])
+        self.assertEqual([r[3] is None for r in values].count(True), 2)
+        self.assertEqual([r[4] is None for r in values].count(True), 2)
+
+    def test_ingest_day_is_the_same_in_both_modes(self):
+        dt = "2026-03-01"
+        write_list(
+            self.root,
+            dt,
+            "SP",
+            [
+                imovel("SP", "300", endereco="RUA A\\B, N. 1"),
+                imovel("SP", "301", bairro="\\N", cidade="TAB\tAQUI"),
+            ],
+        )
+        out = {}
+        for mode in ("copy", "values"):
+            self.reset_database()
+            with mock.patch.object(ingest, "LOAD_MODE", mode):
+                ingest.ingest_day(dt, workers=1)
+            out[mode] = self.tables()
+        self.assertEqual(out["copy"], out["values"])
+
+
+class AsOfTest(DatabaseTestCase):
+    # SNAPSHOT_MODE=delta com checkpoint a cada 3 dias: d1 (primeiro dia), d4
+    # e d6 (depois do buraco em d5) são checkpoints; d2 e d3, deltas
+    def write_more_days(self) -> list[str]:
+        self.write_days()
+        d4, d6 = "2026-03-04", "2026-03-06"
+        sp = [
+            imovel("SP", "300", preco="90.000,00"),
+            imovel("SP", "302", endereco="RUA NOVA, N. 2"),
+            imovel("SP", "303"),
+        ]
+        write_list(self.root, d4, "AC", [imovel("AC", "100", preco="70.000,00")])
+        write_list(self.root, d4, "SP", sp)
+        write_list(self.root, d6, "SP", [*sp, imovel("SP", "304")])
+        return [*self.DAYS, d4, d6]
+
+    def catalog(self, dt: str) -> list[tuple]:
+        with self.conn.cursor() as cur:
+            df = ingest.as_of(cur, dt)
+        self.conn.commit()
+        return sorted(df.itertuples(index=False, name=None))
+
+    def test_as_of_matches_the_full_snapshots(self):
+        days = self.write_more_days()
+        self.ingest_all(days, incremental=False)
+        full = {}
+        for dt in days:
+            full[dt] = self.catalog(dt)
+            rows = self.fetch(
+                f"SELECT count(*) FROM snapshot_imoveis WHERE dt = '{dt}'"
+            )
+            self.assertEqual(len(full[dt]), rows[0][0])
+
+        with (
+            mock.patch.object(ingest, "SNAPSHOT_MODE", "delta"),
+            mock.patch.object(ingest, "SNAPSHOT_CHECKPOINT_DAYS", 3),
+        ):
+            summaries = self.ingest_all(days, incremental=False)
+        self.assertEqual(
+            [s["snapshot"] for s in summaries],
+            ["checkpoint", "delta", "delta", "checkpoint", "checkpoint"],
+        )
+        self.assertEqual(
+            self.fetch("SELECT dt::text FROM snapshot_deltas GROUP BY dt ORDER BY dt"),
+            [(days[1],), (days[2],)],
+        )
+
+        def keys(rows):
+            return [(r[0], r[1], r[2], r[4]) for r in rows]  # dt, chave, fp
+
+        for dt in days:
+            delta = self.catalog(dt)
+            self.assertEqual(keys(delta), keys(full[dt]), dt)
+            if dt not in days[1:3]:
+                self.assertEqual(delta, full[dt], dt)
+
+        # Dia sem ingest: o último dia ingerido antes dele; antes do primeiro, vazio
+        self.assertEqual(self.catalog("2026-03-05"), self.catalog(days[3]))
+        self.assertEqual(self.catalog("2026-02-28"), [])
+        with self.conn.cursor() as cur:
+            self.assertIsNone(ingest.as_of_sql(cur, "2026-02-28"))
+
+    def test_delta_days_keep_non_fp_fields(self):
+        # O delta só grava ENTER/UPDATE/EXIT: mudanças fora do fp (Endereço de
+        # SP 302 em d2) e o source_file do dia só aparecem no próximo checkpoint
+        days = self.write_more_days()
+        with (
+            mock.patch.object(ingest, "SNAPSHOT_MODE", "delta"),
+            mock.patch.object(ingest, "SNAPSHOT_CHECKPOINT_DAYS", 3),
+        ):
+            self.ingest_all(days, incremental=False)
+        d1, d2 = days[:2]
+        by_key = {r[2]: r for r in self.catalog(d2)}
+        self.assertIn("RUA 302, N. 1", by_key["302"][3])
+        self.assertIn(f"dt={d1}", by_key["302"][5])
+        self.assertIn(f"dt={d2}", by_key["300"][5])  # UPDATE: gravado em d2
+        by_key = {r[2]: r for r in self.catalog(days[3])}
+        self.assertIn("RUA NOVA, N. 2", by_key["302"][3])
+
+
+class ListTodayCsvsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        patch = mock.patch.object(ingest, "BASE_DIR", self.root)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def ufs(self, dt: str) -> list[str]:
+        return sorted(ingest.uf_from_path(p) for p in ingest.list_today_csvs(dt))
+
+    def test_geral_is_dropped_when_every_uf_has_its_list(self):
+        dt = "2026-03-01"
+        for uf in ["geral", *ingest.UFS]:
+            write_list(self.root, dt, uf, [imovel("AC", "100")])
+        self.assertEqual(self.ufs(dt), sorted(ingest.UFS))
+
+    def test_geral_is_kept_when_a_uf_is_missing(self):
+        dt = "2026-03-01"
+        for uf in ["geral", *ingest.UFS[1:]]:
+            write_list(self.root, dt, uf, [imovel("AC", "100")])
+        self.assertEqual(self.ufs(dt), sorted(["geral", *ingest.UFS[1:]]))
+
+
+if __name__ == "__main__":
+    unittest.main()